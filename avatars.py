@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 頭像的固定尺寸（正方形邊長）；前端顯示 120px，256 供高解析度螢幕使用
+AVATAR_SIZES = (64, 128, 256)
+DEFAULT_SIZE = 128
+
+# WebP 為主，不支援 WebP 的瀏覽器改用 PNG
+AVATAR_FORMATS = ('webp', 'png')
+
+# 衍生檔與原圖放在同一個資料夾：<名稱>.<尺寸>.<格式>
+AVATAR_SUFFIXES = tuple(f'.{size}.{fmt}' for size in AVATAR_SIZES for fmt in AVATAR_FORMATS)
+
+
+def variant_name(avatar, size, fmt):
+    return f'{os.path.splitext(avatar)[0]}.{size}.{fmt}'
+
+
+def variant_names(avatar):
+    base = os.path.splitext(avatar)[0]
+    return [base + suffix for suffix in AVATAR_SUFFIXES]
+
+
+# 請求的尺寸對應到不小於它的最小固定尺寸，超過最大尺寸時用最大的
+def pick_size(requested):
+    for size in AVATAR_SIZES:
+        if requested <= size:
+            return size
+    return AVATAR_SIZES[-1]
+
+
+# 只讀取檔頭確認是 Pillow 能解碼的圖片，不解碼像素
+def is_image(path):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        return True
+    except Exception:
+        return False
+
+
+def _save(image, target, fmt):
+    tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+    try:
+        if fmt == 'webp':
+            image.save(tmp_path, 'WEBP', quality=85, method=4)
+        else:
+            image.save(tmp_path, 'PNG', optimize=True)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# 解碼一次原圖，依 EXIF 轉正、裁成置中的正方形，再縮成各個尺寸與格式
+def render_variants(folder, avatar):
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(folder, avatar)) as source:
+        # JPEG 可以直接以較低解析度解碼，大照片不必完整展開
+        source.draft('RGB', (AVATAR_SIZES[-1] * 2, AVATAR_SIZES[-1] * 2))
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    square = ImageOps.fit(image, (AVATAR_SIZES[-1],) * 2, method=Image.Resampling.LANCZOS)
+
+    for size in AVATAR_SIZES:
+        scaled = square if size == AVATAR_SIZES[-1] else square.resize((size, size), Image.Resampling.LANCZOS)
+        for fmt in AVATAR_FORMATS:
+            _save(scaled, os.path.join(folder, variant_name(avatar, size, fmt)), fmt)
+
+
+# 頭像衍生檔的背景產生
+#
+# 上傳後在背景執行緒產生；/avatar 請求遇到尚未產生的（例如舊資料）時同步補上。
+# 衍生檔存在即視為快取命中，同一張原圖同時只產生一次。
+class AvatarPipeline:
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def generate(self, folder, avatar, size=DEFAULT_SIZE, fmt=AVATAR_FORMATS[0]):
+        name = variant_name(avatar, pick_size(size), fmt)
+        if not os.path.exists(os.path.join(folder, name)):
+            key = os.path.join(folder, avatar)
+            with self._lock:
+                lock = self._pending.setdefault(key, threading.Lock())
+            with lock:
+                if not os.path.exists(os.path.join(folder, name)):
+                    render_variants(folder, avatar)
+            with self._lock:
+                self._pending.pop(key, None)
+        return name
+
+    def submit(self, folder, avatar):
+        def run():
+            try:
+                self.generate(folder, avatar)
+            except FileNotFoundError:
+                pass  # 產生前頭像已被換掉
+            except Exception as e:
+                logger.error(f"Avatar variants for {avatar} failed: {str(e)}")
+
+        return self._get_executor().submit(run)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
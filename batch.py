@@ -0,0 +1,116 @@
+import json
+import os
+import tarfile
+import zipfile
+
+from streaming_upload import CHUNK_SIZE
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class BatchError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# manifest 格式：[{"text": "開燈", "file": "audio/light.mp3"}, ...]
+def parse_manifest(data):
+    if isinstance(data, (bytes, str)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            raise BatchError("Invalid manifest")
+    if not isinstance(data, list):
+        raise BatchError("Manifest must be a list")
+    entries = []
+    for item in data:
+        if not isinstance(item, dict) or not str(item.get('text', '')).strip() or not item.get('file'):
+            raise BatchError("Manifest entries need 'text' and 'file'")
+        entries.append((str(item['text']).strip(), str(item['file'])))
+    return entries
+
+
+def _stem(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+# 讀取 zip / tar 封存檔，依 manifest（沒有時以檔名當指令文字）逐一產生 (文字, 檔名, 檔案物件)
+#
+# 成員以串流方式讀取，不會整個解壓到磁碟或記憶體。
+def iter_archive(fileobj, filename, max_entries):
+    lower = filename.lower()
+    if lower.endswith('.zip'):
+        archive = zipfile.ZipFile(fileobj)
+        members = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+        open_member = archive.open
+    elif lower.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
+        archive = tarfile.open(fileobj=fileobj, mode='r:*')
+        members = {info.name: info for info in archive.getmembers() if info.isfile()}
+        open_member = archive.extractfile
+    else:
+        raise BatchError("Unsupported archive format")
+
+    with archive:
+        if MANIFEST_NAME in members:
+            with open_member(members.pop(MANIFEST_NAME)) as f:
+                entries = parse_manifest(f.read())
+        else:
+            entries = [(_stem(name), name) for name in sorted(members)]
+
+        if len(entries) > max_entries:
+            raise BatchError(f"Too many commands, limit is {max_entries}", 413)
+
+        for text, name in entries:
+            info = members.get(name)
+            if info is None:
+                yield text, name, None
+                continue
+            with open_member(info) as member:
+                yield text, name, member
+
+
+# 把一個只能寫入的串流包成產生器，讓 zipfile 邊寫邊送出
+class _ChunkBuffer:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+# 匯出整個指令庫為 zip：manifest.json + audio/ 下的原始音檔，格式與匯入相同
+def stream_export(commands, resolve_path):
+    for data in _export_chunks(commands, resolve_path):
+        if data:
+            yield data
+
+
+def _export_chunks(commands, resolve_path):
+    buffer = _ChunkBuffer()
+    manifest = []
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for index, cmd in enumerate(commands):
+            path = resolve_path(cmd['audio'])
+            if path is None or not os.path.exists(path):
+                continue
+            arcname = f"audio/{index:05d}{os.path.splitext(cmd['audio'])[1]}"
+            manifest.append({'text': cmd['text'], 'file': arcname})
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    yield buffer.drain()
+            yield buffer.drain()
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    yield buffer.drain()
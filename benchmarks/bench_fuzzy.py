@@ -0,0 +1,169 @@
+# 模糊比對效能與命中率測試
+#
+# 查詢由指令文字加上同音字替換、標點與前後贅字組成，模擬語音辨識的誤差。
+#
+#   python benchmarks/bench_fuzzy.py --commands 100 1000 10000 --queries 2000
+#
+# 每個指令數都分別量測倒排索引（逐一計算）與 NumPy 矩陣兩條路徑，單一語句與 N-best 批次（--batch 個候選）各一次；
+# 實際使用哪一條由 VECTOR_MIN_COMMANDS 決定。
+#
+# 另外比對 NumPy 矩陣與倒排索引兩條路徑的結果是否完全相同（包含重複字與同分的資料），
+# 有任何差異時以非零狀態結束。
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_matcher import MIN_FUZZY_LENGTH, VECTOR_MIN_COMMANDS, FuzzyMatcher  # noqa: E402
+from matcher import CommandMatcher  # noqa: E402
+from text_normalize import normalize, phonetic_key  # noqa: E402
+from vector_index import KeyVectors, load_numpy  # noqa: E402
+
+# 常用字範圍（CJK 統一表意文字前段）
+CHARS = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+FILLERS = ['請', '幫我', '麻煩', '一下', '吧', '好嗎', '，', '！', '。']
+
+# 少數幾個字組成的指令與語句：字會重複出現，也有大量同分的候選
+SMALL_CHARS = list('播燈打開關音樂大小聲')
+
+
+def homophones():
+    groups = {}
+    for ch in CHARS:
+        groups.setdefault(phonetic_key(ch), []).append(ch)
+    return {ch: [c for c in groups[phonetic_key(ch)] if c != ch] for ch in CHARS}
+
+
+def make_commands(rng, count):
+    return [{'text': ''.join(rng.choice(CHARS) for _ in range(rng.randint(2, 8))), 'audio': f'{i}.mp3'}
+            for i in range(count)]
+
+
+def make_queries(rng, commands, count, same_sound):
+    queries = []
+    for _ in range(count):
+        index = rng.randrange(len(commands))
+        text = list(commands[index]['text'])
+        position = rng.randrange(len(text))
+        if same_sound[text[position]]:
+            text[position] = rng.choice(same_sound[text[position]])
+        query = rng.choice(FILLERS) + ''.join(text) + rng.choice(FILLERS)
+        queries.append((query, index))
+    return queries
+
+
+def make_repeats(rng, count):
+    return [''.join(rng.choice(SMALL_CHARS) for _ in range(rng.randint(2, 5))) for _ in range(count)]
+
+
+# NumPy 矩陣與倒排索引的排序結果（k=1 與 k=4）不同的語句數
+def parity_diffs(commands, queries):
+    vector = FuzzyMatcher(commands)
+    loop = FuzzyMatcher(commands)
+    loop._vectors = None
+    if vector._vectors is None:
+        return None
+    return sum(1 for query in queries for k in (1, 4) if vector.rank(query, k) != loop.rank(query, k))
+
+
+def check_parity(seed, count=1000):
+    rng = random.Random(seed)
+    commands = make_commands(rng, count)
+    datasets = [('random', commands, [query for query, _ in make_queries(rng, commands, count, homophones())]),
+                ('repeated chars', [{'text': text, 'audio': f'{i}.mp3'} for i, text in
+                                    enumerate(make_repeats(rng, count))], make_repeats(rng, count))]
+    failed = False
+    for name, commands, queries in datasets:
+        diffs = parity_diffs(commands, queries)
+        if diffs is None:
+            print('vector parity: numpy not installed, skipped')
+            return True
+        print(f'vector parity ({name}): {diffs} differences in {len(queries)} queries')
+        failed = failed or diffs > 0
+    return not failed
+
+
+# 不論指令數，強制使用其中一條路徑
+def with_path(commands, vector):
+    matcher = FuzzyMatcher(commands)
+    matcher._vectors = None
+    if vector:
+        matcher._vectors = KeyVectors([keys if len(keys) >= MIN_FUZZY_LENGTH else () for keys in matcher._keys])
+    return matcher
+
+
+# 每次呼叫的延遲（微秒）
+def time_calls(calls):
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def summary(samples):
+    return (f'mean {sum(samples) / len(samples):8.1f}us  p50 {percentile(samples, 50):8.1f}us  '
+            f'p99 {percentile(samples, 99):8.1f}us')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=5, help='N-best alternatives per batch')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    same_sound = homophones()
+
+    for count in args.commands:
+        rng = random.Random(args.seed)
+        commands = make_commands(rng, count)
+        queries = make_queries(rng, commands, args.queries, same_sound)
+
+        start = time.perf_counter()
+        fuzzy = FuzzyMatcher(commands)
+        build_ms = (time.perf_counter() - start) * 1000
+        exact = CommandMatcher(commands)
+
+        samples = []
+        exact_hits = fuzzy_hits = 0
+        for query, index in queries:
+            if exact.match_index(query.lower()) == index:
+                exact_hits += 1
+            start = time.perf_counter()
+            ranked = fuzzy.rank(query)
+            samples.append((time.perf_counter() - start) * 1e6)
+            # 同一正規化文字的指令視為同一個答案
+            if ranked and normalize(commands[ranked[0][0]]['text']) == normalize(commands[index]['text']):
+                fuzzy_hits += 1
+
+        print(f'{count} commands, {len(queries)} queries (build {build_ms:.1f}ms)')
+        print(f'  substring hit rate {exact_hits / len(queries):6.1%}   fuzzy hit rate {fuzzy_hits / len(queries):6.1%}')
+        print(f'  fuzzy rank {summary(samples)}  ({"numpy" if fuzzy._vectors is not None else "loop"} path, '
+              f'numpy from {VECTOR_MIN_COMMANDS} commands)')
+
+        texts = [query for query, _ in queries]
+        batches = [texts[i:i + args.batch] for i in range(0, len(texts), args.batch)]
+        paths = [('loop', False)] + ([('numpy', True)] if load_numpy() is not None else [])
+        for name, vector in paths:
+            matcher = with_path(commands, vector)
+            single = time_calls([lambda text=text: matcher.rank(text) for text in texts])
+            batch = time_calls([lambda texts=texts: matcher.rank_many(texts) for texts in batches])
+            print(f'  {name:<5} rank {summary(single)}   rank_many x{args.batch} {summary(batch)}')
+
+    if not check_parity(args.seed):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
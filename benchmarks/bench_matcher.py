@@ -0,0 +1,98 @@
+# 指令比對效能測試：線性掃描 vs. 編譯後的 CommandMatcher
+#
+#   python benchmarks/bench_matcher.py --commands 10000 --queries 2000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import CommandMatcher  # noqa: E402
+
+# 常用中文字，組出接近實際的指令文字
+CHARS = '開關燈音樂播放暫停下一首上一首打開關閉空調電視窗簾溫度調高調低天氣時間鬧鐘提醒我今天明天早安晚安謝謝你好'
+
+
+def random_text(rng, low, high):
+    return ''.join(rng.choice(CHARS) for _ in range(rng.randint(low, high)))
+
+
+def make_commands(rng, count):
+    return [{'text': random_text(rng, 3, 8), 'audio': f'{i}.mp3'} for i in range(count)]
+
+
+def make_queries(rng, commands, count):
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        text = rng.choice(commands)['text'].lower()
+        if kind < 0.4:
+            # 語句中包含指令
+            queries.append(random_text(rng, 0, 4) + text + random_text(rng, 0, 4))
+        elif kind < 0.6:
+            # 語句為指令的一部分
+            start = rng.randint(0, len(text) - 2)
+            queries.append(text[start:start + rng.randint(2, len(text) - start)])
+        else:
+            queries.append(random_text(rng, 6, 14))
+    return queries
+
+
+def linear_match(commands, command):
+    for cmd in commands:
+        if cmd['text'].lower() in command or command in cmd['text'].lower():
+            return cmd
+    return None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(fn, queries):
+    samples = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples, results
+
+
+def report(name, samples):
+    print(f'  {name:<10} mean {sum(samples) / len(samples):9.1f}us  '
+          f'p50 {percentile(samples, 50):9.1f}us  p99 {percentile(samples, 99):9.1f}us')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    for count in args.commands:
+        rng = random.Random(args.seed)
+        commands = make_commands(rng, count)
+        queries = make_queries(rng, commands, args.queries)
+
+        start = time.perf_counter()
+        matcher = CommandMatcher(commands)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        linear_samples, expected = measure(lambda q: linear_match(commands, q), queries)
+        matcher_samples, actual = measure(matcher.match, queries)
+        if expected != actual:
+            raise SystemExit('CommandMatcher result differs from linear scan')
+
+        print(f'{count} commands, {len(queries)} queries (build {build_ms:.1f}ms)')
+        report('linear', linear_samples)
+        report('matcher', matcher_samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# 模糊比對的候選計算：Python 倒排索引迴圈 vs. NumPy 矩陣乘法
+#
+# 也比較原本逐一比對子字串的線性迴圈，以及一次送出多個辨識候選（N-best）時的批次計算。
+#
+#   python benchmarks/bench_vector.py --commands 100 1000 10000 --queries 1000 --alternatives 5
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fuzzy_matcher  # noqa: E402
+from bench_fuzzy import homophones, make_commands, make_queries, percentile  # noqa: E402
+from bench_matcher import linear_match  # noqa: E402
+from fuzzy_matcher import FuzzyMatcher  # noqa: E402
+
+
+def build(commands, vectors):
+    # 以門檻控制是否建立矩陣，同一份指令分別建立兩種比對器
+    original = fuzzy_matcher.VECTOR_MIN_COMMANDS
+    fuzzy_matcher.VECTOR_MIN_COMMANDS = 0 if vectors else len(commands) + 1
+    try:
+        start = time.perf_counter()
+        matcher = FuzzyMatcher(commands)
+        return matcher, (time.perf_counter() - start) * 1000
+    finally:
+        fuzzy_matcher.VECTOR_MIN_COMMANDS = original
+
+
+def measure(fn, batches):
+    samples = []
+    results = []
+    for batch in batches:
+        start = time.perf_counter()
+        results.append(fn(batch))
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples, results
+
+
+def report(name, samples):
+    print(f'  {name:<16} mean {sum(samples) / len(samples):9.1f}us  '
+          f'p50 {percentile(samples, 50):9.1f}us  p99 {percentile(samples, 99):9.1f}us')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--alternatives', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    same_sound = homophones()
+
+    for count in args.commands:
+        rng = random.Random(args.seed)
+        commands = make_commands(rng, count)
+        queries = [query for query, _ in make_queries(rng, commands, args.queries * args.alternatives, same_sound)]
+        batches = [queries[i:i + args.alternatives] for i in range(0, len(queries), args.alternatives)]
+
+        loop, loop_ms = build(commands, vectors=False)
+        vector, vector_ms = build(commands, vectors=True)
+
+        linear_samples, _ = measure(lambda q: linear_match(commands, q[0].lower()), batches)
+        loop_samples, expected = measure(lambda q: loop.rank(q[0]), batches)
+        vector_samples, actual = measure(lambda q: vector.rank(q[0]), batches)
+        if expected != actual:
+            raise SystemExit('Vector candidates changed the ranking')
+        loop_batch, expected = measure(loop.rank_many, batches)
+        vector_batch, actual = measure(vector.rank_many, batches)
+        if expected != actual:
+            raise SystemExit('Vector candidates changed the batch ranking')
+
+        print(f'{count} commands, {len(batches)} queries (build loop {loop_ms:.1f}ms, vector {vector_ms:.1f}ms)')
+        report('substring loop', linear_samples)
+        report('fuzzy loop', loop_samples)
+        report('fuzzy vector', vector_samples)
+        report(f'loop x{args.alternatives}', loop_batch)
+        report(f'vector x{args.alternatives}', vector_batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+# 端對端壓力測試：在暫存資料夾啟動 main:app，建立不同指令數量的使用者，混合送出各種請求
+#
+#   python benchmarks/harness.py --libraries 10 1000 10000 --clients 16 --duration 30 --output run.json
+#   python benchmarks/harness.py --compare run.json --tolerance 0.2
+#
+# 請求組合（--mix，權重）：
+#   voice     語音迴圈：連續送出幾個 /process-command（含多個辨識候選），再停頓一下
+#   library   GET /get-commands
+#   download  下載指令音檔，一半帶 If-None-Match
+#   upload    /add-command 上傳新的音檔
+#
+# 每個使用者的指令以 /import-commands 分批匯入，音檔是各不相同的短 WAV。
+# 預設不讓伺服器找到 ffmpeg，避免背景轉檔與量測搶 CPU（--transcode 可開啟）。
+# 結果依請求種類與指令數量分組，--compare 與先前的 JSON 比較 p95，退步超過容許值時回傳非 0。
+
+import argparse
+import http.client
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_fuzzy import FILLERS, homophones, make_commands  # noqa: E402
+from load_test import ROOT, free_port, multipart, percentile, start_server  # noqa: E402
+
+IMPORT_CHUNK = 2000
+CLIP_RATE = 8000
+
+
+# 每個片段的頻率與長度不同，內容雜湊也就不同，不會被檔案庫去重
+def make_clip(index, seconds=0.1):
+    frequency = 200 + (index * 7919) % 3000
+    frames = int(CLIP_RATE * seconds) + index % 97
+    samples = b''.join(struct.pack('<h', int(8000 * math.sin(2 * math.pi * frequency * i / CLIP_RATE)))
+                       for i in range(frames))
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(CLIP_RATE)
+        f.writeframes(samples)
+    return buffer.getvalue()
+
+
+class Client:
+    def __init__(self, port, cookie=None):
+        self.port = port
+        self.cookie = cookie
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except OSError:
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie and not self.cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response, data
+
+
+def seed_library(port, size, offset, rng):
+    client = Client(port)
+    commands = make_commands(rng, size)
+    for start in range(0, size, IMPORT_CHUNK):
+        chunk = commands[start:start + IMPORT_CHUNK]
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as z:
+            manifest = []
+            for i, cmd in enumerate(chunk, start):
+                name = f'clips/{i}.wav'
+                z.writestr(name, make_clip(offset + i))
+                manifest.append({'text': cmd['text'], 'file': name})
+            z.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False))
+        body, content_type = multipart({}, {'archive': ('library.zip', archive.getvalue())})
+        response, data = client.request('POST', '/import-commands', body, {'Content-Type': content_type})
+        if response.status != 200:
+            raise SystemExit(f'import failed ({response.status}): {data[:200]}')
+    response, data = client.request('GET', '/get-commands')
+    return {'size': size, 'cookie': client.cookie, 'commands': json.loads(data)}
+
+
+def voice_queries(rng, library, same_sound, count):
+    queries = []
+    for _ in range(count):
+        text = list(rng.choice(library['commands'])['text'])
+        roll = rng.random()
+        if roll < 0.3:
+            position = rng.randrange(len(text))
+            if same_sound[text[position]]:
+                text[position] = rng.choice(same_sound[text[position]])
+        elif roll < 0.4:
+            text = list(rng.choice(FILLERS) * 3)  # 沒有對應的指令
+        queries.append(rng.choice(FILLERS) + ''.join(text) + rng.choice(FILLERS))
+    return queries
+
+
+def run_op(op, client, library, rng, state, args):
+    if op == 'voice':
+        for query in voice_queries(rng, library, state['same_sound'], args.burst):
+            alternatives = [{'transcript': query, 'confidence': 0.9}]
+            alternatives += [{'transcript': q, 'confidence': 0.5}
+                             for q in voice_queries(rng, library, state['same_sound'], args.alternatives - 1)]
+            body = json.dumps({'alternatives': alternatives}, ensure_ascii=False).encode('utf-8')
+            yield client.request('POST', '/process-command', body, {'Content-Type': 'application/json'})
+    elif op == 'library':
+        yield client.request('GET', '/get-commands')
+    elif op == 'download':
+        audio = rng.choice(library['commands'])
+        path = '/uploads/' + (audio.get('playback') or audio['audio'])
+        headers = {}
+        if rng.random() < 0.5 and path in state['etags']:
+            headers['If-None-Match'] = state['etags'][path]
+        response, data = client.request('GET', path, headers=headers)
+        if response.getheader('ETag'):
+            state['etags'][path] = response.getheader('ETag')
+        yield response, data
+    elif op == 'upload':
+        with state['lock']:
+            state['uploads'] += 1
+            index = state['uploads']
+        body, content_type = multipart({'text': f'上傳{index}'},
+                                       {'audio': ('clip.wav', make_clip(10 ** 6 + index, seconds=1.0))})
+        yield client.request('POST', '/add-command', body, {'Content-Type': content_type})
+
+
+def worker(port, libraries, mix, state, args, seed, stop, samples):
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    clients = {lib['size']: Client(port, lib['cookie']) for lib in libraries}
+    uploader = Client(port)
+    while not stop.is_set():
+        op = rng.choices(ops, weights)[0]
+        library = rng.choice(libraries)
+        client = uploader if op == 'upload' else clients[library['size']]
+        key = (op, library['size'] if op != 'upload' else 0)
+        try:
+            requests = run_op(op, client, library, rng, state, args)
+            while True:
+                start = time.perf_counter()
+                try:
+                    response, _ = next(requests)
+                except StopIteration:
+                    break
+                elapsed = time.perf_counter() - start
+                ok = response.status in (200, 206, 304)
+                samples.append((key, elapsed, ok))
+        except OSError:
+            samples.append((key, 0.0, False))
+        if op == 'voice' and args.think > 0:
+            stop.wait(args.think / 1000)
+
+
+def summarize(samples, duration):
+    groups = {}
+    for key, elapsed, ok in samples:
+        groups.setdefault(key, []).append((elapsed, ok))
+    results = []
+    for (op, size), items in sorted(groups.items()):
+        latencies = [elapsed for elapsed, ok in items if ok]
+        results.append({
+            'op': op,
+            'commands': size,
+            'requests': len(items),
+            'errors': sum(1 for _, ok in items if not ok),
+            'rps': round(len(latencies) / duration, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        })
+    return results
+
+
+def server_env(transcode):
+    env = {'GC_INTERVAL_HOURS': '0', 'MAX_IMPORT_COMMANDS': str(IMPORT_CHUNK)}
+    if not transcode:
+        ffmpeg = shutil.which('ffmpeg')
+        paths = os.environ.get('PATH', '').split(os.pathsep)
+        env['PATH'] = os.pathsep.join(p for p in paths if not ffmpeg or os.path.dirname(ffmpeg) != p)
+        env['FFMPEG_BINARY'] = ''
+    return env
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    mix = {}
+    for part in args.mix.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+
+    saved = {key: os.environ.get(key) for key in server_env(args.transcode)}
+    os.environ.update(server_env(args.transcode))
+    workdir = tempfile.mkdtemp(prefix='voice-harness-')
+    port = free_port()
+    proc = start_server(args.profile, port, workdir)
+    try:
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        libraries = [seed_library(port, size, sum(args.libraries[:i]), rng) for i, size in enumerate(args.libraries)]
+        seed_seconds = time.perf_counter() - started
+        print(f'seeded {sum(args.libraries)} commands in {seed_seconds:.1f}s')
+
+        state = {'same_sound': homophones(), 'etags': {}, 'uploads': 0, 'lock': threading.Lock()}
+        stop = threading.Event()
+        samples = []
+        threads = [threading.Thread(target=worker, args=(port, libraries, mix, state, args, args.seed + i, stop,
+                                                          samples))
+                   for i in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=130)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'results': summarize(samples, args.duration),
+    }
+
+
+# 與先前的結果比較 p95；回傳退步的項目
+def compare(previous, current, tolerance):
+    before = {(r['op'], r['commands']): r for r in previous['results']}
+    regressions = []
+    for result in current['results']:
+        old = before.get((result['op'], result['commands']))
+        if not old or not old['p95_ms']:
+            continue
+        change = result['p95_ms'] / old['p95_ms'] - 1
+        flag = ' REGRESSION' if change > tolerance else ''
+        print(f"{result['op']:<9} {result['commands']:>6}  p95 {old['p95_ms']:>8} -> {result['p95_ms']:>8} ms "
+              f"({change:+.0%}){flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--libraries', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='one user per library size (number of commands)')
+    parser.add_argument('--mix', default='voice=8,library=1,download=3,upload=1')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--burst', type=int, default=4, help='/process-command requests per voice loop')
+    parser.add_argument('--alternatives', type=int, default=3, help='recognition alternatives per request')
+    parser.add_argument('--think', type=float, default=50.0, help='pause after each voice loop (ms)')
+    parser.add_argument('--profile', default='tuned', choices=['baseline', 'tuned'])
+    parser.add_argument('--transcode', action='store_true', help='let the server find ffmpeg')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='previous JSON results to compare p95 against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 increase for --compare')
+    args = parser.parse_args()
+
+    report = run(args)
+    for result in report['results']:
+        print(f"{result['op']:<9} {result['commands']:>6} cmds  {result['rps']:>8} req/s  "
+              f"p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  "
+              f"errors {result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(previous, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# /process-command 壓力測試：比較原本的單一 sync worker 與 gunicorn.conf.py 設定
+#
+#   python benchmarks/load_test.py --profiles baseline tuned --clients 16 --slow-uploads 2
+#
+# 每個設定都會在暫存資料夾啟動一個 gunicorn，建立一位有指令的使用者，
+# 再以多條執行緒持續送出 /process-command；--slow-uploads 會同時開啟
+# 幾個緩慢傳送的上傳連線，模擬大檔上傳佔住 worker 的情況。
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    # 原本 Procfile / railway.toml 的啟動參數
+    'baseline': ['--workers', '1', '--timeout', '120'],
+    'tuned': ['-c', os.path.join(ROOT, 'gunicorn.conf.py')],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, port, workdir):
+    env = dict(os.environ, PORT=str(port))
+    cmd = [sys.executable, '-m', 'gunicorn', 'main:app', *PROFILES[profile],
+           '--bind', f'127.0.0.1:{port}', '--pythonpath', ROOT, '--log-level', 'warning']
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit(f'{profile}: server did not start')
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+                     + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def seed_user(port, count):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    cookie = None
+    for i in range(count):
+        body, content_type = multipart({'text': f'指令{i}號'}, {'audio': ('clip.mp3', b'ID3' + b'\0' * 1024)})
+        headers = {'Content-Type': content_type}
+        if cookie:
+            headers['Cookie'] = cookie
+        conn.request('POST', '/add-command', body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        cookie = cookie or response.getheader('Set-Cookie').split(';', 1)[0]
+    return cookie
+
+
+def voice_client(port, cookie, stop, samples, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    body = json.dumps({'command': '請執行指令7號'})
+    headers = {'Content-Type': 'application/json', 'Cookie': cookie}
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn.request('POST', '/process-command', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except OSError as e:
+            errors.append(str(e))
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        samples.append(time.perf_counter() - start)
+
+
+# 宣告一個大檔案，但每秒只送出少量資料
+def slow_upload(port, cookie, stop):
+    body, content_type = multipart({'text': 'slow'}, {'audio': ('big.wav', b'\0' * (8 * 1024 * 1024))})
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall((f'POST /add-command HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n'
+                  f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n').encode())
+    offset = 0
+    try:
+        while not stop.is_set() and offset < len(body):
+            sock.sendall(body[offset:offset + 4096])
+            offset += 4096
+            time.sleep(0.1)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def run_profile(profile, args):
+    workdir = tempfile.mkdtemp(prefix=f'voice-{profile}-')
+    port = free_port()
+    proc = start_server(profile, port, workdir)
+    try:
+        cookie = seed_user(port, args.commands)
+        stop = threading.Event()
+        samples, errors = [], []
+        threads = [threading.Thread(target=slow_upload, args=(port, cookie, stop))
+                   for _ in range(args.slow_uploads)]
+        threads += [threading.Thread(target=voice_client, args=(port, cookie, stop, samples, errors))
+                    for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=70)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'profile': profile,
+        'requests': len(samples),
+        'errors': len(errors),
+        'rps': round(len(samples) / args.duration, 1),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', nargs='+', default=['baseline', 'tuned'], choices=sorted(PROFILES))
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--slow-uploads', type=int, default=1)
+    parser.add_argument('--commands', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles:
+        result = run_profile(profile, args)
+        results.append(result)
+        print(f"{profile:<10} {result['rps']:>8} req/s  p50 {result['p50_ms']}ms  "
+              f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  errors {result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# 啟動時間：匯入 main 的時間、gunicorn 啟動到 /health 回覆 200 的時間、第一個 /process-command 的延遲，
+# 以及從啟動到第一個指令比對完成的總時間
+#
+#   python benchmarks/startup.py --runs 5
+#   python benchmarks/startup.py --ref HEAD~1 --output startup.json
+#   python benchmarks/startup.py --no-config     # 不用 gunicorn.conf.py（無 preload）
+#
+# 每次都在新的暫存資料夾、新的行程中量測（沒有既有的資料庫與快取）。
+# 預設使用該版本自己的 gunicorn.conf.py（gthread、preload_app），與正式部署相同，只把 worker 數固定為 1。
+# preload 時 master 在 fork 前會等背景載入結束，所以 /health 的時間包含載入字典的時間。
+# --ref 以 git archive 取出指定的 commit，用同樣的方式量測，方便比較改動前後。
+# /health 一回覆就新增一個指令並送出 /process-command（最差的情況）：比對用的字典若還在背景載入，
+# 這個請求會等它載入完成。
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, free_port, multipart  # noqa: E402
+
+IMPORT_SCRIPT = ('import sys, time; sys.path.insert(0, sys.argv[1]); started = time.perf_counter(); '
+                 'import main; print(time.perf_counter() - started)')
+
+
+def server_env():
+    return dict(os.environ, GC_INTERVAL_HOURS='0', LOG_LEVEL='warning')
+
+
+def measure_import(root):
+    workdir = tempfile.mkdtemp(prefix='startup-')
+    try:
+        result = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, root], cwd=workdir, env=server_env(),
+                                capture_output=True, text=True, check=True)
+        return float(result.stdout.strip().splitlines()[-1]) * 1000
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+    finally:
+        conn.close()
+
+
+# 從啟動 gunicorn（單一 worker）到 /health 回覆 200，再量第一個語音指令請求
+def measure_server(root, use_config=True, timeout=60):
+    workdir = tempfile.mkdtemp(prefix='startup-')
+    port = free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', 'main:app', '--workers', '1', '--bind', f'127.0.0.1:{port}',
+           '--pythonpath', root, '--log-level', 'warning']
+    config = os.path.join(root, 'gunicorn.conf.py')
+    if use_config and os.path.exists(config):
+        cmd += ['-c', config]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=workdir, env=server_env(), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                response, _ = request(port, 'GET', '/health')
+                if response.status == 200:
+                    break
+            except OSError:
+                pass
+            if time.time() > deadline or proc.poll() is not None:
+                raise SystemExit(f'{root}: server did not start')
+            time.sleep(0.01)
+        health_ms = (time.perf_counter() - started) * 1000
+
+        body, content_type = multipart({'text': '開燈'}, {'audio': ('clip.mp3', b'ID3' + b'\0' * 1024)})
+        response, _ = request(port, 'POST', '/add-command', body, {'Content-Type': content_type})
+        cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+        command_started = time.perf_counter()
+        response, data = request(port, 'POST', '/process-command', json.dumps({'command': '請幫我開燈'}),
+                                 {'Content-Type': 'application/json', 'Cookie': cookie})
+        finished = time.perf_counter()
+        if response.status != 200 or not json.loads(data).get('match'):
+            raise SystemExit(f'{root}: /process-command failed: {data[:200]!r}')
+        return health_ms, (finished - command_started) * 1000, (finished - started) * 1000
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure(root, runs, use_config=True):
+    imports = [measure_import(root) for _ in range(runs)]
+    servers = [measure_server(root, use_config) for _ in range(runs)]
+    return {
+        'import_ms': round(statistics.median(imports), 1),
+        'health_ms': round(statistics.median(s[0] for s in servers), 1),
+        'first_command_ms': round(statistics.median(s[1] for s in servers), 1),
+        'first_match_ms': round(statistics.median(s[2] for s in servers), 1),
+        'runs': runs,
+        'config': 'gunicorn.conf.py' if use_config and os.path.exists(os.path.join(root, 'gunicorn.conf.py')) else None,
+    }
+
+
+def extract(ref):
+    folder = tempfile.mkdtemp(prefix='startup-ref-')
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', folder], input=archive, check=True)
+    return folder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement (median)')
+    parser.add_argument('--ref', help='also measure this git commit, e.g. HEAD~1')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--no-config', action='store_true',
+                        help='run plain "gunicorn main:app" instead of the deployed gunicorn.conf.py')
+    args = parser.parse_args()
+
+    trees = [('current', ROOT)]
+    if args.ref:
+        trees.append((args.ref, extract(args.ref)))
+    report = {'python': sys.version.split()[0], 'results': {}}
+    try:
+        for name, root in trees:
+            result = measure(root, args.runs, not args.no_config)
+            report['results'][name] = result
+            print(f"{name:<10} import {result['import_ms']}ms  /health {result['health_ms']}ms  "
+                  f"first /process-command {result['first_command_ms']}ms  "
+                  f"start to first match {result['first_match_ms']}ms")
+    finally:
+        for name, root in trees[1:]:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from avatars import AVATAR_SUFFIXES
+from peaks import FAILED_SUFFIX, PEAKS_SUFFIX
+from streaming_upload import CHUNK_SIZE, copy_stream
+
+_BLOB_NAME = re.compile(r'^[0-9a-f]{64}(?:\.play)?\.[a-z0-9]+$')
+
+# 由檔案內容衍生的附屬檔（例如波形 <sha256>.peaks 與失敗標記、頭像 <sha256>.128.webp）
+#
+# 只以雜湊命名，同一內容的不同副檔名（<sha256>.wav 與 <sha256>.mp3）共用同一份，
+# 最後一個同雜湊的檔案刪除時才一起刪除。
+SIDECAR_SUFFIXES = (PEAKS_SUFFIX, FAILED_SUFFIX) + AVATAR_SUFFIXES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    name TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    touched REAL
+);
+"""
+
+# 舊索引缺少的欄位；touched 為最後一次新增參照的時間，清理時略過最近異動的檔案
+COLUMNS = [
+    ('touched', 'REAL'),
+]
+
+
+def is_blob_name(name):
+    return bool(_BLOB_NAME.match(name or ''))
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# 內容定址的共用檔案庫：uploads/blobs/<前兩碼>/<sha256>.<副檔名>
+#
+# 相同內容的音檔與頭像只存一份，以參照計數記錄有幾筆資料使用它，
+# 計數歸零時才刪除實體檔案。計數存在 blobs/index.db，與指令的儲存後端無關。
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_folder = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_folder, exist_ok=True)
+        self._db_path = os.path.join(root, 'index.db')
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        existing = [row[1] for row in conn.execute('PRAGMA table_info(blobs)')]
+        for column, definition in COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE blobs ADD COLUMN {column} {definition}')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # 就緒檢查：索引可以查詢、暫存資料夾可寫入
+    def ping(self):
+        self._connection().execute('SELECT 1').fetchone()
+        if not os.access(self.tmp_folder, os.W_OK):
+            raise OSError(f"{self.tmp_folder} is not writable")
+
+    def folder(self, name):
+        return os.path.join(self.root, name[:2])
+
+    def path(self, name):
+        return os.path.join(self.folder(name), name)
+
+    def exists(self, name):
+        return is_blob_name(name) and os.path.exists(self.path(name))
+
+    def temp_path(self, extension):
+        return os.path.join(self.tmp_folder, uuid.uuid4().hex + '.' + extension)
+
+    # 邊接收邊計算 SHA-256，寫完後放入檔案庫並回傳檔名
+    def ingest_stream(self, stream, extension, limit, check_head=False):
+        hasher = hashlib.sha256()
+        tmp_path = self.temp_path(extension)
+        try:
+            with open(tmp_path, 'wb') as f:
+                size = copy_stream(stream, f, limit, extension=extension if check_head else None, hasher=hasher)
+            if size == 0:
+                return None
+            return self.add_file(tmp_path, extension, hasher.hexdigest())
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # 將暫存檔移入檔案庫並增加參照；內容已存在時直接丟棄暫存檔
+    def add_file(self, source_path, extension, digest=None):
+        name = (digest or hash_file(source_path)) + '.' + extension
+        size = os.path.getsize(source_path)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            target = self.path(name)
+            if os.path.exists(target):
+                os.remove(source_path)
+            else:
+                os.makedirs(self.folder(name), exist_ok=True)
+                os.replace(source_path, target)
+            conn.execute('INSERT INTO blobs (name, refcount, size, touched) VALUES (?, 1, ?, ?) '
+                         'ON CONFLICT(name) DO UPDATE SET refcount = refcount + 1, touched = excluded.touched',
+                         (name, size, time.time()))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return name
+
+    def incref(self, name):
+        size = os.path.getsize(self.path(name))
+        self._connection().execute(
+            'INSERT INTO blobs (name, refcount, size, touched) VALUES (?, 1, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET refcount = refcount + 1, touched = excluded.touched',
+            (name, size, time.time()))
+
+    # 減少參照，歸零時刪除檔案；回傳是否已刪除
+    def decref(self, name):
+        if not is_blob_name(name):
+            return False
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE name = ?', (name,))
+            row = conn.execute('SELECT refcount FROM blobs WHERE name = ?', (name,)).fetchone()
+            removed = row is not None and row[0] <= 0
+            if removed:
+                conn.execute('DELETE FROM blobs WHERE name = ?', (name,))
+                self._remove_files(conn, name)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return removed
+
+    def _remove_files(self, conn, name):
+        path = self.path(name)
+        targets = [path]
+        stem = os.path.splitext(name)[0]
+        others = conn.execute('SELECT name FROM blobs WHERE name GLOB ?', (stem + '.*',))
+        if not any(os.path.splitext(other)[0] == stem for other, in others):
+            base = os.path.splitext(path)[0]
+            targets.extend(base + suffix for suffix in SIDECAR_SUFFIXES)
+        for target in targets:
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+
+    # 清理用：{檔名: (參照數, 大小, 最後新增參照的時間)}
+    def entries(self):
+        rows = self._connection().execute('SELECT name, refcount, size, COALESCE(touched, 0) FROM blobs')
+        return {name: (refcount, size, touched) for name, refcount, size, touched in rows}
+
+    # 以實際的參照數修正計數；cutoff 之後新增過參照的不修改，避免與進行中的上傳競爭
+    def set_refcount(self, name, refcount, cutoff):
+        return self._connection().execute(
+            'UPDATE blobs SET refcount = ? WHERE name = ? AND COALESCE(touched, 0) < ?',
+            (refcount, name, cutoff)).rowcount > 0
+
+    # 刪除沒有任何參照的檔案（條件同上）；回傳是否已刪除
+    def remove_unreferenced(self, name, cutoff):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = conn.execute('DELETE FROM blobs WHERE name = ? AND COALESCE(touched, 0) < ?',
+                                   (name, cutoff)).rowcount > 0
+            if removed:
+                self._remove_files(conn, name)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return removed
+
+    def refcount(self, name):
+        row = self._connection().execute('SELECT refcount FROM blobs WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        count, total, refs = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount), 0) FROM blobs').fetchone()
+        return {'blobs': count, 'bytes': total, 'references': refs}
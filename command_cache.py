@@ -0,0 +1,115 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+from fuzzy_matcher import FuzzyMatcher
+from matcher import CommandMatcher
+
+
+# 快取項目：解析後的指令清單，比對器與模糊比對器在第一次需要時才建立
+class CacheEntry:
+    __slots__ = ('signature', 'commands', '_matcher', '_fuzzy')
+
+    def __init__(self, signature, commands):
+        self.signature = signature
+        self.commands = commands
+        self._matcher = None
+        self._fuzzy = None
+
+    @property
+    def matcher(self):
+        if self._matcher is None:
+            self._matcher = CommandMatcher(self.commands)
+        return self._matcher
+
+    @property
+    def fuzzy(self):
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyMatcher(self.commands)
+        return self._fuzzy
+
+
+# 依使用者分組的 LRU 指令快取
+#
+# 快取以 (儲存層簽章, 本地版本號) 作為簽章：
+# - 儲存層簽章：JSON 檔的 mtime/大小，或 SQLite 的 commands_version，
+#   其他行程寫入後下次讀取自動失效
+# - 同一行程內的寫入路由會呼叫 invalidate()，換上新的本地版本號
+#
+# 版本號取自整個快取共用的遞增計數器，不會重複出現；被淘汰的使用者連同版本號一起刪除，
+# 之後讀到的版本號是 0，與先前任何快取項目都不相同，最多多讀一次儲存層。
+class CommandCache:
+    def __init__(self, store, max_users=256):
+        self.store = store
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _signature(self, user_id):
+        signature = self.store.commands_signature(user_id)
+        if signature is None:
+            return None
+        with self._lock:
+            return (signature, self._versions.get(user_id, 0))
+
+    def _store(self, user_id, entry):
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            evicted, _ = self._entries.popitem(last=False)
+            self._versions.pop(evicted, None)
+            self.evictions += 1
+
+    # 取得快取項目；使用者沒有指令資料時回傳 None
+    def get(self, user_id):
+        signature = self._signature(user_id)
+        if signature is None:
+            with self._lock:
+                self._entries.pop(user_id, None)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        commands = self.store.get_commands(user_id)
+        if commands is None:
+            return None
+        entry = CacheEntry(signature, commands)
+        with self._lock:
+            self._store(user_id, entry)
+        return entry
+
+    def get_commands(self, user_id):
+        entry = self.get(user_id)
+        return entry.commands if entry is not None else None
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = next(self._counter)
+            self._versions.move_to_end(user_id)
+            self._entries.pop(user_id, None)
+            # 只寫入、沒有再讀取的使用者不會被淘汰，版本號另外限制數量
+            while len(self._versions) > self.max_users:
+                self._versions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_users,
+            }
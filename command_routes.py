@@ -0,0 +1,680 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, session, stream_with_context, url_for
+
+from batch import BatchError, iter_archive, parse_manifest, stream_export
+from blobstore import is_blob_name
+from metrics import MATCH_SECONDS, timed
+from recognition import RecognitionError
+from services import (RECOGNITION_CONTENT_TYPES, RECOGNITION_EXTENSIONS, allowed_audio_file, blobs,
+                      command_cache, get_user_folder, recognizer, release_file, store, transcoder, waveforms)
+from streaming_upload import UploadError, UploadSessions, copy_stream
+from transcode import playback_name
+
+logger = logging.getLogger(__name__)
+
+# 指令的新增、刪除、匯入匯出與比對（含語音指令通道與伺服器端辨識）
+bp = Blueprint('commands', __name__)
+
+# 單次請求最多比對的辨識候選數
+MAX_ALTERNATIVES = 10
+
+# 每次比對最多回傳的候選指令數（top_k 的上限）
+MAX_TOP_K = 10
+
+# 新增指令後排入背景轉檔，完成時記錄播放用的衍生檔
+#
+# 衍生檔同樣存在檔案庫，每筆設定了 playback 的指令持有一個參照；
+# 相同內容已經轉過檔時直接沿用。波形在轉檔工作中一起產生；沒有 ffmpeg 時改由背景執行緒產生
+# （只有 WAV 可以解碼）。完成的回呼在轉檔的執行緒中執行，沒有 app context，
+# 所以先取出目前 app 的服務，不經由代理存取。
+def schedule_transcode(user_id, audio):
+    services = current_app.extensions['assistant']
+
+    def on_done(playback):
+        services.blobs.incref(playback)
+        if services.store.set_playback(user_id, audio, playback):
+            services.command_cache.invalidate(user_id)
+        else:
+            services.blobs.decref(playback)
+
+    if not transcoder.enabled:
+        waveforms.submit(blobs.folder(audio), audio)
+        return
+    derived = playback_name(audio)
+    if blobs.exists(derived):
+        try:
+            on_done(derived)
+            return
+        except FileNotFoundError:
+            pass
+    transcoder.submit(blobs.folder(audio), audio, on_done)
+
+def playback_audio(cmd):
+    return cmd.get('playback') or cmd['audio']
+
+def command_files(cmd):
+    return [cmd['audio']] + ([cmd['playback']] if cmd.get('playback') else [])
+
+# 新增指令；寫入失敗時釋放剛存入檔案庫的參照，避免留下沒有指令引用的檔案
+def register_command(text, audio):
+    try:
+        store.add_command(session['user_id'], text, audio)
+    except Exception:
+        blobs.decref(audio)
+        raise
+    command_cache.invalidate(session['user_id'])
+    schedule_transcode(session['user_id'], audio)
+
+# 批次匯入：逐一寫入檔案庫，最後以一次交易新增所有指令
+def import_commands(entries):
+    items, errors = [], []
+    for text, name, fileobj in entries:
+        if fileobj is None:
+            errors.append({"file": name, "error": "File not found"})
+            continue
+        if not allowed_audio_file(name):
+            errors.append({"file": name, "error": "Invalid audio format"})
+            continue
+        try:
+            audio = blobs.ingest_stream(fileobj, name.rsplit('.', 1)[1].lower(),
+                                        current_app.config['MAX_UPLOAD_SIZE'], check_head=True)
+        except UploadError as e:
+            errors.append({"file": name, "error": e.message})
+            continue
+        if audio is None:
+            errors.append({"file": name, "error": "Empty file"})
+            continue
+        items.append((text, audio))
+    
+    if items:
+        try:
+            store.add_commands(session['user_id'], items)
+        except Exception:
+            for _, audio in items:
+                blobs.decref(audio)
+            raise
+        command_cache.invalidate(session['user_id'])
+        for _, audio in items:
+            schedule_transcode(session['user_id'], audio)
+    return items, errors
+
+def resolve_audio_path(user_folder, name):
+    if is_blob_name(name):
+        return blobs.path(name)
+    return os.path.join(user_folder, name)
+
+@bp.route('/get-commands')
+def get_commands():
+    try:
+        get_user_folder()
+        commands = command_cache.get_commands(session['user_id'])
+        return jsonify(commands if commands is not None else [])
+    except Exception as e:
+        logger.error(f"Get commands failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/add-command', methods=['POST'])
+def add_command():
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file"}), 400
+        
+        audio_file = request.files['audio']
+        text = request.form.get('text', '').strip()
+        
+        if not text:
+            return jsonify({"error": "No command text"}), 400
+        
+        if not audio_file or not audio_file.filename:
+            return jsonify({"error": "No audio file selected"}), 400
+        
+        if not allowed_audio_file(audio_file.filename):
+            return jsonify({"error": "Invalid audio format"}), 400
+        
+        get_user_folder()
+        extension = audio_file.filename.rsplit('.', 1)[1].lower()
+        audio = blobs.ingest_stream(audio_file.stream, extension, current_app.config['MAX_UPLOAD_SIZE'])
+        if audio is None:
+            return jsonify({"error": "No audio file selected"}), 400
+        register_command(text, audio)
+        
+        return jsonify({"message": "Command added successfully"})
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Add command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def get_upload_sessions():
+    return UploadSessions(get_user_folder(), current_app.config['MAX_UPLOAD_SIZE'])
+
+# 單次串流上傳：請求本體即為音檔內容，邊接收邊寫入磁碟
+@bp.route('/add-command-stream', methods=['POST'])
+def add_command_stream():
+    try:
+        text = request.args.get('text', '').strip()
+        filename = request.args.get('filename', '')
+        if not text:
+            return jsonify({"error": "No command text"}), 400
+        if not allowed_audio_file(filename):
+            return jsonify({"error": "Invalid audio format"}), 400
+        if request.content_length and request.content_length > current_app.config['MAX_UPLOAD_SIZE']:
+            return jsonify({"error": "File too large"}), 413
+        
+        extension = filename.rsplit('.', 1)[1].lower()
+        get_user_folder()
+        audio = blobs.ingest_stream(request.stream, extension, current_app.config['MAX_UPLOAD_SIZE'], check_head=True)
+        if audio is None:
+            return jsonify({"error": "No audio file selected"}), 400
+        register_command(text, audio)
+        
+        return jsonify({"message": "Command added successfully", "audio": audio})
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Streaming add command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 可續傳的分段上傳
+@bp.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    try:
+        data = request.get_json()
+        if not data or not data.get('filename'):
+            return jsonify({"error": "No audio file selected"}), 400
+        if not allowed_audio_file(data['filename']):
+            return jsonify({"error": "Invalid audio format"}), 400
+        
+        extension = data['filename'].rsplit('.', 1)[1].lower()
+        meta = get_upload_sessions().create(data['filename'], data.get('size'), extension)
+        return jsonify(meta), 201
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Create upload session failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/upload-sessions/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_session(upload_id):
+    try:
+        sessions = get_upload_sessions()
+        if request.method == 'GET':
+            return jsonify(sessions.get(upload_id))
+        if request.method == 'DELETE':
+            sessions.get(upload_id)
+            sessions.discard(upload_id)
+            return jsonify({"message": "Upload cancelled"})
+        
+        offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+        if offset is None or not offset.isdigit():
+            return jsonify({"error": "Missing upload offset"}), 400
+        return jsonify(sessions.append(upload_id, int(offset), request.stream))
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Upload chunk failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/upload-sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    try:
+        data = request.get_json() or {}
+        text = data.get('text', '').strip()
+        if not text:
+            return jsonify({"error": "No command text"}), 400
+        
+        sessions = get_upload_sessions()
+        meta, part_path = sessions.finish(upload_id)
+        audio = blobs.add_file(part_path, meta['extension'])
+        register_command(text, audio)
+        sessions.discard(upload_id)
+        
+        return jsonify({"message": "Command added successfully", "audio": audio})
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Complete upload failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 批次匯入：archive 欄位上傳 zip/tar（內含 manifest.json），
+# 或以多個 audio 欄位上傳檔案，搭配 manifest（JSON）或同樣數量的 text 欄位
+@bp.route('/import-commands', methods=['POST'])
+def import_commands_route():
+    try:
+        get_user_folder()
+        limit = current_app.config['MAX_IMPORT_COMMANDS']
+        
+        if 'archive' in request.files:
+            archive = request.files['archive']
+            items, errors = import_commands(iter_archive(archive.stream, archive.filename or '', limit))
+        else:
+            files = [f for f in request.files.getlist('audio') if f and f.filename]
+            if not files:
+                return jsonify({"error": "No audio file"}), 400
+            if len(files) > limit:
+                return jsonify({"error": f"Too many commands, limit is {limit}"}), 413
+            
+            by_name = {f.filename: f for f in files}
+            if request.form.get('manifest'):
+                entries = [(text, name, by_name[name].stream if name in by_name else None)
+                           for text, name in parse_manifest(request.form['manifest'])]
+            else:
+                texts = [t.strip() for t in request.form.getlist('text')]
+                if len(texts) != len(files) or not all(texts):
+                    return jsonify({"error": "Each audio file needs a command text"}), 400
+                entries = [(text, f.filename, f.stream) for text, f in zip(texts, files)]
+            items, errors = import_commands(entries)
+        
+        status = 200 if items or not errors else 400
+        return jsonify({"imported": len(items), "errors": errors}), status
+    except (BatchError, UploadError) as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Import commands failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 批次刪除：一次交易刪除多筆指令
+@bp.route('/delete-commands', methods=['POST'])
+def delete_commands():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('texts'), list) or not data['texts']:
+            return jsonify({"error": "No command text provided"}), 400
+        
+        texts = [str(text).lower().strip() for text in data['texts']]
+        user_folder = get_user_folder()
+        removed = store.delete_commands(session['user_id'], texts)
+        if removed:
+            command_cache.invalidate(session['user_id'])
+        for cmd in removed:
+            for name in command_files(cmd):
+                release_file(user_folder, name)
+        
+        remaining = [cmd['text'].lower() for cmd in removed]
+        not_found = []
+        for text in texts:
+            if text in remaining:
+                remaining.remove(text)
+            else:
+                not_found.append(text)
+        return jsonify({"deleted": len(removed), "not_found": not_found})
+    except Exception as e:
+        logger.error(f"Delete commands failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 匯出整個指令庫（zip 串流，可直接再匯入）
+@bp.route('/export-commands')
+def export_commands():
+    try:
+        user_folder = get_user_folder()
+        commands = command_cache.get_commands(session['user_id']) or []
+        chunks = stream_export(list(commands), lambda name: resolve_audio_path(user_folder, name))
+        return Response(stream_with_context(chunks), mimetype='application/zip', headers={
+            'Content-Disposition': 'attachment; filename="commands.zip"',
+            'Cache-Control': 'no-store',
+        })
+    except Exception as e:
+        logger.error(f"Export commands failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 辨識結果：{"command": "..."} 或 Web Speech API 的多個候選
+# {"alternatives": [{"transcript": "...", "confidence": 0.9}, ...]}，依辨識器的排序
+def parse_transcripts(data):
+    items = data.get('alternatives')
+    if not isinstance(items, list) or not items:
+        items = [{'transcript': data.get('command') or data.get('transcript')}]
+    transcripts = []
+    for item in items[:MAX_ALTERNATIVES]:
+        if isinstance(item, str):
+            item = {'transcript': item}
+        if not isinstance(item, dict) or not isinstance(item.get('transcript'), str):
+            continue
+        text = item['transcript'].lower().strip()
+        try:
+            recognition = float(item.get('confidence') or 0)
+        except (TypeError, ValueError):
+            recognition = 0.0
+        if text:
+            transcripts.append((text, recognition))
+    return transcripts
+
+# 請求的 top_k：沒有給時用預設值，限制在 1..MAX_TOP_K；不是整數（含 null）時回傳 None
+def parse_top_k(data):
+    value = data.get('top_k', current_app.config['FUZZY_TOP_K'])
+    if isinstance(value, bool):
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return min(max(value, 1), MAX_TOP_K)
+
+# 一次比對所有候選：先做原本的子字串比對，沒有命中再用模糊比對（同音字、標點、繁簡）
+#
+# 比對信心最高者勝出；相同時取辨識信心較高、排序較前的候選。
+@timed(MATCH_SECONDS, 'transcripts')
+def match_transcripts(entry, transcripts, top_k):
+    texts = [text for text, _ in transcripts]
+    ranked = entry.fuzzy.rank_many(texts, top_k + 1, current_app.config['FUZZY_THRESHOLD'])
+    
+    best = None
+    scores = {}
+    for order, ((text, recognition), results) in enumerate(zip(transcripts, ranked)):
+        exact = entry.matcher.match_index(text)
+        if exact is not None:
+            results = [(exact, 1.0)] + results
+        for index, score in results:
+            scores[index] = max(scores.get(index, 0.0), score)
+            key = (score, recognition, -order)
+            if best is None or key > best[0]:
+                best = (key, index, text)
+    
+    if best is None:
+        cmd, confidence, transcript = None, 0.0, None
+    else:
+        (confidence, _, _), index, transcript = best
+        cmd = entry.commands[index]
+        scores.pop(index)
+    
+    others = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k - 1]
+    alternatives = [{"command": entry.commands[index]['text'], "confidence": score} for index, score in others]
+    return cmd, confidence, transcript, alternatives
+
+@bp.route('/process-command', methods=['POST'])
+def process_command():
+    try:
+        data = request.get_json()
+        if not data or ('command' not in data and 'alternatives' not in data):
+            return jsonify({"error": "No command text"}), 400
+        
+        transcripts = parse_transcripts(data)
+        if not transcripts:
+            return jsonify({"error": "No command text"}), 400
+        top_k = parse_top_k(data)
+        if top_k is None:
+            return jsonify({"error": "top_k must be an integer"}), 400
+        get_user_folder()
+        
+        entry = command_cache.get(session['user_id'])
+        if entry is None:
+            return jsonify({"match": False, "message": "No commands available"})
+        
+        cmd, confidence, transcript, alternatives = match_transcripts(entry, transcripts, top_k)
+        if cmd is not None:
+            return jsonify({
+                "match": True,
+                "command": cmd['text'],
+                "audio": playback_audio(cmd),
+                "confidence": confidence,
+                "transcript": transcript,
+                "alternatives": alternatives
+            })
+        
+        return jsonify({"match": False, "message": "No matching command found", "alternatives": alternatives})
+    except Exception as e:
+        logger.error(f"Process command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 伺服器端語音辨識：multipart 的 audio 欄位，或直接以音訊作為請求內容（可分塊傳送）
+# 辨識結果直接送進指令比對，回應格式與 /process-command 相同，另附辨識文字
+@bp.route('/recognize-command', methods=['POST'])
+def recognize_command():
+    path = None
+    try:
+        get_user_folder()
+        if 'audio' in request.files:
+            filename = request.files['audio'].filename or ''
+            extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else None
+            stream = request.files['audio'].stream
+        else:
+            extension = RECOGNITION_CONTENT_TYPES.get(request.mimetype)
+            stream = request.stream
+        if extension not in RECOGNITION_EXTENSIONS:
+            return jsonify({"error": "Invalid audio format"}), 400
+        
+        path = blobs.temp_path(extension)
+        with open(path, 'wb') as f:
+            size = copy_stream(stream, f, current_app.config['RECOGNITION_MAX_BYTES'], extension=extension)
+        if size == 0:
+            return jsonify({"error": "Empty audio"}), 400
+        
+        started = time.perf_counter()
+        transcript = recognizer.recognize(path).lower()
+        recognition_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        entry = command_cache.get(session['user_id'])
+        if not transcript or entry is None:
+            return jsonify({"match": False, "transcript": transcript, "recognition_ms": recognition_ms,
+                            "message": "No matching command found"})
+        
+        cmd, confidence, _, alternatives = match_transcripts(entry, [(transcript, 1.0)],
+                                                             current_app.config['FUZZY_TOP_K'])
+        if cmd is not None:
+            return jsonify({
+                "match": True,
+                "command": cmd['text'],
+                "audio": playback_audio(cmd),
+                "confidence": confidence,
+                "transcript": transcript,
+                "alternatives": alternatives,
+                "recognition_ms": recognition_ms
+            })
+        return jsonify({"match": False, "transcript": transcript, "alternatives": alternatives,
+                        "recognition_ms": recognition_ms, "message": "No matching command found"})
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except RecognitionError as e:
+        response = jsonify({"error": e.message})
+        if e.status == 503:
+            response.headers['Retry-After'] = '1'
+        return response, e.status
+    except Exception as e:
+        logger.error(f"Recognize command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def match_event(utterance, cmd, confidence, transcript, final, started, alternatives=None):
+    audio = playback_audio(cmd)
+    return {
+        "type": "match",
+        "utterance": utterance,
+        "final": final,
+        "command": cmd['text'],
+        "audio": audio,
+        "url": url_for('media.uploaded_file', filename=audio),
+        "confidence": confidence,
+        "transcript": transcript,
+        "alternatives": alternatives or [],
+        "server_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+# 持續的語音指令通道：連線時驗證一次 session，之後只在每段語句開始時檢查快取
+#
+# 用戶端訊息：
+#   {"type": "partial", "utterance": "1-0", "transcript": "請幫我開"}
+#   {"type": "final", "utterance": "1-0", "transcript": "...", "alternatives": [...]}
+# 部分結果一旦包含某個指令就立即推送 match，同一段語句之後的訊息不再比對；
+# 最終結果使用與 /process-command 相同的比對（含模糊比對與多個候選）。
+def command_socket(ws):
+    slots = current_app.extensions['assistant'].socket_slots
+    if slots is not None and not slots.acquire(blocking=False):
+        logger.warning("Too many command sockets, connection refused")
+        ws.send(json.dumps({"type": "error", "error": "Too many connections"}))
+        return
+    try:
+        serve_command_socket(ws)
+    finally:
+        if slots is not None:
+            slots.release()
+
+def serve_command_socket(ws):
+    user_id = session.get('user_id')
+    if not user_id:
+        ws.send(json.dumps({"type": "error", "error": "No session"}))
+        return
+    
+    entry = command_cache.get(user_id)
+    ws.send(json.dumps({"type": "ready", "commands": len(entry.commands) if entry else 0}))
+    
+    current, matched = None, False
+    while True:
+        raw = ws.receive(timeout=current_app.config['WS_IDLE_TIMEOUT'])
+        if raw is None:
+            break
+        started = time.perf_counter()
+        try:
+            message = json.loads(raw)
+            kind = message.get('type')
+        except (ValueError, AttributeError):
+            ws.send(json.dumps({"type": "error", "error": "Invalid message"}))
+            continue
+        
+        if kind == 'ping':
+            ws.send(json.dumps({"type": "pong"}))
+            continue
+        if kind not in ('partial', 'final'):
+            ws.send(json.dumps({"type": "error", "error": "Unknown message type"}))
+            continue
+        
+        utterance = message.get('utterance')
+        if utterance != current:
+            # 新的一段語句：確認指令沒有在其他分頁或 worker 被修改
+            current, matched = utterance, False
+            entry = command_cache.get(user_id)
+        if matched:
+            continue
+        if entry is None:
+            if kind == 'final':
+                ws.send(json.dumps({"type": "no_match", "utterance": utterance}))
+            continue
+        
+        try:
+            if kind == 'partial':
+                text = str(message.get('transcript') or '').lower().strip()
+                with MATCH_SECONDS.time('contained'):
+                    cmd = entry.matcher.match_contained(text) if text else None
+                if cmd is not None:
+                    matched = True
+                    ws.send(json.dumps(match_event(utterance, cmd, 1.0, text, False, started)))
+                continue
+            
+            transcripts = parse_transcripts(message)
+            cmd = None
+            if transcripts:
+                cmd, confidence, transcript, alternatives = match_transcripts(
+                    entry, transcripts, current_app.config['FUZZY_TOP_K'])
+            if cmd is not None:
+                matched = True
+                ws.send(json.dumps(match_event(utterance, cmd, confidence, transcript, True, started,
+                                               alternatives)))
+            else:
+                ws.send(json.dumps({"type": "no_match", "utterance": utterance}))
+        except Exception as e:
+            logger.error(f"Command socket failed: {str(e)}")
+            ws.send(json.dumps({"type": "error", "utterance": utterance, "error": str(e)}))
+
+@bp.route('/delete-command', methods=['POST'])
+def delete_command():
+    try:
+        data = request.get_json()
+        if not data or 'text' not in data:
+            return jsonify({"error": "No command text provided"}), 400
+        
+        command_text = data['text'].lower().strip()
+        user_folder = get_user_folder()
+        
+        # 刪除第一個相同文字的指令
+        cmd = store.delete_command(session['user_id'], command_text)
+        if cmd is None:
+            return jsonify({"error": "Command not found"}), 404
+        command_cache.invalidate(session['user_id'])
+        
+        # 釋放關聯的音頻文件（含轉檔後的播放檔）
+        for name in command_files(cmd):
+            release_file(user_folder, name)
+        
+        return jsonify({"message": "Command deleted successfully"})
+    except Exception as e:
+        logger.error(f"Delete command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+# 舊版前端（基礎拷貝4）的指令介面：以 id 辨識指令，欄位為 fileName／audioUrl
+#
+# id 由指令文字與音檔名稱推得，不另外儲存；同一個指令重新整理後 id 不變。
+def legacy_id(cmd):
+    return hashlib.sha256(f"{cmd['text']}\0{cmd['audio']}".encode('utf-8')).hexdigest()[:16]
+
+def legacy_command(cmd):
+    audio = playback_audio(cmd)
+    return {
+        "id": legacy_id(cmd),
+        "text": cmd['text'],
+        "fileName": audio,
+        "audioUrl": url_for('media.uploaded_file', filename=audio)
+    }
+
+@bp.route('/upload-command', methods=['POST'])
+def upload_command():
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file"}), 400
+        
+        audio_file = request.files['audio']
+        text = (request.form.get('command') or request.form.get('text') or '').strip()
+        if not audio_file or not audio_file.filename or not text:
+            return jsonify({"error": "Audio file and command text are required"}), 400
+        if not allowed_audio_file(audio_file.filename):
+            return jsonify({"error": "Invalid audio format"}), 400
+        
+        get_user_folder()
+        extension = audio_file.filename.rsplit('.', 1)[1].lower()
+        audio = blobs.ingest_stream(audio_file.stream, extension, current_app.config['MAX_UPLOAD_SIZE'])
+        if audio is None:
+            return jsonify({"error": "No audio file selected"}), 400
+        register_command(text, audio)
+        
+        return jsonify({"success": True, "command": legacy_command({'text': text, 'audio': audio})})
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:
+        logger.error(f"Upload command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/list-commands')
+def list_commands():
+    try:
+        get_user_folder()
+        commands = command_cache.get_commands(session['user_id']) or []
+        return jsonify([legacy_command(cmd) for cmd in commands])
+    except Exception as e:
+        logger.error(f"List commands failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/delete-command/<command_id>', methods=['DELETE'])
+def delete_command_by_id(command_id):
+    try:
+        user_folder = get_user_folder()
+        commands = command_cache.get_commands(session['user_id']) or []
+        target = next((cmd for cmd in commands if legacy_id(cmd) == command_id), None)
+        if target is None:
+            return jsonify({"error": "Command not found"}), 404
+        
+        cmd = store.delete_command(session['user_id'], target['text'], audio=target['audio'])
+        if cmd is None:
+            return jsonify({"error": "Command not found"}), 404
+        command_cache.invalidate(session['user_id'])
+        for name in command_files(cmd):
+            release_file(user_folder, name)
+        
+        return jsonify({"success": True, "message": "Command deleted successfully"})
+    except Exception as e:
+        logger.error(f"Delete command failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,333 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+
+from avatars import variant_names
+from blobstore import SIDECAR_SUFFIXES, is_blob_name
+from peaks import peaks_names
+from storage import COMMANDS_FILENAME, SETTINGS_FILENAME
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只允許單一行程執行清理
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = '.gc.lock'
+STAMP_FILENAME = '.gc-last'
+
+# 背景執行緒多久檢查一次是否該執行清理（秒）
+CHECK_INTERVAL = 600
+
+# 報告中最多列出的檔案數，總數與位元組數不受限制
+REPORT_LIMIT = 1000
+
+_USER_ID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+# 暫存與鎖定檔一律不動：點開頭的檔案、上傳中的 .partial、.lock
+def _skipped(name):
+    return name.startswith('.') or name.endswith('.partial') or name.endswith('.lock')
+
+
+def _sidecars(name):
+    return peaks_names(name) + variant_names(name)
+
+
+# 限制每秒的檔案系統操作數，清理時不與線上請求搶 I/O
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+# 清理沒有任何資料參照的上傳檔，並（選擇性）讓長期沒有活動的使用者過期
+#
+# 1. 使用者：只有設定 expire_after（秒）時才執行。儲存層記錄的最後活動時間早於 expire_after、
+#    也沒有任何有效 session 指向的，刪除資料與資料夾。沒有活動紀錄的使用者（例如從舊版遷移的）
+#    從這次清理開始計算，不會立即刪除；資料夾不存在的使用者一律略過。
+# 2. 檔案庫：依指令與設定重新計算參照數，修正計數、刪除沒有參照的檔案，
+#    以及不在索引中的檔案、原檔已不存在的附屬檔（.peaks、.peaks.failed、頭像尺寸）與殘留的暫存檔。
+# 3. 使用者資料夾、uploads 根目錄（舊版單一使用者的資料）與 static/images/avatar_*
+#    中沒有被參照的舊版檔案。
+#
+# 寬限期內建立或新增參照的檔案一律保留，避免刪到上傳到一半、尚未寫入指令的檔案。
+class Compactor:
+    def __init__(self, upload_folder, static_images, store, blobs, sessions=None, cache=None,
+                 legacy_settings=(), extensions=(), grace=86400, rate=200, interval=86400, expire_after=None):
+        self.upload_folder = upload_folder
+        self.static_images = static_images
+        self.store = store
+        self.blobs = blobs
+        self.sessions = sessions
+        self.cache = cache
+        self.legacy_settings = list(legacy_settings)
+        self.extensions = set(extensions) | {'peaks', 'failed', 'tmp'}
+        self.grace = grace
+        self.rate = rate
+        self.interval = interval
+        self.expire_after = expire_after
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # 在每個 worker 內啟動一次排程執行緒（fork 後的子行程不會繼承執行緒）
+    def start(self):
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='compactor', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(min(CHECK_INTERVAL, self.interval))
+            try:
+                self.run_scheduled()
+            except Exception as e:
+                logger.error(f"Scheduled cleanup failed: {str(e)}")
+
+    # 多個 worker 共用鎖定檔與上次執行時間，同一段期間只有一個行程執行
+    def run_scheduled(self):
+        if fcntl is None:
+            return None
+        fd = os.open(os.path.join(self.upload_folder, LOCK_FILENAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            stamp = os.path.join(self.upload_folder, STAMP_FILENAME)
+            try:
+                last = os.path.getmtime(stamp)
+            except FileNotFoundError:
+                last = 0
+            if time.time() - last < self.interval:
+                return None
+            report = self.run()
+            with open(stamp, 'w', encoding='utf-8') as f:
+                json.dump({k: v for k, v in report.items() if k != 'deleted'}, f)
+            return report
+        finally:
+            os.close(fd)
+
+    def run(self, dry_run=False, grace=None):
+        started = time.time()
+        cutoff = started - (self.grace if grace is None else grace)
+        limiter = RateLimiter(self.rate)
+        report = {'dry_run': dry_run, 'started': started, 'expired_users': [], 'refcount_fixes': 0,
+                  'deleted_files': 0, 'freed_bytes': 0, 'deleted': []}
+
+        def remove(path, size, reason):
+            report['deleted_files'] += 1
+            report['freed_bytes'] += size
+            if len(report['deleted']) < REPORT_LIMIT:
+                report['deleted'].append({'path': os.path.relpath(path, self.upload_folder), 'bytes': size,
+                                          'reason': reason})
+            if not dry_run:
+                limiter.wait()
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        def old_files(folder):
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                limiter.wait()
+                if _skipped(entry.name) or not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime < cutoff:
+                    yield entry, stat.st_size
+
+        expired = self._expire_users(dry_run, limiter, report)
+        blob_refs, legacy_refs, static_refs = self._references(expired)
+        self._collect_blobs(blob_refs, cutoff, dry_run, limiter, report, remove, old_files)
+
+        # 使用者資料夾中舊版的音檔與頭像
+        for user_id, refs in legacy_refs.items():
+            keep = {COMMANDS_FILENAME, SETTINGS_FILENAME}
+            keep.update(refs)
+            keep.update(name for ref in refs for name in _sidecars(ref))
+            for entry, size in old_files(os.path.join(self.upload_folder, user_id)):
+                if entry.name not in keep:
+                    remove(entry.path, size, 'unreferenced')
+
+        # uploads 根目錄與 uploads/avatars：舊版單一使用者的檔案
+        root_refs = self._legacy_references()
+        keep = root_refs | static_refs
+        keep |= {name for ref in set(keep) for name in _sidecars(ref)}
+        for folder in (self.upload_folder, os.path.join(self.upload_folder, 'avatars')):
+            for entry, size in old_files(folder):
+                extension = entry.name.rsplit('.', 1)[-1].lower() if '.' in entry.name else ''
+                if entry.name not in keep and extension in self.extensions:
+                    remove(entry.path, size, 'legacy')
+
+        # static/images 中舊版上傳的頭像
+        for entry, size in old_files(self.static_images):
+            if entry.name.startswith('avatar_') and entry.name not in keep:
+                remove(entry.path, size, 'avatar')
+
+        report['elapsed_ms'] = round((time.time() - started) * 1000, 1)
+        logger.info(f"Cleanup {'dry run' if dry_run else 'finished'}: {len(report['expired_users'])} users expired, "
+                    f"{report['deleted_files']} files ({report['freed_bytes']} bytes), "
+                    f"{report['refcount_fixes']} refcounts fixed in {report['elapsed_ms']}ms")
+        return report
+
+    def _user_folders(self):
+        try:
+            return [entry.name for entry in os.scandir(self.upload_folder)
+                    if entry.is_dir(follow_symlinks=False) and _USER_ID.match(entry.name)]
+        except FileNotFoundError:
+            return []
+
+    def _expire_users(self, dry_run, limiter, report):
+        if self.expire_after is None:
+            return set()
+        now = time.time()
+        cutoff = now - self.expire_after
+        active = self.sessions.user_ids(now) if self.sessions is not None else set()
+        activity = self.store.activity()
+        expired = set()
+        for user_id in sorted((set(self.store.user_ids()) | set(self._user_folders())) - active):
+            limiter.wait()
+            folder = os.path.join(self.upload_folder, user_id)
+            if not os.path.isdir(folder):
+                continue
+            last = activity.get(user_id)
+            if last is None:
+                if not dry_run:
+                    self.store.touch_user(user_id, now)
+                continue
+            if last >= cutoff:
+                continue
+            expired.add(user_id)
+            report['expired_users'].append(user_id)
+            for root, dirs, files in os.walk(folder):
+                for name in files:
+                    limiter.wait()
+                    report['freed_bytes'] += os.path.getsize(os.path.join(root, name))
+            if dry_run:
+                continue
+            self.store.delete_user(user_id)
+            if self.cache is not None:
+                self.cache.invalidate(user_id)
+            shutil.rmtree(folder, ignore_errors=True)
+        return expired
+
+    # 目前所有指令與設定引用的檔案
+    def _references(self, expired):
+        blob_refs = Counter()
+        legacy_refs = {user_id: set() for user_id in self._user_folders() if user_id not in expired}
+        static_refs = set()
+        for user_id in self.store.user_ids():
+            if user_id in expired:
+                continue
+            names = []
+            for cmd in self.store.get_commands(user_id) or []:
+                names.append(cmd.get('audio'))
+                names.append(cmd.get('playback'))
+            avatar = (self.store.get_settings(user_id) or {}).get('avatar')
+            names.append(avatar)
+            for name in filter(None, names):
+                if is_blob_name(name):
+                    blob_refs[name] += 1
+                else:
+                    legacy_refs.setdefault(user_id, set()).add(name)
+            if avatar and not is_blob_name(avatar):
+                static_refs.add(avatar)
+        return blob_refs, legacy_refs, static_refs
+
+    # uploads/commands.json、uploads/settings.json 與專案根目錄 settings.json 中的舊版檔名
+    def _legacy_references(self):
+        refs = set()
+        paths = [os.path.join(self.upload_folder, COMMANDS_FILENAME),
+                 os.path.join(self.upload_folder, SETTINGS_FILENAME)] + self.legacy_settings
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for item in data if isinstance(data, list) else [data]:
+                if not isinstance(item, dict):
+                    continue
+                for key in ('audio', 'playback', 'fileName', 'avatar', 'avatar_url'):
+                    if isinstance(item.get(key), str) and item[key]:
+                        refs.add(os.path.basename(item[key]))
+        return refs
+
+    def _collect_blobs(self, blob_refs, cutoff, dry_run, limiter, report, remove, old_files):
+        entries = self.blobs.entries()
+        for name, (refcount, size, touched) in entries.items():
+            if touched >= cutoff:
+                continue
+            expected = blob_refs.get(name, 0)
+            if expected == 0:
+                limiter.wait()
+                if dry_run or self.blobs.remove_unreferenced(name, cutoff):
+                    report['deleted_files'] += 1
+                    report['freed_bytes'] += size
+                    if len(report['deleted']) < REPORT_LIMIT:
+                        report['deleted'].append({'path': os.path.relpath(self.blobs.path(name), self.upload_folder),
+                                                  'bytes': size, 'reason': 'unreferenced'})
+            elif expected != refcount:
+                if dry_run or self.blobs.set_refcount(name, expected, cutoff):
+                    report['refcount_fixes'] += 1
+
+        # 磁碟上不在索引中的檔案，以及原檔已不存在的附屬檔
+        stems = {os.path.splitext(name)[0] for name in entries}
+        for shard in sorted(os.listdir(self.blobs.root)):
+            folder = os.path.join(self.blobs.root, shard)
+            if len(shard) != 2 or not os.path.isdir(folder):
+                continue
+            for entry, size in old_files(folder):
+                if is_blob_name(entry.name) and entry.name in entries:
+                    continue
+                suffix = next((s for s in SIDECAR_SUFFIXES if entry.name.endswith(s)), None)
+                if suffix is not None and entry.name[:-len(suffix)] in stems:
+                    continue
+                remove(entry.path, size, 'orphan')
+
+        for entry, size in old_files(self.blobs.tmp_folder):
+            remove(entry.path, size, 'tmp')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Remove unreferenced uploads and expired users')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    parser.add_argument('--grace-hours', type=float, default=None,
+                        help='keep files touched within this many hours (default GC_GRACE_HOURS)')
+    parser.add_argument('--expire-users-days', type=float, default=None,
+                        help='also expire users inactive for this many days (default GC_EXPIRE_USERS_DAYS, unset = off)')
+    args = parser.parse_args()
+
+    from main import app
+    compactor = app.extensions['assistant'].compactor
+    if args.expire_users_days is not None:
+        compactor.expire_after = args.expire_users_days * 86400
+
+    grace = args.grace_hours * 3600 if args.grace_hours is not None else None
+    print(json.dumps(compactor.run(dry_run=args.dry_run, grace=grace), ensure_ascii=False, indent=2))
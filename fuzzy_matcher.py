@@ -0,0 +1,152 @@
+from collections import Counter
+
+from text_normalize import normalize, phonetic_keys
+from vector_index import KeyVectors, load_numpy
+
+DEFAULT_THRESHOLD = 0.6
+
+# 同音但不同字時的信心上限，讓字面完全相同的指令排在前面
+PHONETIC_WEIGHT = 0.9
+
+# 單字指令太容易誤判，只參與精確比對
+MIN_FUZZY_LENGTH = 2
+MAX_QUERY_LENGTH = 64
+
+# 指令數達到此數量時改用 NumPy 矩陣計算共同鍵數量；指令較少時倒排索引只走訪少數項目，
+# 矩陣運算的固定成本反而較慢（benchmarks/bench_fuzzy.py：100 個指令時約 50us 對 95us）
+VECTOR_MIN_COMMANDS = 256
+
+# 信心四捨五入到小數 4 位；與第 k 名同分（四捨五入後）的候選仍要計算，才能依指令順序決定名次
+TIE_TOLERANCE = 0.00005
+
+
+# 指令 pattern 在語句 text 中的最小編輯距離（語句前後多出的字不計成本）
+#
+# 逐列計算，整列最小值超過 bound 時提前結束並回傳 None。
+def bounded_distance(pattern, text, bound):
+    prev = [0] * (len(text) + 1)
+    for i, p in enumerate(pattern, 1):
+        cur = [i]
+        row_min = i
+        for j, t in enumerate(text, 1):
+            value = prev[j - 1] if p == t else prev[j - 1] + 1
+            if prev[j] + 1 < value:
+                value = prev[j] + 1
+            if cur[j - 1] + 1 < value:
+                value = cur[j - 1] + 1
+            cur.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > bound:
+            return None
+        prev = cur
+    distance = min(prev)
+    return distance if distance <= bound else None
+
+
+# 模糊比對器：容忍同音字、模糊音、標點與繁簡差異，回傳依信心排序的候選指令
+#
+# 以拼音鍵建立倒排索引。共同鍵的數量除以指令長度是信心的上限，
+# 候選依上限由高到低計算編輯距離，上限低於目前第 k 名時即停止。
+class FuzzyMatcher:
+    def __init__(self, commands):
+        self.commands = list(commands)
+        self._texts = []
+        self._keys = []
+        self._index = {}
+        for index, cmd in enumerate(self.commands):
+            text = normalize(cmd['text'])
+            keys = phonetic_keys(text)
+            self._texts.append(text)
+            self._keys.append(keys)
+            if len(keys) < MIN_FUZZY_LENGTH:
+                continue
+            for key, count in Counter(keys).items():
+                self._index.setdefault(key, []).append((index, count))
+
+        self._vectors = None
+        if len(self.commands) >= VECTOR_MIN_COMMANDS and load_numpy() is not None:
+            self._vectors = KeyVectors([keys if len(keys) >= MIN_FUZZY_LENGTH else ()
+                                        for keys in self._keys])
+
+    def __len__(self):
+        return len(self.commands)
+
+    def _score(self, index, query, query_keys, shared, floor):
+        length = len(self._keys[index])
+        phonetic = 0.0
+        if PHONETIC_WEIGHT * shared / length >= floor:
+            distance = bounded_distance(self._keys[index], query_keys, int(length * (1 - floor / PHONETIC_WEIGHT)))
+            if distance is not None:
+                phonetic = PHONETIC_WEIGHT * (1 - distance / length)
+
+        # 字面分數只有在可能超過拼音分數時才計算
+        floor = max(floor, phonetic)
+        text = self._texts[index]
+        if sum(1 for ch in text if ch in query) / length >= floor:
+            distance = bounded_distance(text, query, int(length * (1 - floor)))
+            if distance is not None:
+                return max(phonetic, 1 - distance / length)
+        return phonetic
+
+    # 候選清單 [(信心上限, 指令索引, 共同鍵數量), ...]，依上限由高到低
+    def _candidates(self, query_keys, threshold):
+        shared = {}
+        for key, count in Counter(query_keys).items():
+            for index, command_count in self._index.get(key, ()):
+                shared[index] = shared.get(index, 0) + min(count, command_count)
+
+        keys = self._keys
+        candidates = [(count / len(keys[index]), index, count) for index, count in shared.items()
+                      if count >= threshold * len(keys[index])]
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        return candidates
+
+    # 同上，以矩陣一次計算多個語句
+    def _vector_candidates(self, queries, threshold):
+        np = load_numpy()
+        counts = self._vectors.shared_counts(queries)
+        ratios = counts / self._vectors.lengths
+        results = []
+        for row_counts, row_ratios in zip(counts, ratios):
+            indexes = np.flatnonzero((row_counts > 0) & (row_ratios >= threshold))
+            order = indexes[np.lexsort((indexes, -row_ratios[indexes]))]
+            results.append(list(zip(row_ratios[order].tolist(), order.tolist(), row_counts[order].tolist())))
+        return results
+
+    # 回傳 [(指令索引, 信心), ...]，信心由高到低，相同時依指令順序
+    def rank(self, text, k=3, threshold=DEFAULT_THRESHOLD):
+        return self.rank_many([text], k, threshold)[0]
+
+    # 一次比對多個語句（例如辨識的多個候選結果），每個語句各自回傳排序結果
+    def rank_many(self, texts, k=3, threshold=DEFAULT_THRESHOLD):
+        queries = [normalize(text)[:MAX_QUERY_LENGTH] for text in texts]
+        query_keys = [phonetic_keys(query) for query in queries]
+        if k <= 0:
+            return [[] for _ in queries]
+
+        if self._vectors is not None:
+            candidates = self._vector_candidates(query_keys, threshold)
+        else:
+            candidates = [self._candidates(keys, threshold) for keys in query_keys]
+        return [self._rank(query, keys, found, k, threshold) if query else []
+                for query, keys, found in zip(queries, query_keys, candidates)]
+
+    def _rank(self, query, query_keys, candidates, k, threshold):
+        results = []
+        for bound, index, count in candidates:
+            full = len(results) >= k
+            floor = results[-1][1] if full else threshold
+            # 名單已滿時，與第 k 名同分的候選也要計算：結果依指令順序排列，不依走訪順序
+            low = floor - TIE_TOLERANCE if full else floor
+            if bound < low:
+                break
+            score = round(self._score(index, query, query_keys, count, low), 4)
+            if score >= floor and score > 0:
+                results.append((index, score))
+                results.sort(key=lambda item: (-item[1], item[0]))
+                del results[k:]
+        return results
+
+    def search(self, text, k=3, threshold=DEFAULT_THRESHOLD):
+        return [(self.commands[index], score) for index, score in self.rank(text, k, threshold)]
@@ -0,0 +1,45 @@
+# Gunicorn 設定：python -m gunicorn main:app -c gunicorn.conf.py
+#
+# 預設使用 gthread worker：每個 worker 有多條執行緒，慢速的上傳或下載
+# 只佔用一條執行緒，不會擋住其他使用者的 /process-command。
+# 安裝 gevent 後可設定 GUNICORN_WORKER_CLASS=gevent 改用協程 worker。
+
+import os
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_cpus = cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5003')}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# 容器常會看到主機的所有 CPU，用 GUNICORN_MAX_WORKERS 設定上限以控制記憶體
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             min(_cpus * 2 + 1, int(os.environ.get('GUNICORN_MAX_WORKERS', 8)))))
+threads = int(os.environ.get('GUNICORN_THREADS', max(4, _cpus * 2)))
+
+# /ws/commands 在 gthread worker 中整段連線（最長 WS_IDLE_TIMEOUT 秒）佔用一條執行緒；
+# 每個 worker 最多讓一半的執行緒處理 WebSocket，其餘連線被拒絕後前端改用 POST /process-command。
+# 協程 worker（gevent）沒有這個限制，需要大量同時連線時請改用 GUNICORN_WORKER_CLASS=gevent。
+if worker_class == 'gthread':
+    os.environ.setdefault('WS_MAX_CONNECTIONS', str(max(1, threads // 2)))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# 在 master 載入應用後再 fork，所有 worker 共用同一把 session 金鑰、
+# 只做一次資料遷移；SQLite 連線會在各 worker 內重新建立
+preload_app = True
+
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+
+from flask import current_app, send_from_directory
+from werkzeug.security import safe_join
+
+from metrics import FILE_SEND_SECONDS, timed
+
+# 內容定址或 UUID 命名的檔案（與其衍生的 .play、.<尺寸> 檔）內容永不改變，可以長期快取
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+REVALIDATE_MAX_AGE = 0
+
+_IMMUTABLE_NAME = re.compile(
+    r'^(?:(?:avatar_)?[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})'
+    r'(?:\.play|\.\d+)?\.[a-z0-9]+$'
+)
+
+
+def is_immutable(filename):
+    return bool(_IMMUTABLE_NAME.match(os.path.basename(filename)))
+
+
+# 回傳帶有快取標頭的檔案
+#
+# send_from_directory 已處理 If-None-Match / If-Modified-Since（304）與 Range（206）。
+# 不可變的檔案使用以檔名與大小計算的強 ETag，與 mtime 無關，
+# 多個 worker 或重新部署後仍維持相同的 ETag。
+#
+# 網址內容會隨設定改變時（例如 /avatar）由呼叫端傳入 immutable=False。
+@timed(FILE_SEND_SECONDS)
+def send_cached(directory, filename, private=False, max_age=None, immutable=None):
+    directory = os.path.join(current_app.root_path, directory)
+    if immutable is None:
+        immutable = is_immutable(filename)
+    etag = True
+    if immutable:
+        try:
+            size = os.path.getsize(safe_join(directory, filename) or '')
+        except OSError:
+            size = 0
+        etag = hashlib.sha256(f'{filename}:{size}'.encode('utf-8')).hexdigest()[:32]
+
+    if max_age is None:
+        max_age = IMMUTABLE_MAX_AGE if immutable else REVALIDATE_MAX_AGE
+
+    response = send_from_directory(directory, filename, conditional=True, etag=etag, max_age=max_age)
+
+    cache_control = response.cache_control
+    if max_age == 0:
+        cache_control.no_cache = True
+    if private:
+        cache_control.public = False
+        cache_control.private = True
+    else:
+        cache_control.public = True
+    if immutable:
+        cache_control.immutable = True
+    return response
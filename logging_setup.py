@@ -0,0 +1,185 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, has_request_context, request
+
+logger = logging.getLogger('access')
+
+# LogRecord 本身的屬性；其餘以 extra={...} 傳入的欄位原樣輸出
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+# 沿用上游（負載平衡器、前端）帶來的 X-Request-ID，格式不符時重新產生
+_REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+
+_exception_formatter = logging.Formatter()
+
+
+def _extra(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+# 每筆紀錄一行 JSON：time、level、logger、message、pid、thread，加上 request_id 與 extra 欄位
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        entry.update(_extra(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# 本機開發用的單行文字格式，extra 欄位以 key=value 附在後面
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f'{key}={value}' for key, value in _extra(record).items())
+        if not fields:
+            return line
+        head, sep, tail = line.partition('\n')
+        return f'{head} {fields}{sep}{tail}'
+
+
+# 在呼叫端的執行緒完成訊息組合並帶入 request_id，輸出交給背景執行緒
+#
+# 例外的 traceback 先轉成文字：背景執行緒處理時 traceback 的 frame 可能已經改變。
+class ContextQueueHandler(QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        if 'request_id' not in vars(record) and has_request_context():
+            record.request_id = g.get('request_id')
+        return record
+
+
+_handler = None
+_listener = None
+
+
+def _start_listener(handlers):
+    global _listener
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+# fork 之後子行程沒有背景執行緒，換一個新的佇列重新啟動（gunicorn preload）
+def _restart_in_child():
+    if _handler is None or _listener is None:
+        return
+    handlers = _listener.handlers
+    _handler.queue = queue.SimpleQueue()
+    _start_listener(handlers)
+
+
+# 結束前送出佇列中剩下的紀錄
+def _stop():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# 根 logger 只掛一個 QueueHandler，請求執行緒不會因為寫入 stdout/stderr 而阻塞
+#
+# level：DEBUG、INFO...；fmt：json 或 text。重複呼叫時取代前一次的設定。
+def setup_logging(level='INFO', fmt='json', stream=None):
+    global _handler
+    root = logging.getLogger()
+    if _handler is not None:
+        root.removeHandler(_handler)
+        _stop()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+    first = _handler is None
+    _handler = ContextQueueHandler(queue.SimpleQueue())
+    root.addHandler(_handler)
+    root.setLevel(str(level).upper())
+    _start_listener([output])
+    if first:
+        atexit.register(_stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_in_child)
+
+
+# LOG_SAMPLE_RATES：「路由=比例」以逗號分隔，例如 /process-command=0.1,/health=0
+def parse_sample_rates(value):
+    rates = {}
+    for item in (value or '').split(','):
+        route, sep, rate = item.strip().rpartition('=')
+        if not sep or not route:
+            continue
+        rates[route] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def _before_request():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if _REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g._log_started = time.perf_counter()
+
+
+# 每個請求一筆紀錄；錯誤與慢請求一律記錄，其他依路由的取樣比例
+def _after_request(response):
+    started = g.pop('_log_started', None)
+    if started is None:
+        return response
+    response.headers['X-Request-ID'] = g.request_id
+    duration_ms = (time.perf_counter() - started) * 1000
+    config = current_app.config
+    rule = request.url_rule
+    route = rule.rule if rule is not None else 'unmatched'
+    failed = response.status_code >= 500
+    slow = duration_ms >= config['LOG_SLOW_MS']
+    rate = config['LOG_SAMPLE_RATES'].get(route, 1.0)
+    if not (failed or slow) and (rate <= 0 or (rate < 1 and random.random() >= rate)):
+        return response
+    logger.log(logging.WARNING if failed or slow else logging.INFO, 'request', extra={
+        'method': request.method,
+        'route': route,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 2),
+        'bytes_in': request.content_length or 0,
+        'bytes_out': response.content_length,
+        'remote': request.remote_addr,
+        'sample_rate': 1.0 if failed or slow else rate,
+    })
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('LOG_SAMPLE_RATES', {})
+    app.config.setdefault('LOG_SLOW_MS', 1000)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -1,280 +1,137 @@
-from flask import Flask, render_template, send_from_directory, request, jsonify, url_for, session
+from flask import Flask
 import os
-import json
 import logging
-from werkzeug.utils import secure_filename
-import uuid
+from datetime import timedelta
+import command_routes
+import logging_setup
+from logging_setup import parse_sample_rates, setup_logging
+import media_routes
+import metrics
+import settings_routes
+import system_routes
+from fuzzy_matcher import DEFAULT_THRESHOLD
+from services import Services, start_warm_up
+from sessions import create_session_interface, load_secret_key
 
-# 配置日誌
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
-
-# 設置靜態檔案目錄
-app.static_folder = 'static'
-app.static_url_path = '/static'
-app.template_folder = 'templates'
-
-# 基本配置
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max-limit
-
-# 允許的檔案格式
-ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'aac', 'm4a', 'flac', 'wma', 'aiff', 'alac', 'opus'}
-ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-
-def get_user_folder():
-    if 'user_id' not in session:
-        session['user_id'] = str(uuid.uuid4())
-    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], session['user_id'])
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
-    return user_folder
-
-def allowed_audio_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_AUDIO_EXTENSIONS
-
-def allowed_image_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
-
-# 確保必要的目錄存在
-def ensure_directories():
-    directories = ['static', 'uploads', 'templates']
-    for directory in directories:
-        path = os.path.join(os.getcwd(), directory)
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-# 錯誤處理
-@app.errorhandler(404)
-def not_found_error(error):
-    logger.error(f"404 error: {error}")
-    return jsonify({"error": "Not found"}), 404
-
-@app.errorhandler(500)
-def internal_error(error):
-    logger.error(f"500 error: {error}")
-    return jsonify({"error": "Internal server error"}), 500
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    logger.error(f"Unhandled exception: {str(e)}")
-    return jsonify({"error": "Internal server error"}), 500
-
-@app.route('/health')
-def health_check():
-    try:
-        ensure_directories()
-        return jsonify({"status": "healthy"}), 200
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
-
-@app.route('/')
-def index():
-    try:
-        ensure_directories()
-        return render_template('index.html')
-    except Exception as e:
-        logger.error(f"Index route failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/get-settings')
-def get_settings():
-    try:
-        user_folder = get_user_folder()
-        settings_file = os.path.join(user_folder, 'settings.json')
-        if os.path.exists(settings_file):
-            with open(settings_file, 'r', encoding='utf-8') as f:
-                return jsonify(json.load(f))
-        return jsonify({'name': '語音助理', 'avatar': None})
-    except Exception as e:
-        logger.error(f"Get settings failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/get-commands')
-def get_commands():
-    try:
-        user_folder = get_user_folder()
-        commands_file = os.path.join(user_folder, 'commands.json')
-        if os.path.exists(commands_file):
-            with open(commands_file, 'r', encoding='utf-8') as f:
-                commands = json.load(f)
-                return jsonify(commands)
-        return jsonify([])
-    except Exception as e:
-        logger.error(f"Get commands failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/add-command', methods=['POST'])
-def add_command():
-    try:
-        if 'audio' not in request.files:
-            return jsonify({"error": "No audio file"}), 400
-        
-        audio_file = request.files['audio']
-        text = request.form.get('text', '').strip()
-        
-        if not text:
-            return jsonify({"error": "No command text"}), 400
-        
-        if not audio_file or not audio_file.filename:
-            return jsonify({"error": "No audio file selected"}), 400
-        
-        if not allowed_audio_file(audio_file.filename):
-            return jsonify({"error": "Invalid audio format"}), 400
-        
-        user_folder = get_user_folder()
-        filename = secure_filename(str(uuid.uuid4()) + '.' + audio_file.filename.rsplit('.', 1)[1].lower())
-        filepath = os.path.join(user_folder, filename)
-        
-        audio_file.save(filepath)
-        
-        commands_file = os.path.join(user_folder, 'commands.json')
-        commands = []
-        if os.path.exists(commands_file):
-            with open(commands_file, 'r', encoding='utf-8') as f:
-                commands = json.load(f)
-        
-        commands.append({
-            'text': text,
-            'audio': filename
-        })
-        
-        with open(commands_file, 'w', encoding='utf-8') as f:
-            json.dump(commands, f, ensure_ascii=False)
-        
-        return jsonify({"message": "Command added successfully"})
-    except Exception as e:
-        logger.error(f"Add command failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/process-command', methods=['POST'])
-def process_command():
-    try:
-        data = request.get_json()
-        if not data or 'command' not in data:
-            return jsonify({"error": "No command text"}), 400
-        
-        command = data['command'].lower().strip()
-        user_folder = get_user_folder()
-        commands_file = os.path.join(user_folder, 'commands.json')
-        
-        if not os.path.exists(commands_file):
-            return jsonify({"match": False, "message": "No commands available"})
-        
-        with open(commands_file, 'r', encoding='utf-8') as f:
-            commands = json.load(f)
-        
-        for cmd in commands:
-            if cmd['text'].lower() in command or command in cmd['text'].lower():
-                return jsonify({
-                    "match": True,
-                    "command": cmd['text'],
-                    "audio": cmd['audio']
-                })
-        
-        return jsonify({"match": False, "message": "No matching command found"})
-    except Exception as e:
-        logger.error(f"Process command failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/delete-command', methods=['POST'])
-def delete_command():
-    try:
-        data = request.get_json()
-        if not data or 'text' not in data:
-            return jsonify({"error": "No command text provided"}), 400
-        
-        command_text = data['text'].lower().strip()
-        user_folder = get_user_folder()
-        commands_file = os.path.join(user_folder, 'commands.json')
-        
-        if not os.path.exists(commands_file):
-            return jsonify({"error": "No commands file found"}), 404
-        
-        with open(commands_file, 'r', encoding='utf-8') as f:
-            commands = json.load(f)
-        
-        # 找到要刪除的指令
-        for cmd in commands[:]:
-            if cmd['text'].lower() == command_text:
-                # 刪除關聯的音頻文件
-                audio_file = os.path.join(user_folder, cmd['audio'])
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-                commands.remove(cmd)
-                
-                # 保存更新後的指令列表
-                with open(commands_file, 'w', encoding='utf-8') as f:
-                    json.dump(commands, f, ensure_ascii=False)
-                
-                return jsonify({"message": "Command deleted successfully"})
-        
-        return jsonify({"error": "Command not found"}), 404
-    except Exception as e:
-        logger.error(f"Delete command failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/upload-avatar', methods=['POST'])
-def upload_avatar():
-    try:
-        if 'avatar' not in request.files:
-            return jsonify({"error": "No avatar file"}), 400
-        
-        avatar_file = request.files['avatar']
-        if not avatar_file or not avatar_file.filename:
-            return jsonify({"error": "No avatar file selected"}), 400
-        
-        if not allowed_image_file(avatar_file.filename):
-            return jsonify({"error": "Invalid image format"}), 400
-        
-        user_folder = get_user_folder()
-        filename = secure_filename('avatar.' + avatar_file.filename.rsplit('.', 1)[1].lower())
-        filepath = os.path.join(user_folder, filename)
-        
-        avatar_file.save(filepath)
-        
-        settings_file = os.path.join(user_folder, 'settings.json')
-        settings = {'name': '語音助理', 'avatar': filename}
-        if os.path.exists(settings_file):
-            with open(settings_file, 'r', encoding='utf-8') as f:
-                settings = json.load(f)
-                settings['avatar'] = filename
-        
-        with open(settings_file, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False)
-        
-        return jsonify({"message": "Avatar uploaded successfully", "avatar": filename})
-    except Exception as e:
-        logger.error(f"Upload avatar failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    try:
-        if 'user_id' not in session:
-            return jsonify({"error": "No user session"}), 401
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], session['user_id'])
-        return send_from_directory(user_folder, filename)
-    except Exception as e:
-        logger.error(f"File access failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/static/images/<path:filename>')
-def serve_static_image(filename):
+# 由環境變數決定的設定；路徑預設放在 UPLOAD_FOLDER 底下
+def default_config(upload_folder):
+    return {
+        'UPLOAD_FOLDER': upload_folder,
+        'MAX_CONTENT_LENGTH': 50 * 1024 * 1024,  # 50MB max-limit
+        'MAX_UPLOAD_SIZE': 50 * 1024 * 1024,
+        'MAX_IMPORT_COMMANDS': int(os.environ.get('MAX_IMPORT_COMMANDS', 5000)),
+        'FUZZY_THRESHOLD': float(os.environ.get('FUZZY_THRESHOLD', DEFAULT_THRESHOLD)),
+        'FUZZY_TOP_K': int(os.environ.get('FUZZY_TOP_K', 3)),
+        'WS_IDLE_TIMEOUT': int(os.environ.get('WS_IDLE_TIMEOUT', 300)),
+        # 每個 worker 同時開啟的 /ws/commands 上限，0 為不限制（gunicorn.conf.py 依執行緒數設定）
+        'WS_MAX_CONNECTIONS': int(os.environ.get('WS_MAX_CONNECTIONS', 0)),
+        'RECOGNITION_ENGINE': os.environ.get('RECOGNITION_ENGINE', 'vosk'),
+        'VOSK_MODEL_PATH': os.environ.get('VOSK_MODEL_PATH', os.path.join(os.getcwd(), 'models', 'vosk')),
+        'RECOGNITION_LANGUAGE': os.environ.get('RECOGNITION_LANGUAGE', 'zh-CN'),
+        'RECOGNITION_WORKERS': int(os.environ.get('RECOGNITION_WORKERS', 2)),
+        'RECOGNITION_QUEUE': int(os.environ.get('RECOGNITION_QUEUE', 8)),
+        'RECOGNITION_TIMEOUT': float(os.environ.get('RECOGNITION_TIMEOUT', 15)),
+        'RECOGNITION_MAX_BYTES': int(os.environ.get('RECOGNITION_MAX_BYTES', 5 * 1024 * 1024)),
+        'COMMAND_CACHE_SIZE': int(os.environ.get('COMMAND_CACHE_SIZE', 256)),
+        'STORAGE_BACKEND': os.environ.get('STORAGE_BACKEND', 'sqlite'),
+        'DATABASE': os.environ.get('DATABASE', os.path.join(upload_folder, 'assistant.db')),
+        'BLOB_FOLDER': os.environ.get('BLOB_FOLDER', os.path.join(upload_folder, 'blobs')),
+        'FSYNC_MODE': os.environ.get('FSYNC_MODE', 'always'),
+        'TRANSCODE_WORKERS': int(os.environ.get('TRANSCODE_WORKERS', 2)),
+        'TRANSCODE_BITRATE': os.environ.get('TRANSCODE_BITRATE', '48k'),
+        'USER_FOLDER_CACHE_SIZE': int(os.environ.get('USER_FOLDER_CACHE_SIZE', 10000)),
+        'SECRET_KEY_FILE': os.environ.get('SECRET_KEY_FILE', os.path.join(upload_folder, '.secret_key')),
+        'SESSION_BACKEND': os.environ.get('SESSION_BACKEND', 'sqlite'),
+        'SESSION_DATABASE': os.environ.get('SESSION_DATABASE', os.path.join(upload_folder, 'sessions.db')),
+        'SESSION_FOLDER': os.environ.get('SESSION_FOLDER', os.path.join(upload_folder, '.sessions')),
+        'GC_INTERVAL_HOURS': float(os.environ.get('GC_INTERVAL_HOURS', 24)),
+        'GC_GRACE_HOURS': float(os.environ.get('GC_GRACE_HOURS', 24)),
+        'GC_IO_RATE': int(os.environ.get('GC_IO_RATE', 200)),
+        # 使用者多少天沒有活動才刪除其資料；沒有設定時不刪除任何使用者，只清理沒有參照的檔案
+        'GC_EXPIRE_USERS_DAYS': (float(os.environ['GC_EXPIRE_USERS_DAYS'])
+                                 if os.environ.get('GC_EXPIRE_USERS_DAYS') else None),
+        'PERMANENT_SESSION_LIFETIME': timedelta(days=int(os.environ.get('SESSION_LIFETIME_DAYS', 31))),
+        'PROFILING_TOKEN': os.environ.get('PROFILING_TOKEN'),
+        'PROFILING_FLAG': os.environ.get('PROFILING_FLAG', os.path.join(upload_folder, '.profiling')),
+        'PROFILING_FOLDER': os.environ.get('PROFILING_FOLDER', os.path.join(upload_folder, '.profiles')),
+        'LOG_SAMPLE_RATES': parse_sample_rates(os.environ.get(
+            'LOG_SAMPLE_RATES', '/process-command=0.05,/health=0,/ready=0,/metrics=0')),
+        'LOG_SLOW_MS': float(os.environ.get('LOG_SLOW_MS', 1000)),
+    }
+
+# 必要的目錄只在啟動時建立一次，之後的請求不再檢查
+def ensure_directories(app):
+    for path in (os.path.join(os.getcwd(), 'static'), app.config['UPLOAD_FOLDER'],
+                 os.path.join(os.getcwd(), 'templates')):
+        os.makedirs(path, exist_ok=True)
+
+# 語音指令通道需要 flask-sock；沒有安裝時只停用 /ws/commands
+def register_socket(app):
     try:
-        return send_from_directory('static/images', filename)
-    except Exception as e:
-        logger.error(f"Serve static image failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        from flask_sock import Sock
+    except ImportError:
+        logger.warning("flask-sock not installed, /ws/commands disabled")
+        return None
+    sock = Sock(app)
+    sock.route('/ws/commands')(command_routes.command_socket)
+    return sock
+
+def register_metrics(services):
+    command_cache, blobs = services.command_cache, services.blobs
+    metrics.registry.callback('command_cache_hits_total', 'Command cache hits',
+                              lambda: command_cache.stats()['hits'], kind='counter')
+    metrics.registry.callback('command_cache_misses_total', 'Command cache misses',
+                              lambda: command_cache.stats()['misses'], kind='counter')
+    metrics.registry.callback('command_cache_evictions_total', 'Command cache evictions',
+                              lambda: command_cache.stats()['evictions'], kind='counter')
+    metrics.registry.callback('command_cache_entries', 'Users in the command cache',
+                              lambda: command_cache.stats()['size'])
+    metrics.registry.callback('blob_store_bytes', 'Bytes in the blob store', lambda: blobs.stats()['bytes'])
+    metrics.registry.callback('blob_store_blobs', 'Files in the blob store', lambda: blobs.stats()['blobs'])
+
+# 建立 app：設定、session、服務（app.extensions['assistant']）與各個藍圖
+#
+# config 覆寫環境變數的設定；只給 UPLOAD_FOLDER 時，資料庫等路徑跟著放在它底下。
+# 比對用的字典、NumPy、辨識與影像函式庫都在第一次用到時才載入。
+def create_app(config=None):
+    config = dict(config or {})
+
+    # 配置日誌：JSON 格式，由背景執行緒寫出（LOG_FORMAT=text 改為單行文字）
+    setup_logging(os.environ.get('LOG_LEVEL', 'info'), os.environ.get('LOG_FORMAT', 'json'))
+
+    app = Flask(__name__, static_folder='static', static_url_path='/static', template_folder='templates')
+    app.config.update(default_config(config.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))))
+    app.config.update(config)
+    ensure_directories(app)
+
+    # session 金鑰在重新啟動與多個 worker 之間保持不變；session 資料預設存在伺服器端
+    app.secret_key = load_secret_key(os.environ.get('SECRET_KEY'), app.config['SECRET_KEY_FILE'])
+    session_interface = create_session_interface(app.config)
+    if session_interface is not None:
+        app.session_interface = session_interface
+
+    services = Services(app, session_backend=session_interface.backend if session_interface is not None else None)
+    app.extensions['assistant'] = services
+
+    # 每個請求帶 request id（回應標頭 X-Request-ID）並記錄一筆 JSON；語音迴圈的請求只取樣記錄
+    logging_setup.init_app(app)
+    app.before_request(services.start_background_jobs)
+
+    # 請求延遲、位元組數與進行中的請求數；/metrics 以 Prometheus 文字格式輸出
+    metrics.init_app(app)
+    register_metrics(services)
+    services.profiler.init_app(app)
+
+    for blueprint in (system_routes.bp, command_routes.bp, media_routes.bp, settings_routes.bp):
+        app.register_blueprint(blueprint)
+    register_socket(app)
+    start_warm_up()
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5003))
     app.run(host='0.0.0.0', port=port, debug=False)
-else:
-    # 確保在生產環境中創建必要的目錄
-    ensure_directories()
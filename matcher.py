@@ -0,0 +1,130 @@
+from collections import deque
+
+
+# 指令比對器：一次編譯，重複使用
+#
+# 與原本 process_command 的線性掃描結果完全一致：
+#   回傳清單中「第一個」滿足
+#   cmd['text'].lower() in command 或 command in cmd['text'].lower()
+#   的指令。
+#
+# - 「指令文字包含於語句中」使用 Aho-Corasick 自動機，成本與語句長度成正比
+# - 「語句包含於指令文字中」使用字元 n-gram 倒排索引取得候選，再逐一驗證
+class CommandMatcher:
+    def __init__(self, commands):
+        self.commands = list(commands)
+        self.texts = [cmd['text'].lower() for cmd in self.commands]
+        self._build_automaton()
+        self._build_ngram_index()
+
+    def __len__(self):
+        return len(self.commands)
+
+    # Aho-Corasick：每個節點記錄「在此結束的最小指令索引」（含 fail 鏈）
+    def _build_automaton(self):
+        self._goto = [{}]
+        self._best = [None]
+        self._empty_index = None
+
+        for index, text in enumerate(self.texts):
+            if not text:
+                # 空字串包含於任何語句中
+                if self._empty_index is None:
+                    self._empty_index = index
+                continue
+            node = 0
+            for ch in text:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._best.append(None)
+                node = nxt
+            if self._best[node] is None or index < self._best[node]:
+                self._best[node] = index
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+
+    # 單字元與雙字元倒排索引，posting list 依指令索引遞增排列
+    def _build_ngram_index(self):
+        self._unigrams = {}
+        self._bigrams = {}
+        for index, text in enumerate(self.texts):
+            for ch in set(text):
+                self._unigrams.setdefault(ch, []).append(index)
+            for gram in set(text[i:i + 2] for i in range(len(text) - 1)):
+                self._bigrams.setdefault(gram, []).append(index)
+
+    def _first_contained_in(self, command):
+        best = self._empty_index
+        goto, fail, found = self._goto, self._fail, self._best
+        node = 0
+        for ch in command:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = found[node]
+            if hit is not None and (best is None or hit < best):
+                best = hit
+                if best == 0:
+                    break
+        return best
+
+    def _first_containing(self, command, limit):
+        if not command:
+            return 0 if self.texts else None
+
+        if len(command) == 1:
+            postings = [self._unigrams.get(command, ())]
+        else:
+            grams = set(command[i:i + 2] for i in range(len(command) - 1))
+            postings = []
+            for gram in grams:
+                posting = self._bigrams.get(gram)
+                if not posting:
+                    return None
+                postings.append(posting)
+            postings.sort(key=len)
+
+        # 以最短的 posting list 為候選，依序做子字串驗證
+        texts = self.texts
+        for index in postings[0]:
+            if limit is not None and index >= limit:
+                break
+            if command in texts[index]:
+                return index
+        return None
+
+    # 只比對「指令文字包含於語句中」，用於仍在變化中的部分辨識結果
+    def match_contained(self, command):
+        index = self._first_contained_in(command)
+        if index is None:
+            return None
+        return self.commands[index]
+
+    def match_index(self, command):
+        contained = self._first_contained_in(command)
+        containing = self._first_containing(command, contained)
+        if containing is not None:
+            return containing
+        return contained
+
+    def match(self, command):
+        index = self.match_index(command)
+        if index is None:
+            return None
+        return self.commands[index]
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+
+from flask import Blueprint, current_app, jsonify, request, session, url_for
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import safe_join
+
+from avatars import AVATAR_SIZES, DEFAULT_SIZE, is_image
+from blobstore import is_blob_name
+from http_cache import send_cached
+from services import (DEFAULT_AVATAR, allowed_audio_file, allowed_image_file, avatars, blobs, get_user_folder,
+                      release_file, store, user_references, waveforms)
+
+logger = logging.getLogger(__name__)
+
+# 頭像、上傳的音檔、波形與靜態圖片
+bp = Blueprint('media', __name__)
+
+@bp.route('/upload-avatar', methods=['POST'])
+def upload_avatar():
+    try:
+        if 'avatar' not in request.files:
+            return jsonify({"error": "No avatar file"}), 400
+        
+        avatar_file = request.files['avatar']
+        if not avatar_file or not avatar_file.filename:
+            return jsonify({"error": "No avatar file selected"}), 400
+        
+        if not allowed_image_file(avatar_file.filename):
+            return jsonify({"error": "Invalid image format"}), 400
+        
+        user_folder = get_user_folder()
+        extension = avatar_file.filename.rsplit('.', 1)[1].lower()
+        filename = blobs.ingest_stream(avatar_file.stream, extension, current_app.config['MAX_UPLOAD_SIZE'])
+        if filename is None:
+            return jsonify({"error": "No avatar file selected"}), 400
+        if not is_image(blobs.path(filename)):
+            blobs.decref(filename)
+            return jsonify({"error": "Invalid image format"}), 415
+        
+        old_avatar = (store.get_settings(session['user_id']) or {}).get('avatar')
+        store.update_settings(session['user_id'], avatar=filename)
+        if old_avatar and old_avatar != filename:
+            release_file(user_folder, old_avatar)
+        elif old_avatar == filename:
+            blobs.decref(filename)
+        avatars.submit(blobs.folder(filename), filename)
+        
+        return jsonify({"message": "Avatar uploaded successfully", "avatar": filename,
+                        "avatar_urls": avatar_urls(filename)})
+    except Exception as e:
+        logger.error(f"Upload avatar failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 頭像所在的資料夾：檔案庫、舊版的使用者資料夾或 static/images
+def avatar_folder(avatar):
+    if is_blob_name(avatar):
+        return blobs.folder(avatar)
+    user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], session['user_id'])
+    if os.path.exists(os.path.join(user_folder, avatar)):
+        return user_folder
+    return current_app.extensions['assistant'].static_images
+
+def avatar_version(avatar):
+    return hashlib.sha256(avatar.encode('utf-8')).hexdigest()[:16]
+
+# 設定中指向各尺寸頭像的網址；v 隨頭像改變，帶有目前 v 的網址可以長期快取
+def avatar_urls(avatar):
+    if not avatar or avatar == DEFAULT_AVATAR:
+        return None
+    version = avatar_version(avatar)
+    return {str(size): url_for('media.avatar_image', size=size, v=version) for size in AVATAR_SIZES}
+
+# 依 size 選擇最接近的固定尺寸，瀏覽器接受 WebP 時回傳 WebP，否則回傳 PNG
+@bp.route('/avatar')
+def avatar_image():
+    try:
+        get_user_folder()
+        size = request.args.get('size', DEFAULT_SIZE, type=int)
+        if size <= 0:
+            return jsonify({"error": "Invalid size"}), 400
+        avatar = (store.get_settings(session['user_id']) or {}).get('avatar')
+        if not avatar or avatar == DEFAULT_AVATAR:
+            return send_cached('static/images', DEFAULT_AVATAR)
+        if not allowed_image_file(avatar):
+            return jsonify({"error": "Invalid avatar"}), 404
+        folder = avatar_folder(avatar)
+        fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'png'
+        # 只有帶著目前版本 v 的網址可以長期快取；其他的每次重新驗證（If-None-Match / If-Modified-Since）
+        immutable = request.args.get('v') == avatar_version(avatar)
+        try:
+            variant = avatars.generate(folder, avatar, size, fmt)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            # 無法解碼的舊頭像直接回傳原圖
+            logger.warning(f"Avatar variants for {avatar} failed: {str(e)}")
+            return send_cached(folder, avatar, private=True, immutable=immutable)
+
+        response = send_cached(folder, variant, private=True, immutable=immutable)
+        response.vary.add('Accept')
+        return response
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        return jsonify({"error": "Avatar not found"}), 404
+    except Exception as e:
+        logger.error(f"Serve avatar failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "No user session"}), 401
+        if is_blob_name(filename):
+            # 檔案庫以內容雜湊命名，知道雜湊不代表可以讀取：只提供給引用它的使用者
+            if not user_references(session['user_id'], filename):
+                return jsonify({"error": "Not found"}), 404
+            return send_cached(blobs.folder(filename), filename, private=True)
+        user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], session['user_id'])
+        return send_cached(user_folder, filename, private=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"File access failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 預先計算的波形（audiowaveform .dat 格式），前端交給 wavesurfer 繪製，不必解碼整個音檔
+#
+# 波形在轉檔工作中產生，這裡不會同步解碼：尚未產生的（例如舊資料）排入背景，
+# 尚未產生或無法產生（解碼失敗、沒有 ffmpeg）時回覆 404，前端改由 wavesurfer 自行解碼。
+@bp.route('/peaks/<path:filename>')
+def audio_peaks(filename):
+    try:
+        if 'user_id' not in session:
+            return jsonify({"error": "No user session"}), 401
+        if is_blob_name(filename):
+            if not user_references(session['user_id'], filename):
+                return jsonify({"error": "Not found"}), 404
+            folder = blobs.folder(filename)
+        else:
+            folder = os.path.join(current_app.config['UPLOAD_FOLDER'], session['user_id'])
+        
+        source = safe_join(folder, filename)
+        if not allowed_audio_file(filename) or not source or not os.path.isfile(source):
+            return jsonify({"error": "Not found"}), 404
+        name = waveforms.cached(folder, filename)
+        if name is None:
+            waveforms.submit(folder, filename)
+            return jsonify({"error": "Peaks not available"}), 404
+        return send_cached(folder, name, private=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Peaks failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/static/images/<path:filename>')
+def serve_static_image(filename):
+    try:
+        return send_cached('static/images', filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Serve static image failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
@@ -0,0 +1,251 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 請求延遲的直方圖區間（秒）：比對請求多在毫秒以下，上傳與辨識可達數秒
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# 以下指標只存在目前行程；gunicorn 有多個 worker 時每次抓取看到回應的那個 worker
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+# 抓取時才呼叫 callback 取值，例如快取統計
+class CallbackGauge:
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        return [(self.name, '', self.callback())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    # 每個標籤組合記錄 [各區間計數..., 總和]；累計計數在輸出時才計算
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        samples = []
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append((self.name + '_bucket', _labels(self.labelnames, labels, [('le', le)]), cumulative))
+            samples.append((self.name + '_sum', _labels(self.labelnames, labels), state[-1]))
+            samples.append((self.name + '_count', _labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+def _format(value):
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    # 同名的指標取代先前註冊的（例如再次呼叫 create_app() 時重新註冊的回呼）
+    def register(self, metric):
+        self.metrics = [m for m in self.metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind='gauge'):
+        return self.register(CallbackGauge(name, documentation, callback, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+_started = time.time()
+
+REQUEST_SECONDS = registry.histogram('http_request_duration_seconds', 'Request latency by route',
+                                     ('method', 'route'))
+REQUESTS = registry.counter('http_requests_total', 'Requests by route and status', ('method', 'route', 'status'))
+REQUEST_BYTES = registry.counter('http_request_bytes_total', 'Request body bytes by route', ('route',))
+RESPONSE_BYTES = registry.counter('http_response_bytes_total', 'Response body bytes with a known length by route',
+                                  ('route',))
+IN_FLIGHT = registry.gauge('http_requests_in_flight', 'Requests being handled by this worker')
+STORAGE_SECONDS = registry.histogram('storage_operation_seconds', 'Store reads and writes', ('operation',))
+SESSION_SECONDS = registry.histogram('session_operation_seconds', 'Loading and saving the session',
+                                     ('operation',))
+MATCH_SECONDS = registry.histogram('matcher_seconds', 'Command matching', ('kind',))
+FILE_SEND_SECONDS = registry.histogram('file_send_seconds', 'Preparing file responses (stat, open, headers)')
+registry.callback('process_start_time_seconds', 'Start time of this worker', lambda: _started)
+registry.callback('process_pid', 'PID of the worker that answered this scrape', os.getpid)
+
+
+# 函式裝飾器：以直方圖記錄每次呼叫的耗時
+def timed(histogram, *labels):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+
+# 替物件的方法加上計時（只換掉這個實例上的屬性，呼叫端不需修改）
+def instrument(obj, histogram, methods, prefix=''):
+    for name in methods:
+        method = getattr(obj, name, None)
+        if method is not None:
+            setattr(obj, name, timed(histogram, prefix + name)(method))
+    return obj
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    IN_FLIGHT.dec()
+    route = _route()
+    REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route)
+    REQUESTS.inc(request.method, route, str(response.status_code))
+    if request.content_length:
+        REQUEST_BYTES.inc(route, amount=request.content_length)
+    if response.content_length:
+        RESPONSE_BYTES.inc(route, amount=response.content_length)
+    return response
+
+
+# 處理過程中拋出例外、沒有經過 after_request 時仍要扣回進行中的請求數
+def _teardown_request(exc):
+    if g.pop('_metrics_started', None) is not None:
+        IN_FLIGHT.dec()
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    # 預設的 session 介面是所有 Flask app 共用的類別屬性，換成自己的實例再加上計時
+    if 'session_interface' not in vars(app):
+        app.session_interface = type(app.session_interface)()
+    instrument(app.session_interface, SESSION_SECONDS, ('open_session', 'save_session'))
+
+
+def metrics_response():
+    return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
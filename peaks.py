@@ -0,0 +1,204 @@
+import logging
+import os
+import struct
+import subprocess
+import threading
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from transcode import find_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+PEAKS_SUFFIX = '.peaks'
+
+# 無法解碼的音檔留下的標記：之後的請求直接回覆 404，讓前端自行解碼，不再重試
+FAILED_SUFFIX = '.peaks.failed'
+
+# 波形寬度（min/max 組數）；前端的波形區塊不會超過這個像素數
+PEAK_COUNT = 800
+
+# 非 WAV 檔以 ffmpeg 解碼成單聲道 16-bit，取樣率只影響波形精細度
+DECODE_RATE = 8000
+
+# 與 audiowaveform 的 .dat 第 1 版相同：版本、旗標（0 = 16-bit）、取樣率、每組取樣數、組數
+_HEADER = struct.Struct('<iIiiI')
+
+
+def peaks_name(audio):
+    return os.path.splitext(audio)[0] + PEAKS_SUFFIX
+
+
+def failed_name(audio):
+    return os.path.splitext(audio)[0] + FAILED_SUFFIX
+
+
+# 波形的附屬檔（波形與失敗標記），隨音檔一起刪除
+def peaks_names(audio):
+    return [peaks_name(audio), failed_name(audio)]
+
+
+class DecoderMissing(RuntimeError):
+    pass
+
+
+# 沒有 ffmpeg 時只能讀取 WAV
+def can_decode(audio, ffmpeg):
+    return bool(ffmpeg) or audio.lower().endswith('.wav')
+
+
+def _read_wav(path, np):
+    with wave.open(path, 'rb') as f:
+        channels, width, rate = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        data = f.readframes(f.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128) << 8
+    elif width == 2:
+        samples = np.frombuffer(data, dtype='<i2')
+    elif width == 3:
+        # 24-bit 只取高位的 16 bits
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = np.ascontiguousarray(raw[:, 1:]).view('<i2').ravel()
+    elif width == 4:
+        samples = (np.frombuffer(data, dtype='<i4') >> 16).astype(np.int16)
+    else:
+        raise wave.Error(f"Unsupported sample width {width}")
+    return samples.reshape(-1, channels), rate
+
+
+def _decode(path, ffmpeg, np):
+    if not ffmpeg:
+        raise DecoderMissing("ffmpeg is required to decode non-WAV audio")
+    cmd = [ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-i', path,
+           '-vn', '-ac', '1', '-ar', str(DECODE_RATE), '-f', 's16le', '-']
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:])
+    return np.frombuffer(result.stdout, dtype='<i2').reshape(-1, 1), DECODE_RATE
+
+
+# 把音檔縮減成 count 組 (min, max)，所有聲道合併計算
+def compute_peaks(path, ffmpeg=None, count=PEAK_COUNT):
+    import numpy as np
+
+    samples = None
+    if path.lower().endswith('.wav'):
+        try:
+            samples, rate = _read_wav(path, np)
+        except (wave.Error, EOFError):
+            samples = None  # 浮點或壓縮的 WAV 交給 ffmpeg
+    if samples is None:
+        samples, rate = _decode(path, ffmpeg, np)
+
+    frames = len(samples)
+    per_peak = max(1, -(-frames // count))
+    padded = np.zeros((-(-frames // per_peak) * per_peak, samples.shape[1]), dtype=np.int16)
+    padded[:frames] = samples
+    buckets = padded.reshape(-1, per_peak * samples.shape[1])
+    peaks = np.empty((len(buckets), 2), dtype='<i2')
+    peaks[:, 0] = buckets.min(axis=1)
+    peaks[:, 1] = buckets.max(axis=1)
+    return peaks, rate, per_peak
+
+
+def write_peaks(target, peaks, rate, per_peak):
+    tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(1, 0, rate, per_peak, len(peaks)))
+            f.write(peaks.tobytes())
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# 產生 path 的波形檔（與音檔放在同一個資料夾：<名稱>.peaks），回傳是否可用
+#
+# 解碼失敗時寫入 <名稱>.peaks.failed，之後不再嘗試；沒有 ffmpeg 是環境問題，不留下標記。
+# 音檔不存在時拋出 FileNotFoundError。
+def generate_peaks(path, ffmpeg):
+    folder, audio = os.path.split(path)
+    target = os.path.join(folder, peaks_name(audio))
+    failed = os.path.join(folder, failed_name(audio))
+    if os.path.exists(target):
+        return True
+    if os.path.exists(failed) or not can_decode(audio, ffmpeg):
+        return False
+    try:
+        peaks, rate, per_peak = compute_peaks(path, ffmpeg)
+    except (FileNotFoundError, DecoderMissing):
+        raise
+    except Exception as e:
+        logger.warning(f"Peaks for {audio} failed: {str(e)}")
+        open(failed, 'w').close()
+        return False
+    write_peaks(target, peaks, rate, per_peak)
+    return True
+
+
+# 波形檔：有 ffmpeg 時在轉檔工作中（子行程）與播放檔一起產生；沒有時由這裡的背景執行緒產生 WAV 的波形
+#
+# /peaks 請求不會同步產生波形：尚未產生的（例如舊資料）排入背景，這次回覆 404 由前端自行解碼。
+class PeaksPipeline:
+    def __init__(self, max_workers=1, ffmpeg=None):
+        self.max_workers = max_workers
+        self.ffmpeg = ffmpeg if ffmpeg is not None else find_ffmpeg()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    # 已產生的波形檔名；尚未產生或無法產生時回傳 None
+    def cached(self, folder, audio):
+        name = peaks_name(audio)
+        return name if os.path.exists(os.path.join(folder, name)) else None
+
+    # 是否還可能產生波形（沒有失敗標記、而且有辦法解碼）
+    def available(self, folder, audio):
+        return can_decode(audio, self.ffmpeg) and not os.path.exists(os.path.join(folder, failed_name(audio)))
+
+    def generate(self, folder, audio):
+        if generate_peaks(os.path.join(folder, audio), self.ffmpeg):
+            return peaks_name(audio)
+        return None
+
+    # 排入背景產生；同一個檔案已在佇列中或無法產生時不重複排入
+    def submit(self, folder, audio):
+        key = os.path.join(folder, audio)
+        with self._lock:
+            if key in self._pending or not self.available(folder, audio):
+                return None
+            self._pending.add(key)
+
+        def run():
+            try:
+                self.generate(folder, audio)
+            except FileNotFoundError:
+                pass  # 產生前指令已被刪除
+            except Exception as e:
+                logger.error(f"Peaks for {audio} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        try:
+            return self._get_executor().submit(run)
+        except BaseException:
+            with self._lock:
+                self._pending.discard(key)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，退回行程內的鎖
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = '.lock'
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+# 以資料夾為單位的互斥鎖（跨行程使用 fcntl.flock）
+#
+# 讀取不需要加鎖：寫入一律透過 atomic_write_json 以 os.replace 提交，
+# 讀者只會看到完整的舊檔或新檔。
+def folder_lock(folder):
+    os.makedirs(folder, exist_ok=True)
+    return file_lock(os.path.join(folder, LOCK_FILENAME))
+
+
+@contextmanager
+def file_lock(lock_path):
+    if fcntl is None:
+        with _thread_lock(lock_path):
+            yield
+        return
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+# 先寫入同資料夾的暫存檔，再以 os.replace 原子性地取代目標檔
+#
+# fsync 模式：
+#   'always' 寫入後立即 fsync 檔案與資料夾
+#   'batch'  交給背景執行緒定期 fsync（斷電時最多遺失一個批次間隔的寫入）
+#   'off'    不 fsync
+def atomic_write_json(path, data, fsync='always', **dump_kwargs):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+            f.flush()
+            if fsync == 'always':
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync == 'always':
+        _fsync_path(directory)
+    elif fsync == 'batch':
+        fsync_batcher.add(path)
+
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# 背景批次 fsync：同一間隔內重複寫入的檔案只會 fsync 一次
+class FsyncBatcher:
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # fork 之後背景執行緒不會被複製，需在每個行程各自啟動
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='fsync-batcher', daemon=True)
+            self._thread.start()
+
+    def add(self, path):
+        with self._cond:
+            self._ensure_thread()
+            self._pending.add(path)
+            self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            pending, self._pending = self._pending, set()
+        directories = set()
+        for path in pending:
+            _fsync_path(path)
+            directories.add(os.path.dirname(path) or '.')
+        for directory in directories:
+            _fsync_path(directory)
+        return len(pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Batched fsync failed: {str(e)}")
+
+
+fsync_batcher = FsyncBatcher()
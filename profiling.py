@@ -0,0 +1,330 @@
+import cProfile
+import json
+import logging
+import marshal
+import os
+import pstats
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+MODES = ('stack', 'cprofile')
+
+# 每個 worker 多久檢查一次旗標檔（秒）；停用時每個請求只多一次時間比較
+CHECK_INTERVAL = 1.0
+
+# 取樣中的資料多久寫入磁碟一次（秒），停用時也會寫入
+FLUSH_INTERVAL = 10.0
+
+# stack 模式每隔多久擷取一次請求執行緒的呼叫堆疊（秒）
+STACK_INTERVAL = 0.005
+
+# 單次開啟的最長時間，避免忘記關閉
+MAX_DURATION = 24 * 3600
+
+# 管理介面本身不取樣
+EXCLUDED_PREFIX = '/admin/'
+
+_SESSION = re.compile(r'^\d{8}-\d{6}$')
+_FILENAME = re.compile(r'^(\w+)\.(prof|collapsed)$')
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+# 路由轉成檔名：/process-command -> process_command，/uploads/<path:filename> -> uploads_path_filename
+def route_slug(route):
+    return re.sub(r'\W+', '_', route).strip('_') or 'index'
+
+
+# 與 py-spy 相同的堆疊格式：函式 (檔案:行號)，由外而內以分號連接
+def _frame_label(frame, root):
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(root):
+        path = os.path.relpath(path, root)
+    else:
+        path = os.path.join(*path.split(os.sep)[-2:]) if os.sep in path else path
+    return f'{code.co_name} ({path}:{frame.f_lineno})'.replace(';', ':')
+
+
+def _collapse(frame, root):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame, root))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _read_collapsed(path):
+    counts = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                counts[stack] += int(count)
+    return counts
+
+
+# 線上請求的取樣分析
+#
+# 開關是 uploads 下的旗標檔（JSON），由管理介面寫入；每個 worker 每秒最多檢查一次，
+# 不需要重新啟動。旗標檔不存在時不建立 profiler 也不啟動取樣執行緒。
+#
+# 兩種模式：
+#   stack     背景執行緒每 5 毫秒擷取被取樣請求的呼叫堆疊，輸出火焰圖用的 collapsed stacks
+#   cprofile  被取樣的請求在 cProfile 下執行，輸出 pstats 檔
+#
+# 每次開啟是一個分析批次（以開啟時間命名），結果依路由彙總，
+# 每個 worker 寫入 <folder>/<批次>/<路由>.<pid>.<副檔名>，下載時再合併。
+class Profiler:
+    def __init__(self, flag_path, folder, root=None):
+        self.flag_path = flag_path
+        self.folder = folder
+        self.root = root or os.getcwd()
+        self._config = None
+        self._flag_mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._stacks = {}
+        self._active = {}
+        self._last_flush = 0.0
+        self._sampler = None
+        self._sampler_pid = None
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # 管理介面：寫入旗標檔，所有 worker 在一秒內套用
+    def enable(self, mode='stack', rate=0.1, routes=(), duration=900):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        rate = float(rate)
+        duration = float(duration)
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        if not 0 < duration <= MAX_DURATION:
+            raise ValueError(f"duration must be between 0 and {MAX_DURATION} seconds")
+        if isinstance(routes, str) or not all(isinstance(r, str) for r in routes):
+            raise ValueError("routes must be a list of route rules")
+        now = time.time()
+        config = {'session': time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), 'mode': mode,
+                  'rate': rate, 'routes': list(routes), 'started': now, 'until': now + duration}
+        atomic_write_json(self.flag_path, config, fsync='off')
+        self._next_check = 0.0
+        return config
+
+    def disable(self):
+        try:
+            os.remove(self.flag_path)
+        except FileNotFoundError:
+            pass
+        self._next_check = 0.0
+
+    def read_flag(self):
+        try:
+            with open(self.flag_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.error(f"Invalid profiling flag file: {str(e)}")
+            return None
+        if config.get('mode') not in MODES or not _SESSION.match(str(config.get('session', ''))):
+            logger.error("Invalid profiling flag file: missing mode or session")
+            return None
+        if config.get('until') and config['until'] <= time.time():
+            return None
+        return config
+
+    # 目前的設定；停用時只做一次時間比較
+    def current(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._config
+        with self._lock:
+            if now < self._next_check:
+                return self._config
+            self._next_check = now + CHECK_INTERVAL
+            try:
+                mtime = os.stat(self.flag_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            config = self._config
+            if mtime != self._flag_mtime:
+                self._flag_mtime = mtime
+                config = self.read_flag() if mtime is not None else None
+            elif config is not None and config.get('until') and config['until'] <= time.time():
+                config = None
+            self._apply(config)
+            return self._config
+
+    def _apply(self, config):
+        previous = self._config
+        if previous is not None and (config is None or config['session'] != previous['session']):
+            self._flush(previous)
+            self._stats, self._stacks = {}, {}
+            logger.info(f"Profiling session {previous['session']} stopped in worker {os.getpid()}")
+        if config is not None and (previous is None or config['session'] != previous['session']):
+            self._last_flush = time.monotonic()
+            logger.info(f"Profiling session {config['session']} ({config['mode']}, rate {config['rate']}) "
+                        f"started in worker {os.getpid()}")
+        self._config = config
+        if config is not None and config['mode'] == 'stack':
+            self._start_sampler()
+
+    def _start_sampler(self):
+        if self._sampler_pid == os.getpid() and self._sampler.is_alive():
+            return
+        self._sampler = threading.Thread(target=self._sample_loop, name='profiling-sampler', daemon=True)
+        self._sampler_pid = os.getpid()
+        self._sampler.start()
+
+    # 沒有在取樣中的請求時只休眠；設定關閉或換成 cprofile 模式後結束
+    def _sample_loop(self):
+        while True:
+            config = self._config
+            if config is None or config['mode'] != 'stack':
+                return
+            if self._active:
+                frames = sys._current_frames()
+                with self._lock:
+                    for ident, route in list(self._active.items()):
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            self._stacks.setdefault(route, Counter())[_collapse(frame, self.root)] += 1
+                del frames
+            time.sleep(STACK_INTERVAL)
+            self.current()
+
+    def _before_request(self):
+        config = self.current()
+        if config is None:
+            return
+        route = _route()
+        if route.startswith(EXCLUDED_PREFIX) or (config['routes'] and route not in config['routes']):
+            return
+        if random.random() >= config['rate']:
+            return
+        if config['mode'] == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return  # Python 3.12 起同一時間只能有一個 cProfile，其他請求這次不取樣
+            g._profiling = (config['session'], route, profile)
+        else:
+            self._active[threading.get_ident()] = route
+            g._profiling = (config['session'], route, None)
+
+    def _teardown_request(self, exc):
+        sample = g.pop('_profiling', None)
+        if sample is None:
+            return
+        session, route, profile = sample
+        if profile is None:
+            self._active.pop(threading.get_ident(), None)
+        else:
+            profile.disable()
+        with self._lock:
+            config = self._config
+            if config is None or config['session'] != session:
+                return
+            if profile is not None:
+                stats = self._stats.get(route)
+                if stats is None:
+                    self._stats[route] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            if time.monotonic() - self._last_flush > FLUSH_INTERVAL:
+                self._flush(config)
+
+    # 呼叫時須持有 self._lock
+    def _flush(self, config):
+        self._last_flush = time.monotonic()
+        if not self._stats and not self._stacks:
+            return
+        folder = os.path.join(self.folder, config['session'])
+        try:
+            os.makedirs(folder, exist_ok=True)
+            for route, stats in self._stats.items():
+                self._write(folder, route, 'prof', marshal.dumps(stats.stats))
+            for route, counts in self._stacks.items():
+                lines = ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+                self._write(folder, route, 'collapsed', lines.encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Writing profiles for session {config['session']} failed: {str(e)}")
+
+    def _write(self, folder, route, kind, data):
+        path = os.path.join(folder, f'{route_slug(route)}.{os.getpid()}.{kind}')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # 各批次依路由列出可下載的結果與寫入的 worker 數
+    def sessions(self):
+        sessions = {}
+        try:
+            entries = sorted(os.listdir(self.folder), reverse=True)
+        except FileNotFoundError:
+            return sessions
+        for session in entries:
+            if not _SESSION.match(session):
+                continue
+            profiles = {}
+            for name in sorted(os.listdir(os.path.join(self.folder, session))):
+                parts = name.split('.')
+                if len(parts) != 3 or parts[2] not in ('prof', 'collapsed'):
+                    continue
+                filename = f'{parts[0]}.{parts[2]}'
+                profiles[filename] = profiles.get(filename, 0) + 1
+            sessions[session] = [{'file': name, 'workers': count} for name, count in profiles.items()]
+        return sessions
+
+    # 合併所有 worker 的結果；回傳 bytes，找不到時回傳 None
+    def merged(self, session, filename):
+        match = _FILENAME.match(filename)
+        if not _SESSION.match(session) or match is None:
+            raise ValueError("Invalid profile name")
+        folder = os.path.join(self.folder, session)
+        slug, kind = match.groups()
+        try:
+            paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                     if name.startswith(slug + '.') and name.endswith('.' + kind) and name.count('.') == 2]
+        except FileNotFoundError:
+            return None
+        if not paths:
+            return None
+        if kind == 'prof':
+            return marshal.dumps(pstats.Stats(*paths).stats)
+        counts = Counter()
+        for path in paths:
+            counts.update(_read_collapsed(path))
+        return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common()).encode('utf-8')
+
+    def delete(self, session):
+        if not _SESSION.match(session):
+            raise ValueError("Invalid profiling session")
+        config = self.read_flag()
+        if config is not None and config['session'] == session:
+            raise ValueError("Cannot delete the running profiling session")
+        path = os.path.join(self.folder, session)
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path)
+        return True
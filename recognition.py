@@ -0,0 +1,163 @@
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from transcode import find_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# SpeechRecognition 的 AudioFile 可直接讀取的格式，其他格式先用 ffmpeg 轉成 WAV
+NATIVE_EXTENSIONS = {'wav', 'aiff', 'flac'}
+
+
+class RecognitionError(Exception):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# 以下在子行程中執行；模型在每個子行程第一次使用時載入，之後重複使用
+_models = {}
+
+
+def _load_audio(path, ffmpeg):
+    import speech_recognition as sr
+
+    extension = path.rsplit('.', 1)[-1].lower()
+    wav_path = None
+    if extension not in NATIVE_EXTENSIONS:
+        if not ffmpeg:
+            raise RuntimeError(f"ffmpeg is required to decode .{extension} audio")
+        wav_path = f'{path}.{uuid.uuid4().hex}.wav'
+        cmd = [ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', '-i', path,
+               '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), wav_path]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:])
+        path = wav_path
+    try:
+        with sr.AudioFile(path) as source:
+            return sr.Recognizer().record(source)
+    finally:
+        if wav_path and os.path.exists(wav_path):
+            os.remove(wav_path)
+
+
+def _recognize_vosk(audio, model_path):
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+
+    model = _models.get(model_path)
+    if model is None:
+        SetLogLevel(-1)
+        model = _models[model_path] = Model(model_path)
+    recognizer = KaldiRecognizer(model, SAMPLE_RATE)
+    recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2))
+    return json.loads(recognizer.FinalResult()).get('text', '')
+
+
+def _recognize_sphinx(audio, language):
+    import speech_recognition as sr
+
+    try:
+        return sr.Recognizer().recognize_sphinx(audio, language=language)
+    except sr.UnknownValueError:
+        return ''
+
+
+def recognize_clip(engine, path, model_path, language, ffmpeg):
+    audio = _load_audio(path, ffmpeg)
+    if engine == 'vosk':
+        text = _recognize_vosk(audio, model_path)
+    else:
+        text = _recognize_sphinx(audio, language)
+    # Vosk 的中文結果以空白分隔詞，比對前不需要
+    return ''.join(text.split()) if engine == 'vosk' else text.strip()
+
+
+# 伺服器端離線語音辨識：有上限的行程池加上等待佇列
+#
+# 同時進行與排隊中的工作合計超過 max_workers + max_queue 時立即回覆 503，
+# 不讓請求堆積；每個請求最多等待 timeout 秒，逾時回覆 504。
+# 逾時的工作若已在執行中會跑完才釋放名額，所以名額反映實際負載。
+class RecognitionPool:
+    def __init__(self, engine='vosk', model_path=None, language='zh-CN', max_workers=2,
+                 max_queue=8, timeout=15, ffmpeg=None):
+        self.engine = engine
+        self.model_path = model_path
+        self.language = language
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ffmpeg = ffmpeg if ffmpeg is not None else find_ffmpeg()
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.unavailable = self._check()
+        if self.unavailable:
+            logger.warning(f"Speech recognition disabled: {self.unavailable}")
+
+    def _check(self):
+        if importlib.util.find_spec('speech_recognition') is None:
+            return "SpeechRecognition not installed"
+        if self.engine == 'vosk':
+            if importlib.util.find_spec('vosk') is None:
+                return "vosk not installed"
+            if not self.model_path or not os.path.isdir(self.model_path):
+                return f"Vosk model not found at {self.model_path}"
+        elif self.engine == 'sphinx':
+            if importlib.util.find_spec('pocketsphinx') is None:
+                return "pocketsphinx not installed"
+        else:
+            return f"Unknown recognition engine {self.engine}"
+        return None
+
+    @property
+    def enabled(self):
+        return self.unavailable is None
+
+    def _get_executor(self):
+        # 與轉檔相同：gunicorn preload 後 fork，行程池要在各 worker 內建立
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    # 辨識音檔並回傳文字；呼叫端負責在回傳後刪除音檔
+    def recognize(self, path):
+        if not self.enabled:
+            raise RecognitionError("Speech recognition not available", 503)
+        if not self._slots.acquire(blocking=False):
+            raise RecognitionError("Recognition queue is full", 503)
+        try:
+            future = self._get_executor().submit(recognize_clip, self.engine, path, self.model_path,
+                                                 self.language, self.ffmpeg)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise RecognitionError("Recognition timed out", 504)
+        except Exception as e:
+            raise RecognitionError(f"Recognition failed: {str(e)}", 422)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,222 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from flask import current_app, session
+from werkzeug.local import LocalProxy
+
+import metrics
+import text_normalize
+from avatars import AvatarPipeline, variant_names
+from blobstore import BlobStore, is_blob_name
+from command_cache import CommandCache
+from compaction import Compactor
+from metrics import STORAGE_SECONDS
+from peaks import PeaksPipeline, peaks_names
+from profiling import Profiler
+from recognition import RecognitionPool
+from storage import create_store
+from transcode import TranscodePipeline
+from vector_index import load_numpy
+
+logger = logging.getLogger(__name__)
+
+# 允許的檔案格式
+ALLOWED_AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'aac', 'm4a', 'flac', 'wma', 'aiff', 'alac', 'opus'}
+ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+# 伺服器端辨識另外接受瀏覽器錄音常用的 webm；原始請求內容依 Content-Type 判斷格式
+RECOGNITION_EXTENSIONS = ALLOWED_AUDIO_EXTENSIONS | {'webm'}
+RECOGNITION_CONTENT_TYPES = {
+    'audio/wav': 'wav', 'audio/x-wav': 'wav', 'audio/wave': 'wav', 'audio/flac': 'flac',
+    'audio/ogg': 'ogg', 'audio/opus': 'opus', 'audio/webm': 'webm', 'audio/mpeg': 'mp3',
+    'audio/mp4': 'm4a', 'audio/aac': 'aac', 'audio/aiff': 'aiff',
+}
+
+DEFAULT_AVATAR = 'default-avatar.png'
+
+# 同一位使用者在同一個行程內最多每隔多久（秒）寫入一次最後活動時間
+ACTIVITY_INTERVAL = 3600
+
+
+# 比對用的字典與 NumPy 延後到第一次使用時才載入；建立 app 後在背景先載入，第一句語音指令通常不必等待
+#
+# gunicorn preload 時 master 在 fork 前會等它載入完成（見 _wait_for_warm_up），各 worker 共用已載入的字典；
+# 沒有 preload 時 /health 不必等待。
+def _warm_up():
+    try:
+        text_normalize.preload()
+        load_numpy()
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def start_warm_up():
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is not None:
+            return
+        _warm_up_thread = threading.Thread(target=_warm_up, name='warm-up', daemon=True)
+        _warm_up_thread.start()
+
+
+# fork 前等背景載入結束：子行程不會繼承載入到一半的模組（gunicorn preload、轉檔與辨識的行程池），
+# preload 時各 worker 也共用已載入的字典
+def _wait_for_warm_up():
+    thread = _warm_up_thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_wait_for_warm_up)
+
+
+# 一個 app 的所有服務：儲存層、檔案庫、快取與背景工作
+#
+# 依 app.config 建立，存放在 app.extensions['assistant']；藍圖透過本模組的代理
+# （store、blobs、command_cache...）存取目前 app 的實例。
+class Services:
+    def __init__(self, app, session_backend=None):
+        config = app.config
+        self.static_images = os.path.join(app.root_path, 'static', 'images')
+
+        # 指令與設定的儲存層（SQLite 或沿用 JSON 檔）
+        self.store = create_store(config)
+        metrics.instrument(self.store, STORAGE_SECONDS, (
+            'commands_signature', 'get_commands', 'add_command', 'add_commands', 'delete_command',
+            'delete_commands', 'set_playback', 'get_settings', 'update_settings', 'touch_user'))
+
+        # 上傳的音檔與頭像依內容雜湊存放，相同內容只保留一份
+        self.blobs = BlobStore(config['BLOB_FOLDER'])
+        metrics.instrument(self.blobs, STORAGE_SECONDS, ('ingest_stream', 'add_file', 'incref', 'decref'),
+                           prefix='blobs.')
+
+        # 已解析的指令清單快取（每個使用者一筆）
+        self.command_cache = CommandCache(self.store, config['COMMAND_CACHE_SIZE'])
+
+        # 上傳音檔的背景轉檔（Opus/OGG、去除開頭靜音、響度正規化）
+        self.transcoder = TranscodePipeline(max_workers=config['TRANSCODE_WORKERS'],
+                                            bitrate=config['TRANSCODE_BITRATE'])
+        self.waveforms = PeaksPipeline()
+
+        # 頭像在背景縮成固定尺寸的 WebP/PNG
+        self.avatars = AvatarPipeline()
+
+        self.recognizer = RecognitionPool(engine=config['RECOGNITION_ENGINE'],
+                                          model_path=config['VOSK_MODEL_PATH'],
+                                          language=config['RECOGNITION_LANGUAGE'],
+                                          max_workers=config['RECOGNITION_WORKERS'],
+                                          max_queue=config['RECOGNITION_QUEUE'],
+                                          timeout=config['RECOGNITION_TIMEOUT'])
+
+        # 定期清理沒有參照的上傳檔；設定 GC_EXPIRE_USERS_DAYS 時也刪除過期的使用者
+        # （python compaction.py --dry-run 可先查看報告）
+        expire_days = config['GC_EXPIRE_USERS_DAYS']
+        self.compactor = Compactor(config['UPLOAD_FOLDER'], self.static_images, self.store, self.blobs,
+                                   sessions=session_backend,
+                                   cache=self.command_cache,
+                                   legacy_settings=[os.path.join(app.root_path, 'settings.json')],
+                                   extensions=RECOGNITION_EXTENSIONS | ALLOWED_IMAGE_EXTENSIONS,
+                                   grace=config['GC_GRACE_HOURS'] * 3600,
+                                   rate=config['GC_IO_RATE'],
+                                   interval=config['GC_INTERVAL_HOURS'] * 3600,
+                                   expire_after=expire_days * 86400 if expire_days else None)
+
+        # 線上取樣分析：由 /admin/profiling 開關（寫入共用的旗標檔），關閉時不做任何事
+        self.profiler = Profiler(config['PROFILING_FLAG'], config['PROFILING_FOLDER'], root=app.root_path)
+
+        # 語音指令通道在 gthread worker 中整段連線佔用一條執行緒；超過上限的連線直接拒絕，
+        # 留下執行緒給一般的 HTTP 請求（前端改用 POST /process-command）
+        limit = config['WS_MAX_CONNECTIONS']
+        self.socket_slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+        # 使用者資料夾在第一次用到時才建立，建立過的記在行程內，不必每個請求都檢查
+        self.ensure_user_folder = lru_cache(maxsize=config['USER_FOLDER_CACHE_SIZE'])(self._make_user_folder)
+
+        # 最後活動時間：使用者過期（GC_EXPIRE_USERS_DAYS）以此判斷；每位使用者每小時最多寫入一次
+        self._activity = OrderedDict()
+        self._activity_size = config['USER_FOLDER_CACHE_SIZE']
+        self._activity_lock = threading.Lock()
+
+    def _make_user_folder(self, user_folder):
+        os.makedirs(user_folder, exist_ok=True)
+        return user_folder
+
+    def record_activity(self, user_id):
+        now = time.time()
+        with self._activity_lock:
+            last = self._activity.get(user_id)
+            if last is not None and now - last < ACTIVITY_INTERVAL:
+                return
+            self._activity[user_id] = now
+            self._activity.move_to_end(user_id)
+            while len(self._activity) > self._activity_size:
+                self._activity.popitem(last=False)
+        try:
+            self.store.touch_user(user_id, now)
+        except Exception as e:
+            logger.error(f"Recording activity for {user_id} failed: {str(e)}")
+
+    # 每個 worker 第一個請求時啟動背景清理
+    def start_background_jobs(self):
+        self.compactor.start()
+
+
+def _service(name):
+    return LocalProxy(lambda: getattr(current_app.extensions['assistant'], name))
+
+
+store = _service('store')
+blobs = _service('blobs')
+command_cache = _service('command_cache')
+transcoder = _service('transcoder')
+waveforms = _service('waveforms')
+avatars = _service('avatars')
+recognizer = _service('recognizer')
+profiler = _service('profiler')
+
+
+def get_user_folder():
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+        session.permanent = True
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], session['user_id'])
+    services = current_app.extensions['assistant']
+    folder = services.ensure_user_folder(folder)
+    services.record_activity(session['user_id'])
+    return folder
+
+
+# 釋放指令或設定引用的檔案：檔案庫中的減少參照，舊版放在使用者資料夾的直接刪除
+def release_file(user_folder, name):
+    if is_blob_name(name):
+        blobs.decref(name)
+        return
+    for path in [os.path.join(user_folder, n) for n in [name] + peaks_names(name) + variant_names(name)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# 使用者的指令（原檔或播放檔）或設定（頭像）是否引用這個檔案；檔案庫的檔案只提供給引用它的使用者
+def user_references(user_id, name):
+    for cmd in command_cache.get_commands(user_id) or []:
+        if name in (cmd.get('audio'), cmd.get('playback')):
+            return True
+    return (store.get_settings(user_id) or {}).get('avatar') == name
+
+
+def allowed_audio_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_AUDIO_EXTENSIONS
+
+
+def allowed_image_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_IMAGE_EXTENSIONS
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from persistence import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# 過期的 session 每隔這麼久（秒）清除一次，在寫入 session 時順便進行
+PURGE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+"""
+
+
+# 固定的 session 金鑰：優先使用設定值，否則讀取（或第一次產生）金鑰檔
+#
+# 以 os.link 建立金鑰檔，多個行程同時啟動時只有一個能寫入，其他的讀取同一把金鑰。
+def load_secret_key(key, path):
+    if key:
+        return key
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f'{path}.{secrets.token_hex(8)}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+            logger.info(f"Generated session secret key at {path}")
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+# SQLite 儲存：每個執行緒（以及 fork 後的每個行程）各自持有連線
+class SqliteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # 回傳 (資料, 到期時間)；不存在或已過期時回傳 None
+    def load(self, sid):
+        row = self._connection().execute('SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?',
+                                         (sid, time.time())).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires):
+        self._connection().execute('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                                   (sid, json.dumps(data, ensure_ascii=False), expires))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def purge(self, now):
+        return self._connection().execute('DELETE FROM sessions WHERE expires <= ?', (now,)).rowcount
+
+    # 仍有效的 session 所屬的使用者
+    def user_ids(self, now):
+        rows = self._connection().execute('SELECT data FROM sessions WHERE expires > ?', (now,))
+        return {json.loads(row[0]).get('user_id') for row in rows} - {None}
+
+
+# 檔案儲存：每個 session 一個 JSON 檔，以 os.replace 原子性寫入
+class FileSessionStore:
+    def __init__(self, folder, fsync='always'):
+        self.folder = folder
+        self.fsync = fsync
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.folder, sid + '.json')
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if record['expires'] <= time.time():
+            return None
+        return record['data'], record['expires']
+
+    def save(self, sid, data, expires):
+        atomic_write_json(self._path(sid), {'data': data, 'expires': expires}, fsync=self.fsync)
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, now):
+        removed = 0
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    expired = json.load(f)['expires'] <= now
+            except (OSError, ValueError, KeyError):
+                continue
+            if expired:
+                self.delete(entry.name[:-len('.json')])
+                removed += 1
+        return removed
+
+    def user_ids(self, now):
+        users = set()
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if record.get('expires', 0) > now and record.get('data', {}).get('user_id'):
+                users.add(record['data']['user_id'])
+        return users
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+
+# 伺服器端 session：cookie 只存放簽章過的 session id，資料放在共用的儲存層
+#
+# 每個 worker、每次重新啟動都看到相同的 session。沒有異動的請求不寫入，
+# 剩餘效期不到一半時才延長，避免每個請求都寫一次儲存層。
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, backend):
+        self.backend = backend
+        self._last_purge = 0.0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except BadSignature:
+                sid = None
+            record = self.backend.load(sid) if sid else None
+            if record is not None:
+                return ServerSession(record[0], sid=sid, expires=record[1])
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        if not session.modified and session.expires is not None and session.expires - now > lifetime / 2:
+            return
+
+        session.expires = now + lifetime
+        self.backend.save(session.sid, dict(session), session.expires)
+        if now - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = now
+            try:
+                self.backend.purge(now)
+            except Exception as e:
+                logger.error(f"Session purge failed: {str(e)}")
+
+        response.vary.add('Cookie')
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode('ascii'),
+                            expires=self.get_expiration_time(app, session), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+# backend：sqlite、filesystem，或 cookie（Flask 預設的簽章 cookie，不需要伺服器端儲存）
+def create_session_interface(config):
+    backend = config.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'cookie':
+        return None
+    if backend == 'sqlite':
+        return ServerSessionInterface(SqliteSessionStore(config['SESSION_DATABASE']))
+    if backend == 'filesystem':
+        return ServerSessionInterface(FileSessionStore(config['SESSION_FOLDER'],
+                                                       fsync=config.get('FSYNC_MODE', 'always')))
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,83 @@
+import logging
+
+from flask import Blueprint, jsonify, request, session, url_for
+
+from media_routes import avatar_urls
+from services import get_user_folder, store
+
+logger = logging.getLogger(__name__)
+
+# 機器人名稱與頭像設定
+bp = Blueprint('settings', __name__)
+
+DEFAULT_SETTINGS = {'name': '語音助理', 'avatar': None}
+
+# 機器人名稱的長度上限
+MAX_NAME_LENGTH = 20
+
+@bp.route('/get-settings')
+def get_settings():
+    try:
+        get_user_folder()
+        settings = store.get_settings(session['user_id']) or {}
+        return jsonify({**DEFAULT_SETTINGS, **settings, 'avatar_urls': avatar_urls(settings.get('avatar'))})
+    except Exception as e:
+        logger.error(f"Get settings failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def update_name(name):
+    if not isinstance(name, str) or not name.strip():
+        return None, (jsonify({"error": "Name cannot be empty"}), 400)
+    name = name.strip()
+    if len(name) > MAX_NAME_LENGTH:
+        return None, (jsonify({"error": f"Name cannot exceed {MAX_NAME_LENGTH} characters"}), 400)
+    get_user_folder()
+    return store.update_settings(session['user_id'], name=name), None
+
+# 舊版前端的設定介面：/save-bot-settings、/update-settings 以 name 欄位改名，
+# /update-name 回傳 {"success": true, "name": ...}
+#
+# 頭像只能經由 /upload-avatar 更換（檔案庫的參照數由它維護），其他欄位忽略。
+@bp.route('/save-bot-settings', methods=['POST'])
+@bp.route('/update-settings', methods=['POST'])
+def save_bot_settings():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No settings provided"}), 400
+        if 'name' not in data:
+            get_user_folder()
+            settings = store.get_settings(session['user_id']) or {}
+        else:
+            settings, error = update_name(data['name'])
+            if error:
+                return error
+        return jsonify({**DEFAULT_SETTINGS, **settings, 'avatar_urls': avatar_urls(settings.get('avatar'))})
+    except Exception as e:
+        logger.error(f"Save settings failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/update-name', methods=['POST'])
+def update_name_route():
+    try:
+        data = request.get_json()
+        if not data or 'name' not in data:
+            return jsonify({"error": "No name provided"}), 400
+        settings, error = update_name(data['name'])
+        if error:
+            return error
+        return jsonify({"success": True, "name": settings['name']})
+    except Exception as e:
+        logger.error(f"Update name failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/get-avatar')
+def get_avatar():
+    try:
+        get_user_folder()
+        settings = store.get_settings(session['user_id']) or {}
+        return jsonify({"avatar_url": url_for('media.avatar_image'),
+                        "avatar_urls": avatar_urls(settings.get('avatar'))})
+    except Exception as e:
+        logger.error(f"Get avatar failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
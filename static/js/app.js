@@ -1,6 +1,11 @@
 // 全局變量
 let audioProcessor = null;
 
+// 超過此大小的音檔改用可續傳的分段上傳
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const UPLOAD_CHUNK_SIZE = 2 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 3;
+
 // 載入指令列表
 async function loadCommands() {
     try {
@@ -123,9 +128,8 @@ function setupEventListeners() {
                 throw new Error(data.error || '上傳失敗');
             }
 
-            // 更新頭像顯示，使用 uploads 路徑
-            const avatar = document.getElementById('avatar');
-            avatar.src = '/uploads/' + data.avatar + '?t=' + new Date().getTime();
+            // 更新頭像顯示，網址帶有新頭像的版本，不需要加時間戳
+            showAvatar(document.getElementById('avatar'), data.avatar_urls);
             showNotification('頭像更新成功', 'success');
         } catch (error) {
             console.error('上傳頭像失敗:', error);
@@ -146,20 +150,24 @@ function setupEventListeners() {
             return;
         }
 
-        const formData = new FormData();
-        formData.append('text', commandInput.value);
-        formData.append('audio', audioInput.files[0]);
-
         try {
-            const response = await fetch('/add-command', {
-                method: 'POST',
-                body: formData
-            });
+            if (audioInput.files[0].size > CHUNKED_UPLOAD_THRESHOLD) {
+                await uploadCommandChunked(commandInput.value, audioInput.files[0]);
+            } else {
+                const formData = new FormData();
+                formData.append('text', commandInput.value);
+                formData.append('audio', audioInput.files[0]);
 
-            const data = await response.json();
+                const response = await fetch('/add-command', {
+                    method: 'POST',
+                    body: formData
+                });
 
-            if (!response.ok) {
-                throw new Error(data.error || '上傳失敗');
+                const data = await response.json();
+
+                if (!response.ok) {
+                    throw new Error(data.error || '上傳失敗');
+                }
             }
 
             showNotification('指令添加成功', 'success');
@@ -188,6 +196,80 @@ function setupEventListeners() {
     }
 }
 
+// 分段上傳音檔，斷線時向伺服器查詢已收到的位置後續傳
+async function uploadCommandChunked(text, file) {
+    let response = await fetch('/upload-sessions', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const upload = await response.json();
+    if (!response.ok) {
+        throw new Error(upload.error || '上傳失敗');
+    }
+
+    const uploadUrl = '/upload-sessions/' + upload.upload_id;
+    let offset = 0;
+    let retries = 0;
+
+    while (offset < file.size) {
+        try {
+            response = await fetch(uploadUrl, {
+                method: 'PUT',
+                headers: {
+                    'Upload-Offset': String(offset),
+                },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+            const data = await response.json();
+
+            if (response.status === 409) {
+                // 位置不一致時以伺服器為準
+                offset = (await (await fetch(uploadUrl)).json()).offset;
+                continue;
+            }
+            if (!response.ok) {
+                throw Object.assign(new Error(data.error || '上傳失敗'), { fatal: true });
+            }
+
+            offset = data.offset;
+            retries = 0;
+        } catch (error) {
+            if (error.fatal || ++retries > UPLOAD_MAX_RETRIES) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * retries));
+            try {
+                offset = (await (await fetch(uploadUrl)).json()).offset;
+            } catch (statusError) {
+                console.error('查詢上傳進度失敗:', statusError);
+            }
+        }
+    }
+
+    response = await fetch(uploadUrl + '/complete', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ text: text })
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || '上傳失敗');
+    }
+    return data;
+}
+
+// 顯示伺服器縮好的頭像：一般螢幕用 128px，高解析度螢幕用 256px
+function showAvatar(avatar, urls) {
+    if (!avatar || !urls) return;
+    avatar.srcset = `${urls['128']} 1x, ${urls['256']} 2x`;
+    avatar.src = urls['128'];
+}
+
 // 載入保存的頭像
 async function loadSavedAvatar() {
     try {
@@ -195,8 +277,8 @@ async function loadSavedAvatar() {
         const data = await response.json();
         const avatar = document.getElementById('avatar');
         if (avatar) {
-            if (data.avatar) {
-                avatar.src = '/uploads/' + data.avatar + '?t=' + new Date().getTime();
+            if (data.avatar_urls) {
+                showAvatar(avatar, data.avatar_urls);
             } else {
                 avatar.src = '/static/images/default-avatar.png';
             }
@@ -273,7 +355,7 @@ async function updateCommandList() {
             
             playButton.onclick = async () => {
                 try {
-                    await window.audioProcessor.playAudioBuffer('/uploads/' + command.audio);
+                    await window.audioProcessor.playAudioBuffer('/uploads/' + (command.playback || command.audio));
                 } catch (error) {
                     console.error('播放失敗:', error);
                     showNotification('播放失敗', 'error');
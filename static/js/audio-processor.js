@@ -12,6 +12,14 @@ class AudioProcessor {
         this.isProcessingQueue = false;
         this.audioContext = null;
         this.audioCache = new Map();
+        this.peaksCache = new Map();
+        this.socket = null;
+        this.socketReady = false;
+        this.socketFailures = 0;
+        this.recognitionRound = 0;
+        this.matchedUtterance = null;
+        this.mediaStream = null;
+        this.clipDuration = 3000;
         this.initSpeechRecognition();
         this.initWaveSurfer();
     }
@@ -56,9 +64,10 @@ class AudioProcessor {
             this.recognition.continuous = true;
             this.recognition.interimResults = true;
             this.recognition.lang = 'zh-TW';
-            this.recognition.maxAlternatives = 1;
+            this.recognition.maxAlternatives = 5;
 
             this.recognition.onstart = () => {
+                this.recognitionRound++;
                 this.restartAttempts = 0;
                 this.isListening = true;
                 showNotification('開始聆聽...', 'info', 500);
@@ -78,17 +87,28 @@ class AudioProcessor {
 
             this.recognition.onresult = (event) => {
                 const result = event.results[event.results.length - 1];
+                const utterance = `${this.recognitionRound}-${event.results.length - 1}`;
                 
                 if (result.isFinal) {
+                    // 部分結果已經命中的語句不再處理
+                    if (utterance === this.matchedUtterance) return;
                     const text = result[0].transcript.trim().toLowerCase();
                     if (text && text !== this.lastProcessedText) {
                         this.lastProcessedText = text;
-                        this.addToQueue(text);
+                        // 所有候選一起送到伺服器比對，不必重新辨識
+                        const alternatives = Array.from(result, (alternative) => ({
+                            transcript: alternative.transcript.trim().toLowerCase(),
+                            confidence: alternative.confidence
+                        })).filter((alternative) => alternative.transcript);
+                        if (!this.sendSocket({ type: 'final', utterance, transcript: text, alternatives })) {
+                            this.addToQueue(text, alternatives);
+                        }
                     }
                 } else {
                     const tempText = result[0].transcript;
                     if (tempText) {
                         showNotification(tempText, 'info', 300);
+                        this.sendSocket({ type: 'partial', utterance, transcript: tempText.trim().toLowerCase() });
                     }
                 }
             };
@@ -100,12 +120,60 @@ class AudioProcessor {
             };
         } else {
             console.error('瀏覽器不支援語音識別');
-            showNotification('您的瀏覽器不支援語音識別', 'error');
+            if (!('MediaRecorder' in window)) {
+                showNotification('您的瀏覽器不支援語音識別', 'error');
+            }
+        }
+    }
+
+    // 持續連線的指令通道：部分辨識結果一命中就播放；無法連線時改回逐次 POST /process-command
+    connectSocket() {
+        if (!('WebSocket' in window) || this.socket || this.socketFailures >= 3) return;
+
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${location.host}/ws/commands`);
+        socket.onmessage = (event) => this.handleSocketMessage(JSON.parse(event.data));
+        socket.onclose = () => {
+            if (!this.socketReady) this.socketFailures++;
+            this.socket = null;
+            this.socketReady = false;
+            if (this.isListening) {
+                setTimeout(() => this.connectSocket(), 1000);
+            }
+        };
+        this.socket = socket;
+    }
+
+    disconnectSocket() {
+        if (this.socket) {
+            this.socket.close();
         }
     }
 
-    addToQueue(text) {
-        this.commandQueue.push(text);
+    sendSocket(message) {
+        if (!this.socketReady || this.socket.readyState !== WebSocket.OPEN) return false;
+        this.socket.send(JSON.stringify(message));
+        return true;
+    }
+
+    handleSocketMessage(data) {
+        switch (data.type) {
+            case 'ready':
+                this.socketReady = true;
+                this.socketFailures = 0;
+                break;
+            case 'match':
+                this.matchedUtterance = data.utterance;
+                this.playMatch(data);
+                break;
+            case 'error':
+                console.error('指令通道錯誤:', data.error);
+                break;
+        }
+    }
+
+    addToQueue(text, alternatives = []) {
+        this.commandQueue.push({ text, alternatives });
         if (!this.isProcessingQueue) {
             this.processQueue();
         }
@@ -117,8 +185,8 @@ class AudioProcessor {
         this.isProcessingQueue = true;
         
         while (this.commandQueue.length > 0) {
-            const text = this.commandQueue.shift();
-            await this.processCommand(text);
+            const { text, alternatives } = this.commandQueue.shift();
+            await this.processCommand(text, alternatives);
         }
         
         this.isProcessingQueue = false;
@@ -163,7 +231,11 @@ class AudioProcessor {
 
     async startListening() {
         if (!this.recognition) {
-            showNotification('語音識別不可用', 'error');
+            if ('MediaRecorder' in window) {
+                await this.startServerRecognition();
+            } else {
+                showNotification('語音識別不可用', 'error');
+            }
             return;
         }
 
@@ -187,6 +259,8 @@ class AudioProcessor {
             this.restartAttempts = 0;
             this.processingCommand = false;
             this.commandQueue = [];
+            this.socketFailures = 0;
+            this.connectSocket();
             
             try {
                 this.recognition.start();
@@ -206,6 +280,11 @@ class AudioProcessor {
         this.isListening = false;
         this.processingCommand = false;
         this.commandQueue = [];
+        this.disconnectSocket();
+        if (this.mediaStream) {
+            this.mediaStream.getTracks().forEach(track => track.stop());
+            this.mediaStream = null;
+        }
         if (this.recognition) {
             try {
                 this.recognition.stop();
@@ -217,6 +296,69 @@ class AudioProcessor {
         }
     }
 
+    // 瀏覽器不支援語音識別時，連續錄下短片段送到伺服器辨識
+    async startServerRecognition() {
+        try {
+            await this.initAudioContext();
+            this.mediaStream = await navigator.mediaDevices.getUserMedia({
+                audio: {
+                    echoCancellation: true,
+                    noiseSuppression: true,
+                    autoGainControl: true
+                }
+            });
+            this.isListening = true;
+            showNotification('開始聆聽...', 'info', 500);
+
+            while (this.isListening) {
+                const clip = await this.recordClip(this.clipDuration);
+                if (!this.isListening) break;
+                // 不等待辨識結果，立即錄下一段；伺服器忙碌時會回覆 503
+                this.recognizeClip(clip);
+            }
+        } catch (error) {
+            console.error('啟動失敗:', error);
+            this.handleRecognitionError(error);
+        }
+    }
+
+    recordClip(duration) {
+        return new Promise((resolve, reject) => {
+            const recorder = new MediaRecorder(this.mediaStream);
+            const chunks = [];
+            recorder.ondataavailable = (event) => chunks.push(event.data);
+            recorder.onstop = () => resolve(new Blob(chunks, { type: recorder.mimeType }));
+            recorder.onerror = (event) => reject(event.error);
+            recorder.start();
+            setTimeout(() => {
+                if (recorder.state !== 'inactive') recorder.stop();
+            }, duration);
+        });
+    }
+
+    async recognizeClip(clip) {
+        try {
+            const response = await fetch('/recognize-command', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': clip.type.split(';')[0]
+                },
+                body: clip
+            });
+            if (!response.ok) {
+                if (response.status !== 503) console.error('辨識失敗:', response.status);
+                return;
+            }
+
+            const data = await response.json();
+            if (data.match) {
+                await this.playMatch(data);
+            }
+        } catch (error) {
+            console.error('辨識失敗:', error);
+        }
+    }
+
     async preloadAudio(url) {
         if (this.audioCache.has(url)) {
             return this.audioCache.get(url);
@@ -234,7 +376,7 @@ class AudioProcessor {
         }
     }
 
-    async processCommand(text) {
+    async processCommand(text, alternatives = []) {
         if (!text || text.length < 2) return;
 
         try {
@@ -245,7 +387,7 @@ class AudioProcessor {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ command: text })
+                body: JSON.stringify({ command: text, alternatives })
             });
 
             if (!response.ok) throw new Error('處理失敗');
@@ -253,23 +395,7 @@ class AudioProcessor {
             const data = await response.json();
             
             if (data.match) {
-                showNotification(`執行: ${data.command}`, 'success', 1000);
-                
-                if (data.audio) {
-                    try {
-                        await this.initAudioContext();
-                        const audioUrl = '/uploads/' + data.audio;
-                        
-                        // 預加載音頻
-                        await this.preloadAudio(audioUrl);
-                        
-                        // 使用 WebAudio 播放
-                        await this.playAudioBuffer(audioUrl);
-                    } catch (error) {
-                        console.error('播放失敗:', error);
-                        showNotification('播放失敗', 'error');
-                    }
-                }
+                await this.playMatch(data);
             }
         } catch (error) {
             console.error('處理失敗:', error);
@@ -282,6 +408,47 @@ class AudioProcessor {
         }
     }
 
+    async playMatch(data) {
+        showNotification(`執行: ${data.command}`, 'success', 1000);
+        
+        if (data.audio) {
+            try {
+                await this.initAudioContext();
+                const audioUrl = '/uploads/' + data.audio;
+                
+                // 預加載音頻
+                await this.preloadAudio(audioUrl);
+                
+                // 使用 WebAudio 播放
+                await this.playAudioBuffer(audioUrl);
+            } catch (error) {
+                console.error('播放失敗:', error);
+                showNotification('播放失敗', 'error');
+            }
+        }
+    }
+
+    // 讀取 /peaks 的波形檔（audiowaveform .dat：20 bytes 標頭 + 16-bit 的 min/max）
+    async loadPeaks(url) {
+        if (this.peaksCache.has(url)) {
+            return this.peaksCache.get(url);
+        }
+
+        try {
+            const response = await fetch(url.replace('/uploads/', '/peaks/'));
+            if (!response.ok) return null;
+            const buffer = await response.arrayBuffer();
+            const length = new DataView(buffer, 0, 20).getUint32(16, true);
+            const values = new Int16Array(buffer, 20, length * 2);
+            const peaks = Float32Array.from(values, (value) => value / 32768);
+            this.peaksCache.set(url, peaks);
+            return peaks;
+        } catch (error) {
+            console.error('讀取波形失敗:', error);
+            return null;
+        }
+    }
+
     async playAudioBuffer(url) {
         try {
             const audioBuffer = this.audioCache.get(url);
@@ -294,8 +461,13 @@ class AudioProcessor {
             source.buffer = audioBuffer;
             source.connect(this.audioContext.destination);
 
-            // 更新波形顯示
-            await this.wavesurfer.load(url);
+            // 更新波形顯示：使用伺服器預先計算的波形，不必再下載並解碼音檔
+            const peaks = await this.loadPeaks(url);
+            if (peaks) {
+                await this.wavesurfer.load(url, [peaks], audioBuffer.duration);
+            } else {
+                await this.wavesurfer.load(url);
+            }
 
             // 同步播放
             source.start(0);
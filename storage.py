@@ -0,0 +1,415 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from persistence import atomic_write_json, folder_lock
+
+logger = logging.getLogger(__name__)
+
+COMMANDS_FILENAME = 'commands.json'
+SETTINGS_FILENAME = 'settings.json'
+
+# 使用者最後一次活動的時間（JSON 儲存放在使用者資料夾；點開頭，清理時一律保留）
+ACTIVITY_FILENAME = '.activity.json'
+
+
+# 沿用原本的檔案結構：uploads/<user_id>/commands.json 與 settings.json
+#
+# 讀取-修改-寫入在使用者資料夾的檔案鎖內進行，寫入以暫存檔 + os.replace 提交，
+# 多個 worker 同時寫入也不會互相覆蓋或讓讀者讀到寫到一半的檔案。
+class JsonStore:
+    def __init__(self, upload_folder, fsync='always'):
+        self.upload_folder = upload_folder
+        self.fsync = fsync
+
+    def _path(self, user_id, filename):
+        return os.path.join(self.upload_folder, user_id, filename)
+
+    def _read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, path, data):
+        atomic_write_json(path, data, fsync=self.fsync)
+
+    def _lock(self, user_id):
+        return folder_lock(os.path.join(self.upload_folder, user_id))
+
+    # 就緒檢查：資料夾可寫入
+    def ping(self):
+        if not os.access(self.upload_folder, os.W_OK):
+            raise OSError(f"{self.upload_folder} is not writable")
+
+    # 指令清單的版本簽章；沒有任何指令資料時回傳 None
+    def commands_signature(self, user_id):
+        try:
+            stat = os.stat(self._path(user_id, COMMANDS_FILENAME))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def get_commands(self, user_id):
+        try:
+            return self._read(self._path(user_id, COMMANDS_FILENAME))
+        except FileNotFoundError:
+            return None
+
+    def add_command(self, user_id, text, audio):
+        with self._lock(user_id):
+            commands = self.get_commands(user_id) or []
+            commands.append({'text': text, 'audio': audio})
+            self._write(self._path(user_id, COMMANDS_FILENAME), commands)
+
+    # 一次新增多筆指令，只寫入一次檔案
+    def add_commands(self, user_id, items):
+        with self._lock(user_id):
+            commands = self.get_commands(user_id) or []
+            commands.extend({'text': text, 'audio': audio} for text, audio in items)
+            self._write(self._path(user_id, COMMANDS_FILENAME), commands)
+
+    # 刪除第一個文字相同（不分大小寫）的指令，回傳被刪除的指令；指定 audio 時音檔也須相同
+    def delete_command(self, user_id, text, audio=None):
+        removed = self.delete_commands(user_id, [text], audio)
+        return removed[0] if removed else None
+
+    # 每個文字各刪除一筆相符的指令，只寫入一次檔案
+    def delete_commands(self, user_id, texts, audio=None):
+        removed = []
+        with self._lock(user_id):
+            commands = self.get_commands(user_id) or []
+            for text in texts:
+                text_lower = text.lower()
+                for index, cmd in enumerate(commands):
+                    if cmd['text'].lower() == text_lower and (audio is None or cmd['audio'] == audio):
+                        removed.append(commands.pop(index))
+                        break
+            if removed:
+                self._write(self._path(user_id, COMMANDS_FILENAME), commands)
+        return removed
+
+    # 背景轉檔完成後記錄播放用的衍生檔（只更新一筆尚未設定的指令）
+    def set_playback(self, user_id, audio, playback):
+        with self._lock(user_id):
+            commands = self.get_commands(user_id) or []
+            for cmd in commands:
+                if cmd['audio'] == audio and not cmd.get('playback'):
+                    cmd['playback'] = playback
+                    self._write(self._path(user_id, COMMANDS_FILENAME), commands)
+                    return True
+        return False
+
+    def get_settings(self, user_id):
+        try:
+            return self._read(self._path(user_id, SETTINGS_FILENAME))
+        except FileNotFoundError:
+            return None
+
+    def update_settings(self, user_id, **values):
+        with self._lock(user_id):
+            settings = self.get_settings(user_id) or {}
+            settings.update(values)
+            self._write(self._path(user_id, SETTINGS_FILENAME), settings)
+        return settings
+
+    # 有指令或設定資料的使用者
+    def user_ids(self):
+        if not os.path.isdir(self.upload_folder):
+            return []
+        return [entry.name for entry in os.scandir(self.upload_folder)
+                if entry.is_dir() and not entry.name.startswith('.')
+                and (os.path.exists(os.path.join(entry.path, COMMANDS_FILENAME))
+                     or os.path.exists(os.path.join(entry.path, SETTINGS_FILENAME)))]
+
+    # 記錄使用者最後一次活動的時間，使用者過期以此判斷
+    def touch_user(self, user_id, now):
+        os.makedirs(os.path.join(self.upload_folder, user_id), exist_ok=True)
+        self._write(self._path(user_id, ACTIVITY_FILENAME), {'last_active': now})
+
+    # {使用者: 最後活動時間}，沒有紀錄的使用者不列出
+    def activity(self):
+        result = {}
+        if not os.path.isdir(self.upload_folder):
+            return result
+        for entry in os.scandir(self.upload_folder):
+            try:
+                result[entry.name] = float(self._read(os.path.join(entry.path, ACTIVITY_FILENAME))['last_active'])
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+        return result
+
+    # 刪除使用者的指令與設定；資料夾內的其他檔案由呼叫端處理
+    def delete_user(self, user_id):
+        with self._lock(user_id):
+            for filename in (COMMANDS_FILENAME, SETTINGS_FILENAME, ACTIVITY_FILENAME):
+                try:
+                    os.remove(self._path(user_id, filename))
+                except FileNotFoundError:
+                    pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    commands_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    text_lower TEXT NOT NULL,
+    audio TEXT NOT NULL,
+    playback TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_commands_user_text ON commands (user_id, text_lower);
+CREATE TABLE IF NOT EXISTS settings (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (user_id, key)
+);
+CREATE TABLE IF NOT EXISTS activity (
+    user_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+"""
+
+# 舊資料庫缺少的欄位：(資料表, 欄位, 定義)
+COLUMNS = [
+    ('commands', 'playback', 'TEXT'),
+]
+
+
+def _command_row(row):
+    cmd = {'text': row['text'], 'audio': row['audio']}
+    if row['playback']:
+        cmd['playback'] = row['playback']
+    return cmd
+
+
+# SQLite（WAL 模式）儲存：新增與刪除都是單列操作
+#
+# 每個執行緒（以及 fork 後的每個行程）各自持有連線。
+# users.commands_version 在每次指令異動時遞增，作為快取簽章。
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        for table, column, definition in COLUMNS:
+            existing = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # 就緒檢查：資料庫可以連線與查詢
+    def ping(self):
+        self._connection().execute('SELECT 1').fetchone()
+
+    # 讀取使用 DEFERRED 交易取得一致的快照；寫入使用 IMMEDIATE 避免升級鎖時死結
+    def _read(self):
+        return _Transaction(self._connection(), 'DEFERRED')
+
+    def _write(self):
+        return _Transaction(self._connection(), 'IMMEDIATE')
+
+    def _bump_version(self, conn, user_id):
+        conn.execute(
+            'INSERT INTO users (user_id, commands_version) VALUES (?, 1) '
+            'ON CONFLICT(user_id) DO UPDATE SET commands_version = commands_version + 1',
+            (user_id,))
+
+    def commands_signature(self, user_id):
+        with self._read() as conn:
+            row = conn.execute('SELECT commands_version FROM users WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return row['commands_version'] if row else None
+
+    def get_commands(self, user_id):
+        with self._read() as conn:
+            if conn.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,)).fetchone() is None:
+                return None
+            rows = conn.execute('SELECT text, audio, playback FROM commands WHERE user_id = ? ORDER BY id',
+                                (user_id,)).fetchall()
+        return [_command_row(row) for row in rows]
+
+    def add_command(self, user_id, text, audio):
+        with self._write() as conn:
+            conn.execute('INSERT INTO commands (user_id, text, text_lower, audio) VALUES (?, ?, ?, ?)',
+                         (user_id, text, text.lower(), audio))
+            self._bump_version(conn, user_id)
+
+    def add_commands(self, user_id, items):
+        with self._write() as conn:
+            conn.executemany('INSERT INTO commands (user_id, text, text_lower, audio) VALUES (?, ?, ?, ?)',
+                             [(user_id, text, text.lower(), audio) for text, audio in items])
+            self._bump_version(conn, user_id)
+
+    def delete_command(self, user_id, text, audio=None):
+        removed = self.delete_commands(user_id, [text], audio)
+        return removed[0] if removed else None
+
+    def delete_commands(self, user_id, texts, audio=None):
+        removed = []
+        with self._write() as conn:
+            for text in texts:
+                if audio is None:
+                    row = conn.execute('SELECT id, text, audio, playback FROM commands '
+                                       'WHERE user_id = ? AND text_lower = ? ORDER BY id LIMIT 1',
+                                       (user_id, text.lower())).fetchone()
+                else:
+                    row = conn.execute('SELECT id, text, audio, playback FROM commands '
+                                       'WHERE user_id = ? AND text_lower = ? AND audio = ? ORDER BY id LIMIT 1',
+                                       (user_id, text.lower(), audio)).fetchone()
+                if row is None:
+                    continue
+                conn.execute('DELETE FROM commands WHERE id = ?', (row['id'],))
+                removed.append(_command_row(row))
+            if removed:
+                self._bump_version(conn, user_id)
+        return removed
+
+    def set_playback(self, user_id, audio, playback):
+        with self._write() as conn:
+            updated = conn.execute(
+                'UPDATE commands SET playback = ? WHERE id = ('
+                'SELECT id FROM commands WHERE user_id = ? AND audio = ? AND playback IS NULL ORDER BY id LIMIT 1)',
+                (playback, user_id, audio)).rowcount
+            if updated:
+                self._bump_version(conn, user_id)
+        return bool(updated)
+
+    def get_settings(self, user_id):
+        with self._read() as conn:
+            rows = conn.execute('SELECT key, value FROM settings WHERE user_id = ?', (user_id,)).fetchall()
+        if not rows:
+            return None
+        return {row['key']: json.loads(row['value']) for row in rows}
+
+    def update_settings(self, user_id, **values):
+        with self._write() as conn:
+            conn.executemany(
+                'INSERT INTO settings (user_id, key, value) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value',
+                [(user_id, key, json.dumps(value, ensure_ascii=False)) for key, value in values.items()])
+        return self.get_settings(user_id)
+
+    def has_user(self, user_id):
+        with self._read() as conn:
+            return (conn.execute('SELECT 1 FROM users WHERE user_id = ?', (user_id,)).fetchone() is not None
+                    or conn.execute('SELECT 1 FROM settings WHERE user_id = ? LIMIT 1',
+                                    (user_id,)).fetchone() is not None)
+
+    def user_ids(self):
+        with self._read() as conn:
+            rows = conn.execute('SELECT user_id FROM users UNION SELECT user_id FROM settings').fetchall()
+        return [row['user_id'] for row in rows]
+
+    def touch_user(self, user_id, now):
+        with self._write() as conn:
+            conn.execute('INSERT INTO activity (user_id, last_active) VALUES (?, ?) '
+                         'ON CONFLICT(user_id) DO UPDATE SET last_active = excluded.last_active',
+                         (user_id, now))
+
+    def activity(self):
+        with self._read() as conn:
+            rows = conn.execute('SELECT user_id, last_active FROM activity').fetchall()
+        return {row['user_id']: row['last_active'] for row in rows}
+
+    def delete_user(self, user_id):
+        with self._write() as conn:
+            for table in ('commands', 'settings', 'users', 'activity'):
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+
+    # 一次匯入某位使用者的完整資料（遷移用）
+    def import_user(self, user_id, commands, settings):
+        with self._write() as conn:
+            conn.executemany('INSERT INTO commands (user_id, text, text_lower, audio, playback) VALUES (?, ?, ?, ?, ?)',
+                             [(user_id, cmd['text'], cmd['text'].lower(), cmd['audio'], cmd.get('playback'))
+                              for cmd in commands])
+            self._bump_version(conn, user_id)
+            if settings:
+                conn.executemany('INSERT OR REPLACE INTO settings (user_id, key, value) VALUES (?, ?, ?)',
+                                 [(user_id, key, json.dumps(value, ensure_ascii=False))
+                                  for key, value in settings.items()])
+
+
+# 以 BEGIN 包住一組語句，離開時提交或回滾
+class _Transaction:
+    def __init__(self, conn, mode):
+        self.conn = conn
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f'BEGIN {self.mode}')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+def create_store(config):
+    backend = config.get('STORAGE_BACKEND', 'sqlite')
+    if backend == 'json':
+        return JsonStore(config['UPLOAD_FOLDER'], fsync=config.get('FSYNC_MODE', 'always'))
+    if backend == 'sqlite':
+        path = config['DATABASE']
+        is_new = not os.path.exists(path)
+        store = SqliteStore(path)
+        if is_new:
+            migrate_json_files(config['UPLOAD_FOLDER'], store)
+        return store
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+# 將 uploads/*/commands.json 與 settings.json 匯入 SQLite；已匯入的使用者會略過
+def migrate_json_files(upload_folder, store):
+    source = JsonStore(upload_folder)
+    imported = 0
+    if not os.path.isdir(upload_folder):
+        return imported
+    for user_id in sorted(os.listdir(upload_folder)):
+        if not os.path.isdir(os.path.join(upload_folder, user_id)):
+            continue
+        try:
+            commands = source.get_commands(user_id)
+            settings = source.get_settings(user_id)
+        except (OSError, ValueError) as e:
+            logger.error(f"Skipping {user_id}: {str(e)}")
+            continue
+        if commands is None and settings is None:
+            continue
+        if store.has_user(user_id):
+            continue
+        store.import_user(user_id, commands or [], settings)
+        imported += 1
+    logger.info(f"Migrated {imported} user folders from {upload_folder}")
+    return imported
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Import per-user JSON files into SQLite')
+    parser.add_argument('--upload-folder', default=os.path.join(os.getcwd(), 'uploads'))
+    parser.add_argument('--database', default=None)
+    args = parser.parse_args()
+    database = args.database or os.path.join(args.upload_folder, 'assistant.db')
+    migrate_json_files(args.upload_folder, SqliteStore(database))
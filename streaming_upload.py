@@ -0,0 +1,144 @@
+import json
+import os
+import re
+import uuid
+
+from persistence import atomic_write_json, file_lock
+
+# 每次從請求串流讀取的大小；worker 記憶體用量只與此有關，與檔案大小無關
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 16
+
+PARTIAL_FOLDER = '.partial'
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# 依檔頭（magic number）判斷音訊容器，回傳可接受的副檔名
+def sniff_audio(head):
+    if head.startswith(b'ID3'):
+        return {'mp3'}
+    if head[4:8] == b'ftyp':
+        return {'m4a', 'aac', 'alac'}
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return {'wav'}
+    if head.startswith(b'OggS'):
+        return {'ogg', 'opus'}
+    if head.startswith(b'fLaC'):
+        return {'flac'}
+    if head.startswith(b'FORM') and head[8:12] in (b'AIFF', b'AIFC'):
+        return {'aiff'}
+    if head.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return {'wma'}
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return {'webm'}  # EBML，瀏覽器 MediaRecorder 的預設格式
+    if len(head) >= 2 and head[0] == 0xFF:
+        if head[1] & 0xF6 == 0xF0:
+            return {'aac'}  # ADTS
+        if head[1] & 0xE0 == 0xE0:
+            return {'mp3'}  # MPEG 音框同步碼
+    return set()
+
+
+def check_audio_head(head, extension):
+    if extension not in sniff_audio(head):
+        raise UploadError("File content does not match audio format", 415)
+
+
+# 以固定大小的區塊把串流寫入檔案；第一個區塊先檢查檔頭，超過上限立即中止
+# 提供 hasher 時同時計算雜湊，不需要再讀一次檔案
+def copy_stream(stream, f, limit, offset=0, extension=None, hasher=None):
+    written = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return written
+        if offset + written == 0 and extension is not None:
+            # 串流可能先送來很小的區塊，湊足檔頭長度再判斷
+            while len(chunk) < SNIFF_BYTES:
+                more = stream.read(CHUNK_SIZE)
+                if not more:
+                    break
+                chunk += more
+            check_audio_head(chunk[:SNIFF_BYTES], extension)
+        written += len(chunk)
+        if offset + written > limit:
+            raise UploadError("File too large", 413)
+        if hasher is not None:
+            hasher.update(chunk)
+        f.write(chunk)
+
+
+# 可續傳的分段上傳：資料暫存在 uploads/<user_id>/.partial/<upload_id>.part
+#
+# 目前已收到的位元組數就是 .part 檔的大小，斷線後用 GET 查詢再從該位置繼續傳送。
+class UploadSessions:
+    def __init__(self, user_folder, limit):
+        self.folder = os.path.join(user_folder, PARTIAL_FOLDER)
+        self.limit = limit
+
+    def _paths(self, upload_id):
+        if not _UPLOAD_ID.match(upload_id):
+            raise UploadError("Upload not found", 404)
+        base = os.path.join(self.folder, upload_id)
+        return base + '.json', base + '.part', base + '.lock'
+
+    def create(self, filename, size, extension):
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("Invalid upload size")
+        if size > self.limit:
+            raise UploadError("File too large", 413)
+        os.makedirs(self.folder, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path, _ = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        meta = {'upload_id': upload_id, 'filename': filename, 'extension': extension, 'size': size}
+        atomic_write_json(meta_path, meta, fsync='off')
+        return dict(meta, offset=0)
+
+    def get(self, upload_id):
+        meta_path, part_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise UploadError("Upload not found", 404)
+        return meta
+
+    def append(self, upload_id, offset, stream):
+        _, part_path, lock_path = self._paths(upload_id)
+        with file_lock(lock_path):
+            meta = self.get(upload_id)
+            if offset != meta['offset']:
+                raise UploadError(f"Offset mismatch, expected {meta['offset']}", 409)
+            try:
+                with open(part_path, 'ab') as f:
+                    copy_stream(stream, f, meta['size'], offset, meta['extension'])
+            except UploadError as e:
+                # 檔頭不符的上傳直接作廢；超過宣告大小時保留已寫入的部分
+                if e.status == 415:
+                    self.discard(upload_id)
+                raise
+        return self.get(upload_id)
+
+    # 確認資料完整後回傳 .part 檔路徑，由呼叫端移到正式位置
+    def finish(self, upload_id):
+        meta = self.get(upload_id)
+        if meta['offset'] != meta['size']:
+            raise UploadError(f"Upload incomplete: {meta['offset']}/{meta['size']} bytes", 409)
+        return meta, self._paths(upload_id)[1]
+
+    def discard(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
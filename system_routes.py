@@ -0,0 +1,131 @@
+import hmac
+import logging
+
+from flask import Blueprint, Response, current_app, jsonify, render_template, request
+from werkzeug.exceptions import HTTPException
+
+import metrics
+from services import blobs, command_cache, profiler, recognizer, store, transcoder
+
+logger = logging.getLogger(__name__)
+
+# 首頁、健康檢查、指標與管理介面
+bp = Blueprint('system', __name__)
+
+# 存活檢查：只確認行程還能回應，不碰檔案系統或資料庫
+@bp.route('/health')
+def health_check():
+    return jsonify({"status": "healthy"}), 200
+
+# 就緒檢查：儲存層與檔案庫可用才回覆 200；轉檔與辨識只回報狀態，停用時仍可服務
+@bp.route('/ready')
+def readiness_check():
+    checks = {}
+    for name, ping in (('store', store.ping), ('blobs', blobs.ping)):
+        try:
+            ping()
+            checks[name] = 'ok'
+        except Exception as e:
+            logger.error(f"Readiness check {name} failed: {str(e)}")
+            checks[name] = str(e)
+    ready = all(value == 'ok' for value in checks.values())
+    checks['transcode'] = 'ok' if transcoder.enabled else 'disabled'
+    checks['recognition'] = 'ok' if recognizer.enabled else recognizer.unavailable
+    return jsonify({"status": "ready" if ready else "not ready", "checks": checks}), 200 if ready else 503
+
+@bp.route('/cache-stats')
+def cache_stats():
+    return jsonify(command_cache.stats())
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    return metrics.metrics_response()
+
+# 管理介面以 PROFILING_TOKEN 保護（Authorization: Bearer <token>）；未設定時回覆 404
+def admin_denied():
+    token = current_app.config['PROFILING_TOKEN']
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer ') or not hmac.compare_digest(header[len('Bearer '):].encode(), token.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@bp.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            if data.get('enabled', True):
+                profiler.enable(mode=data.get('mode', 'stack'), rate=data.get('rate', 0.1),
+                                routes=data.get('routes', []), duration=data.get('duration', 900))
+            else:
+                profiler.disable()
+        return jsonify({"profiling": profiler.read_flag(), "sessions": profiler.sessions()})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Profiling control failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/admin/profiles/<session_name>/<filename>')
+def admin_profile_download(session_name, filename):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        data = profiler.merged(session_name, filename)
+        if data is None:
+            return jsonify({"error": "Profile not found"}), 404
+        return Response(data, mimetype='application/octet-stream' if filename.endswith('.prof') else 'text/plain',
+                        headers={'Content-Disposition': f'attachment; filename={session_name}-{filename}'})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Profile download failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/admin/profiles/<session_name>', methods=['DELETE'])
+def admin_profile_delete(session_name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        if not profiler.delete(session_name):
+            return jsonify({"error": "Profiling session not found"}), 404
+        return jsonify({"message": "Profiling session deleted"})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Profile delete failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/')
+def index():
+    try:
+        return render_template('index.html')
+    except Exception as e:
+        logger.error(f"Index route failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# 錯誤處理（整個 app）
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    logger.error(f"404 error: {error}")
+    return jsonify({"error": "Not found"}), 404
+
+@bp.app_errorhandler(500)
+def internal_error(error):
+    logger.error(f"500 error: {error}")
+    return jsonify({"error": "Internal server error"}), 500
+
+@bp.app_errorhandler(Exception)
+def handle_exception(e):
+    if isinstance(e, HTTPException):
+        return jsonify({"error": e.name}), e.code
+    logger.error(f"Unhandled exception: {str(e)}")
+    return jsonify({"error": "Internal server error"}), 500
+
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# 每個測試一個獨立的 app：uploads、資料庫與 session 都在暫存資料夾
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('GC_INTERVAL_HOURS', '0')
+    import main
+    return main.create_app({'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'TESTING': True})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,28 @@
+import os
+
+from avatars import variant_names
+from blobstore import BlobStore
+from peaks import peaks_names
+
+
+def add(blobs, tmp_path, content, extension):
+    source = tmp_path / f'source.{extension}'
+    source.write_bytes(content)
+    return blobs.add_file(str(source), extension)
+
+
+# 相同內容、不同副檔名的檔案共用附屬檔：刪除其中一個時不能刪掉另一個的波形與頭像
+def test_shared_sidecars_are_removed_with_the_last_blob(tmp_path):
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    wav = add(blobs, tmp_path, b'same content', 'wav')
+    mp3 = add(blobs, tmp_path, b'same content', 'mp3')
+    sidecars = [os.path.join(blobs.folder(wav), name) for name in peaks_names(wav) + variant_names(wav)]
+    for path in sidecars:
+        open(path, 'wb').close()
+
+    assert blobs.decref(wav)
+    assert not os.path.exists(blobs.path(wav))
+    assert all(os.path.exists(path) for path in sidecars)
+
+    assert blobs.decref(mp3)
+    assert not any(os.path.exists(path) for path in sidecars)
@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import threading
+
+from flask import session
+
+from transcode import playback_name
+
+AUDIO = b'ID3' + b'\0' * 1024
+
+
+def add_command(client, text, audio=AUDIO, filename='clip.mp3'):
+    return client.post('/add-command', data={'text': text, 'audio': (io.BytesIO(audio), filename)})
+
+
+def test_failed_registration_releases_blob(app, client, monkeypatch):
+    services = app.extensions['assistant']
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(services.store, 'add_command', fail)
+    response = add_command(client, '開燈')
+    assert response.status_code == 500
+    assert services.blobs.entries() == {}
+    assert not any(name.endswith('.mp3') for _, _, files in os.walk(services.blobs.root) for name in files)
+
+
+def test_process_command_rejects_invalid_top_k(client):
+    assert add_command(client, '開燈').status_code == 200
+    for value in ('abc', None, [3], True):
+        response = client.post('/process-command', json={'command': '開燈', 'top_k': value})
+        assert response.status_code == 400, value
+        assert 'error' in response.get_json()
+
+
+def test_process_command_clamps_top_k(client):
+    for i, ch in enumerate('一二三四五六七八九十百千'):
+        assert add_command(client, f'開燈{ch}', audio=AUDIO + bytes([i])).status_code == 200
+    for value, expected in ((100, 9), ('2', 1), (-5, 0)):
+        response = client.post('/process-command', json={'command': '開燈吧', 'top_k': value})
+        assert response.status_code == 200
+        assert len(response.get_json()['alternatives']) == expected, value
+
+
+class FakeSocket:
+    def __init__(self, messages=()):
+        self.messages = list(messages)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def receive(self, timeout=None):
+        return self.messages.pop(0) if self.messages else None
+
+
+def test_command_socket_refuses_connections_over_the_limit(app):
+    import command_routes
+    slots = app.extensions['assistant'].socket_slots = threading.BoundedSemaphore(1)
+    with app.test_request_context('/ws/commands'):
+        session['user_id'] = 'user'
+        with slots:
+            ws = FakeSocket()
+            command_routes.command_socket(ws)
+            assert ws.sent == [{'type': 'error', 'error': 'Too many connections'}]
+
+        ws = FakeSocket([json.dumps({'type': 'ping'})])
+        command_routes.command_socket(ws)
+        assert [message['type'] for message in ws.sent] == ['ready', 'pong']
+        # 連線結束後釋放名額
+        assert slots.acquire(blocking=False)
+
+
+# 轉檔完成的回呼在另一條執行緒執行（沒有 app context），仍要記錄播放用的衍生檔
+def test_playback_is_set_after_transcode(app, client, monkeypatch):
+    services = app.extensions['assistant']
+    threads = []
+
+    def submit(folder, audio, on_done):
+        playback = playback_name(audio)
+        with open(os.path.join(folder, playback), 'wb') as f:
+            f.write(b'OggS' + b'\0' * 64)
+        thread = threading.Thread(target=on_done, args=(playback,))
+        thread.start()
+        threads.append(thread)
+
+    monkeypatch.setattr(services.transcoder, 'ffmpeg', 'ffmpeg')
+    monkeypatch.setattr(services.transcoder, 'submit', submit)
+    assert add_command(client, '開燈').status_code == 200
+    for thread in threads:
+        thread.join()
+
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    [command] = services.store.get_commands(user_id)
+    assert command['playback'] == playback_name(command['audio'])
+    assert services.blobs.refcount(command['playback']) == 1
+
+
+# 檔案庫以內容雜湊命名：其他使用者知道雜湊也不能下載別人的音檔或波形
+def test_blobs_are_only_served_to_users_that_reference_them(app, client):
+    assert add_command(client, '開燈').status_code == 200
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    [command] = app.extensions['assistant'].store.get_commands(user_id)
+    assert client.get(f"/uploads/{command['audio']}").status_code == 200
+
+    other = app.test_client()
+    assert other.get('/get-settings').status_code == 200
+    assert other.get(f"/uploads/{command['audio']}").status_code == 404
+    assert other.get(f"/peaks/{command['audio']}").status_code == 404
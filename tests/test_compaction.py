@@ -0,0 +1,77 @@
+import os
+import time
+
+from blobstore import BlobStore
+from compaction import Compactor
+from storage import SqliteStore
+
+USER = '11111111-2222-3333-4444-555555555555'
+
+
+class NoSessions:
+    def user_ids(self, now):
+        return set()
+
+
+def make_compactor(tmp_path, expire_after):
+    uploads = tmp_path / 'uploads'
+    store = SqliteStore(str(uploads / 'assistant.db'))
+    blobs = BlobStore(str(uploads / 'blobs'))
+    compactor = Compactor(str(uploads), str(tmp_path / 'images'), store, blobs, sessions=NoSessions(),
+                          rate=0, expire_after=expire_after)
+    return compactor, store
+
+
+def migrate_user(compactor, store, user_id=USER, folder=True):
+    store.import_user(user_id, [{'text': '開燈', 'audio': 'light.mp3'}], {'name': '小助理'})
+    if folder:
+        os.makedirs(os.path.join(compactor.upload_folder, user_id))
+
+
+# 預設不刪除任何使用者，即使沒有任何有效 session
+def test_user_expiry_is_off_by_default(tmp_path):
+    compactor, store = make_compactor(tmp_path, None)
+    migrate_user(compactor, store)
+    report = compactor.run()
+    assert report['expired_users'] == []
+    assert store.get_commands(USER)
+
+
+# 從舊版遷移、沒有 session 也沒有活動紀錄的使用者：第一次清理只開始計時
+def test_migrated_user_without_session_survives(tmp_path):
+    compactor, store = make_compactor(tmp_path, 1)
+    migrate_user(compactor, store)
+    report = compactor.run()
+    assert report['expired_users'] == []
+    assert store.get_commands(USER)
+    assert USER in store.activity()
+
+
+def test_inactive_user_expires(tmp_path):
+    compactor, store = make_compactor(tmp_path, 3600)
+    migrate_user(compactor, store)
+    store.touch_user(USER, time.time() - 7200)
+    assert compactor.run(dry_run=True)['expired_users'] == [USER]
+    assert store.get_commands(USER)
+
+    assert compactor.run()['expired_users'] == [USER]
+    assert store.get_commands(USER) is None
+    assert not os.path.exists(os.path.join(compactor.upload_folder, USER))
+
+
+def test_recently_active_user_and_missing_folder_survive(tmp_path):
+    compactor, store = make_compactor(tmp_path, 3600)
+    other = USER[:-1] + '6'
+    migrate_user(compactor, store)
+    migrate_user(compactor, store, other, folder=False)
+    store.touch_user(USER, time.time())
+    store.touch_user(other, time.time() - 7200)
+    assert compactor.run()['expired_users'] == []
+    assert store.get_commands(USER) and store.get_commands(other)
+
+
+def test_requests_record_activity(app, client):
+    assert client.get('/get-settings').status_code == 200
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    assert user_id in app.extensions['assistant'].store.activity()
@@ -0,0 +1,33 @@
+import random
+
+import pytest
+
+from fuzzy_matcher import VECTOR_MIN_COMMANDS, FuzzyMatcher
+
+CHARS = '播燈打開關音樂大小聲'
+
+
+def random_texts(rng, count):
+    return [''.join(rng.choice(CHARS) for _ in range(rng.randint(2, 5))) for _ in range(count)]
+
+
+# 字會重複、又有大量同分：NumPy 矩陣與倒排索引的結果要完全相同（同分依指令順序）
+def test_vector_path_matches_loop_path():
+    pytest.importorskip('numpy')
+    rng = random.Random(1)
+    commands = [{'text': text, 'audio': f'{i}.mp3'} for i, text in enumerate(random_texts(rng, 1000))]
+    vector = FuzzyMatcher(commands)
+    loop = FuzzyMatcher(commands)
+    loop._vectors = None
+    assert vector._vectors is not None
+    for query in ['播灯'] + random_texts(rng, 300):
+        for k in (1, 4):
+            assert vector.rank(query, k) == loop.rank(query, k), query
+
+
+def test_ties_are_ordered_by_command():
+    commands = [{'text': text, 'audio': f'{i}.mp3'} for i, text in
+                enumerate(['燈播燈'] * VECTOR_MIN_COMMANDS + ['播燈打'])]
+    ranked = FuzzyMatcher(commands).rank('播燈', k=2)
+    assert [index for index, _ in ranked] == [0, 1]
+    assert all(score == ranked[0][1] for _, score in ranked)
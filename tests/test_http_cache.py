@@ -0,0 +1,123 @@
+import hashlib
+import io
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from http_cache import IMMUTABLE_MAX_AGE, send_cached
+
+NAME = 'a' * 64 + '.mp3'
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / 'files').mkdir()
+    (tmp_path / 'files' / NAME).write_bytes(CONTENT)
+    (tmp_path / 'files' / 'avatar.png').write_bytes(b'png')
+    app = Flask(__name__, root_path=str(tmp_path))
+
+    @app.route('/files/<path:filename>')
+    def files(filename):
+        return send_cached('files', filename, private=True)
+
+    return app.test_client()
+
+
+def test_immutable_file_has_strong_etag_and_long_cache(client):
+    response = client.get(f'/files/{NAME}')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    expected = hashlib.sha256(f'{NAME}:{len(CONTENT)}'.encode('utf-8')).hexdigest()[:32]
+    assert response.headers['ETag'] == f'"{expected}"'
+    directives = {d.strip() for d in response.headers['Cache-Control'].split(',')}
+    assert directives == {f'max-age={IMMUTABLE_MAX_AGE}', 'private', 'immutable'}
+    assert IMMUTABLE_MAX_AGE == 31536000
+
+
+def test_mutable_file_is_revalidated(client):
+    response = client.get('/files/avatar.png')
+    directives = {d.strip() for d in response.headers['Cache-Control'].split(',')}
+    assert 'no-cache' in directives and 'immutable' not in directives
+
+
+def test_if_none_match_returns_304_without_body(client):
+    etag = client.get(f'/files/{NAME}').headers['ETag']
+    response = client.get(f'/files/{NAME}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_range_returns_206_with_content_range(client):
+    response = client.get(f'/files/{NAME}', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-99/{len(CONTENT)}'
+    assert response.data == CONTENT[:100]
+
+
+def test_unsatisfiable_range_returns_416(client):
+    response = client.get(f'/files/{NAME}', headers={'Range': f'bytes={len(CONTENT) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def directives(response):
+    return {d.strip() for d in response.headers['Cache-Control'].split(',')}
+
+
+def upload_avatar(client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 200), 'red').save(buffer, 'PNG')
+    response = client.post('/upload-avatar', data={'avatar': (io.BytesIO(buffer.getvalue()), 'avatar.png')})
+    assert response.status_code == 200
+    return response.get_json()['avatar_urls']['128']
+
+
+def test_uploads_if_modified_since_returns_304(app):
+    client = app.test_client()
+    response = client.post('/add-command', data={'text': '開燈', 'audio': (io.BytesIO(b'ID3' + b'\0' * 1024),
+                                                                         'clip.mp3')})
+    assert response.status_code == 200
+    audio = client.get('/get-commands').get_json()[0]['audio']
+    response = client.get(f'/uploads/{audio}')
+    assert response.status_code == 200
+    assert 'immutable' in directives(response)
+
+    response = client.get(f'/uploads/{audio}', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_avatar_if_modified_since_returns_304(app):
+    client = app.test_client()
+    url = upload_avatar(client)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in directives(response)
+
+    response = client.get(url, headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+# v 與目前的頭像不符（例如換過頭像）時不能長期快取，仍可用 If-Modified-Since 重新驗證
+@pytest.mark.parametrize('broken', [False, True])
+def test_avatar_with_stale_version_is_not_immutable(app, monkeypatch, broken):
+    client = app.test_client()
+    upload_avatar(client)
+    if broken:
+        # 無法產生衍生檔時回傳原圖，同樣不能長期快取
+        def fail(*args, **kwargs):
+            raise ValueError('cannot decode')
+
+        monkeypatch.setattr(app.extensions['assistant'].avatars, 'generate', fail)
+    response = client.get('/avatar?size=128&v=0000000000000000')
+    assert response.status_code == 200
+    assert 'immutable' not in directives(response)
+    assert 'no-cache' in directives(response)
+
+    response = client.get('/avatar?size=128&v=0000000000000000',
+                          headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
@@ -0,0 +1,77 @@
+import io
+import os
+import wave
+
+import pytest
+
+import peaks
+from peaks import failed_name, generate_peaks, peaks_name
+from transcode import playback_name, transcode_clip
+
+
+def make_wav():
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(bytes(range(256)) * 64)
+    return buffer.getvalue()
+
+
+def add_command(client, text, audio, filename):
+    response = client.post('/add-command', data={'text': text, 'audio': (io.BytesIO(audio), filename)})
+    assert response.status_code == 200
+    with client.session_transaction() as sess:
+        user_id = sess['user_id']
+    return user_id
+
+
+# 沒有 ffmpeg 時 WAV 的波形在背景產生，/peaks 不會在請求中解碼
+def test_wav_peaks_are_generated_in_the_background(app, client, monkeypatch):
+    services = app.extensions['assistant']
+    monkeypatch.setattr(services.transcoder, 'ffmpeg', None)
+    monkeypatch.setattr(services.waveforms, 'ffmpeg', None)
+    user_id = add_command(client, '開燈', make_wav(), 'clip.wav')
+    services.waveforms.shutdown()
+    [command] = services.store.get_commands(user_id)
+    response = client.get(f"/peaks/{command['audio']}")
+    assert response.status_code == 200
+    assert response.data[:4] == (1).to_bytes(4, 'little')
+
+
+# 沒有 ffmpeg 時無法解碼的格式直接回覆 404，不在請求中嘗試解碼
+def test_peaks_without_decoder_return_404(app, client, monkeypatch):
+    services = app.extensions['assistant']
+    monkeypatch.setattr(services.transcoder, 'ffmpeg', None)
+    monkeypatch.setattr(services.waveforms, 'ffmpeg', None)
+    monkeypatch.setattr(peaks, 'compute_peaks', lambda *args, **kwargs: 1 / 0)
+    user_id = add_command(client, '開燈', b'ID3' + b'\0' * 1024, 'clip.mp3')
+    [command] = services.store.get_commands(user_id)
+    for _ in range(2):
+        assert client.get(f"/peaks/{command['audio']}").status_code == 404
+    services.waveforms.shutdown()
+
+
+# 解碼失敗時留下標記，之後不再重試
+def test_decode_failure_is_recorded(tmp_path, monkeypatch):
+    path = tmp_path / 'clip.mp3'
+    path.write_bytes(b'not audio')
+    assert generate_peaks(str(path), '/bin/false') is False
+    assert (tmp_path / failed_name('clip.mp3')).exists()
+    assert not (tmp_path / peaks_name('clip.mp3')).exists()
+
+    calls = []
+    monkeypatch.setattr(peaks, 'compute_peaks', lambda *args, **kwargs: calls.append(args))
+    assert generate_peaks(str(path), '/bin/false') is False
+    assert calls == []
+    assert sorted(os.listdir(tmp_path)) == sorted(['clip.mp3', failed_name('clip.mp3')])
+
+
+# 波形在轉檔工作中產生；轉檔本身失敗時原檔的波形仍然寫入
+def test_transcode_job_writes_peaks(tmp_path):
+    source = tmp_path / 'clip.wav'
+    source.write_bytes(make_wav())
+    with pytest.raises(RuntimeError):
+        transcode_clip('/bin/false', str(source), str(tmp_path / playback_name('clip.wav')), '48k', 10)
+    assert (tmp_path / peaks_name('clip.wav')).exists()
@@ -0,0 +1,91 @@
+import logging
+import unicodedata
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# pypinyin 與 opencc 的字典載入約需 0.3 秒，第一次遇到中文字時才載入，不拖慢啟動
+_loaded = {}
+
+
+def _pinyin():
+    if 'pinyin' not in _loaded:
+        try:
+            from pypinyin import lazy_pinyin
+        except ImportError:
+            lazy_pinyin = None
+            logger.warning("pypinyin not installed, phonetic matching falls back to characters")
+        _loaded['pinyin'] = lazy_pinyin
+    return _loaded['pinyin']
+
+
+def _t2s():
+    if 't2s' not in _loaded:
+        try:
+            from opencc import OpenCC
+            convert = OpenCC('t2s').convert
+        except ImportError:
+            convert = None
+            logger.warning("opencc not installed, traditional/simplified folding disabled")
+        _loaded['t2s'] = convert
+    return _loaded['t2s']
+
+
+# 預先載入字典（在背景執行緒呼叫，讓第一句語音指令不必等待）
+def preload():
+    _pinyin()
+    _t2s()
+
+
+# 阿拉伯數字讀音與中文數字相同（「第1首」與「第一首」）
+_DIGIT_PINYIN = dict(zip('0123456789', ['ling', 'yi', 'er', 'san', 'si', 'wu', 'liu', 'qi', 'ba', 'jiu']))
+
+# 聲母，依長度由長到短比對
+_INITIALS = ('zh', 'ch', 'sh', 'b', 'p', 'm', 'f', 'd', 't', 'n', 'l', 'g', 'k', 'h',
+             'j', 'q', 'x', 'r', 'z', 'c', 's', 'y', 'w')
+
+# 模糊音：與輸入法的模糊音設定相同，口音與辨識最常混淆的聲母與韻母視為相同
+_FUZZY_INITIALS = {'zh': 'z', 'ch': 'c', 'sh': 's', 'n': 'l', 'r': 'l', 'f': 'h'}
+_FUZZY_FINALS = {'ang': 'an', 'eng': 'en', 'ing': 'in', 'iang': 'ian', 'uang': 'uan'}
+
+
+def _is_cjk(ch):
+    return '㐀' <= ch <= '鿿' or '豈' <= ch <= '﫿'
+
+
+@lru_cache(maxsize=65536)
+def _fold_char(ch):
+    # 全形轉半形、相容字元統一，再轉小寫與簡體
+    ch = unicodedata.normalize('NFKC', ch).lower()
+    if any(_is_cjk(c) for c in ch):
+        t2s = _t2s()
+        if t2s is not None:
+            ch = t2s(ch)
+    # 只保留文字與數字，標點、符號與空白全部去除
+    return ''.join(c for c in ch if unicodedata.category(c)[0] in 'LN')
+
+
+# 正規化語句：比對前指令文字與辨識結果都先經過這一步
+def normalize(text):
+    return ''.join(_fold_char(ch) for ch in text or '')
+
+
+@lru_cache(maxsize=65536)
+def phonetic_key(ch):
+    pinyin = _pinyin() if _is_cjk(ch) else None
+    if ch in _DIGIT_PINYIN:
+        syllable = _DIGIT_PINYIN[ch]
+    elif pinyin is not None:
+        syllable = pinyin(ch)[0]
+    else:
+        # 非中文字元以字元本身為鍵，不與任何拼音相同
+        return (ch, '')
+
+    initial = next((i for i in _INITIALS if syllable.startswith(i)), '')
+    final = syllable[len(initial):]
+    return (_FUZZY_INITIALS.get(initial, initial), _FUZZY_FINALS.get(final, final))
+
+
+# 每個字元對應一個 (聲母, 韻母)，同音字與模糊音會得到相同的鍵
+def phonetic_keys(normalized):
+    return tuple(phonetic_key(ch) for ch in normalized)
@@ -0,0 +1,113 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PLAYBACK_SUFFIX = '.play.ogg'
+
+# 去除開頭靜音後做 EBU R128 響度正規化
+AUDIO_FILTER = ('silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.05,'
+                'loudnorm=I=-16:TP=-1.5:LRA=11')
+
+
+def find_ffmpeg():
+    return os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+
+
+def playback_name(audio):
+    return os.path.splitext(audio)[0] + PLAYBACK_SUFFIX
+
+
+# 在子行程中執行：轉成固定位元率的 Opus/OGG，成功後才以 os.replace 放到正式位置
+#
+# 原檔與播放檔的波形也在這裡產生，不佔用 web worker 的執行緒；波形失敗不影響轉檔結果。
+def transcode_clip(ffmpeg, source, target, bitrate, timeout):
+    try:
+        return _transcode(ffmpeg, source, target, bitrate, timeout)
+    finally:
+        _write_peaks(ffmpeg, source, target)
+
+
+def _write_peaks(ffmpeg, *paths):
+    from peaks import generate_peaks  # peaks 匯入本模組的 find_ffmpeg
+
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                generate_peaks(path, ffmpeg)
+        except Exception as e:
+            logger.warning(f"Peaks for {os.path.basename(path)} failed: {str(e)}")
+
+
+def _transcode(ffmpeg, source, target, bitrate, timeout):
+    tmp_path = f'{target}.{uuid.uuid4().hex}.tmp'
+    cmd = [ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+           '-i', source, '-vn', '-af', AUDIO_FILTER, '-ar', '48000',
+           '-c:a', 'libopus', '-b:a', bitrate, '-f', 'ogg', tmp_path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:])
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.basename(target)
+
+
+# 背景轉檔：請求只負責排入佇列，轉檔在行程池中進行，完成後呼叫 on_done
+#
+# 沒有 ffmpeg 時停用，播放時直接使用原始檔案。
+class TranscodePipeline:
+    def __init__(self, max_workers=2, bitrate='48k', timeout=120, ffmpeg=None):
+        self.max_workers = max_workers
+        self.bitrate = bitrate
+        self.timeout = timeout
+        self.ffmpeg = ffmpeg if ffmpeg is not None else find_ffmpeg()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if not self.ffmpeg:
+            logger.warning("ffmpeg not found, audio transcoding disabled")
+
+    @property
+    def enabled(self):
+        return bool(self.ffmpeg)
+
+    def _get_executor(self):
+        # gunicorn preload 會在 master 匯入後 fork，行程池要在各 worker 內建立
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, folder, audio, on_done):
+        if not self.enabled:
+            return None
+        source = os.path.join(folder, audio)
+        target = os.path.join(folder, playback_name(audio))
+        future = self._get_executor().submit(transcode_clip, self.ffmpeg, source, target,
+                                             self.bitrate, self.timeout)
+
+        def done(f):
+            try:
+                on_done(f.result())
+            except Exception as e:
+                logger.error(f"Transcode of {audio} failed: {str(e)}")
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
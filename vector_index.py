@@ -0,0 +1,59 @@
+from collections import Counter
+
+_numpy = []
+
+
+# NumPy 載入約需 0.1 秒，指令庫大到需要矩陣計算時才載入；沒有安裝時回傳 None
+def load_numpy():
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+# 指令的拼音鍵計數矩陣：列為鍵、欄為指令，隨指令庫版本（CommandCache 的一筆快取）建立一次
+#
+# 鍵的列由指令庫建立的詞彙表決定（不會碰撞），查詢時只取出語句中出現的鍵那幾列，
+# 一次算出所有語句（N-best 候選）與所有指令的共同鍵數量。
+#
+# 沒有採用雜湊 n-gram 向量的內積（queries @ matrix.T）直接當作分數：那會改變勝出的指令與回傳的信心，
+# 而 FUZZY_THRESHOLD 與回傳給前端的 confidence 都以編輯距離定義。這裡的共同鍵數量是信心的精確上限，
+# 只用來篩選與排序候選，結果與倒排索引完全相同（benchmarks/bench_fuzzy.py 會檢查）。
+# 內積只能得到較鬆的上限（重複的字與雜湊碰撞都會多算），所以改用逐鍵取最小值再加總。
+class KeyVectors:
+    def __init__(self, sequences):
+        np = load_numpy()
+        self._vocab = {}
+        rows, columns, values = [], [], []
+        for index, keys in enumerate(sequences):
+            for key, count in Counter(keys).items():
+                rows.append(self._vocab.setdefault(key, len(self._vocab)))
+                columns.append(index)
+                values.append(min(count, 255))
+        self._matrix = np.zeros((len(self._vocab), len(sequences)), dtype=np.uint8)
+        self._matrix[rows, columns] = values
+        self.lengths = np.array([max(len(keys), 1) for keys in sequences], dtype=np.float64)
+
+    def __len__(self):
+        return self._matrix.shape[1]
+
+    # 回傳 (語句數, 指令數) 的矩陣：每個鍵取語句與指令中出現次數較少者，加總為共同鍵數量
+    #
+    # 與倒排索引的 min(語句次數, 指令次數) 相同，重複的字不會多算；所有語句以一次廣播運算完成。
+    def shared_counts(self, queries):
+        np = load_numpy()
+        rows = sorted({self._vocab[key] for keys in queries for key in keys if key in self._vocab})
+        if not rows:
+            return np.zeros((len(queries), len(self)), dtype=np.float32)
+        position = {row: i for i, row in enumerate(rows)}
+        counts = np.zeros((len(queries), len(rows)), dtype=np.uint8)
+        for i, keys in enumerate(queries):
+            for key, count in Counter(keys).items():
+                row = self._vocab.get(key)
+                if row is not None:
+                    counts[i, position[row]] = min(count, 255)
+        shared = np.minimum(counts[:, :, None], self._matrix[rows][None, :, :])
+        return shared.sum(axis=1, dtype=np.float32)